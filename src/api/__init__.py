@@ -1,5 +1,7 @@
 from flask import Flask
 
+from settings import settings
+
 
 def create_app():
     """Construct the core application."""
@@ -11,4 +13,9 @@ def create_app():
     with app.app_context():
         from . import routes
 
+        if settings.CACHE_WARMUP_ENABLED:
+            from maps.map_descriptor import square_map
+            from movie.cache_warmer import start_background_warm_up
+            start_background_warm_up(square_map)
+
         return app
\ No newline at end of file
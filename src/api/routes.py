@@ -1,9 +1,22 @@
-from flask import current_app as app, make_response, request
+import gzip
+import hashlib
+import json
+import math
+from typing import Iterator, List, Optional
+
+from flask import current_app as app, request, Response, stream_with_context, abort
 from flask import render_template
 
 from maps.map_descriptor import square_map
 from movie.page_data_cache import PageDataCache
 from movie.page_data_source import PageDataSource
+from movie.page_data_variants import get_available_encodings, VARIANT_FORMAT_BINARY, \
+    VARIANT_FORMAT_TEXT, ENCODING_IDENTITY, ENCODING_GZIP
+from movie.serializer.track_data_binary_encoder import TrackDataBinaryEncoder, \
+    BINARY_TRACK_DATA_MIMETYPE
+from movie.telemetry import telemetry
+from movie.track_grid_index import BBox
+from settings import settings
 
 
 @app.route('/')
@@ -24,15 +37,135 @@ def track_data():
     data_source = PageDataSource(
         square_map,
     )
-    data = data_source.get_track(
+    binary = _is_binary_format_requested()
+    mimetype = BINARY_TRACK_DATA_MIMETYPE if binary else "text/plain"
+
+    bbox = _get_requested_bbox(data_source)
+    if bbox:
+        chunks = data_source.iter_track_in_bbox(start_date, end_date, bbox)
+        if binary:
+            chunks = _encode_binary_chunks(chunks)
+        return Response(stream_with_context(chunks), mimetype=mimetype)
+
+    encoding = _get_accepted_encoding(get_available_encodings())
+    variant = data_source.get_cached_variant(
+        start_date, end_date,
+        VARIANT_FORMAT_BINARY if binary else VARIANT_FORMAT_TEXT,
+        encoding)
+    if variant:
+        return _make_cached_response(
+            variant.data, variant.etag, mimetype, encoding,
+            f"public, max-age={settings.TRACK_DATA_MAX_AGE_SECONDS}")
+
+    chunks = data_source.iter_track(
         start_date,
         end_date
     )
-    response = make_response(data, 200)
-    response.mimetype = "text/plain"
-    return response
+    # the data is streamed as it's serialized (chunked transfer encoding)
+    if binary:
+        return Response(
+            stream_with_context(_encode_binary_chunks(chunks)),
+            mimetype=BINARY_TRACK_DATA_MIMETYPE)
+    return Response(stream_with_context(chunks), mimetype="text/plain")
+
+
+def _make_cached_response(
+        data: bytes,
+        etag: str,
+        mimetype: str,
+        encoding: str,
+        cache_control: str) -> Response:
+    """
+    the response with the strong ETag, "304 Not Modified"
+    if the client's If-None-Match has the ETag
+    """
+    response = Response(data, mimetype=mimetype)
+    if encoding != ENCODING_IDENTITY:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    response.vary.update(["Accept", "Accept-Encoding"])
+    return response.make_conditional(request)
+
+
+def _get_accepted_encoding(encodings: List[str]) -> str:
+    """
+    the first of the encodings accepted by the client (Accept-Encoding),
+    the encodings are in the server's order of preference
+    """
+    for encoding in encodings:
+        if encoding == ENCODING_IDENTITY or request.accept_encodings[encoding]:
+            return encoding
+    return ENCODING_IDENTITY
+
+
+def _get_requested_bbox(data_source: PageDataSource) -> Optional[BBox]:
+    """
+    ?bbox=x_min,y_min,x_max,y_max (canvas coords) or
+    ?bbox_geo=lat_min,lon_min,lat_max,lon_max, "400 Bad Request" if malformed
+    """
+    if request.args.get('bbox'):
+        return _parse_bbox_arg('bbox')
+    if request.args.get('bbox_geo'):
+        return data_source.get_geo_bbox(*_parse_bbox_arg('bbox_geo'))
+    return None
+
+
+def _parse_bbox_arg(name: str) -> BBox:
+    """
+    four finite comma separated numbers, the min ones not above the max ones
+    """
+    try:
+        values = [float(v) for v in request.args[name].split(',')]
+    except ValueError:
+        abort(400, description=f"{name} must be four comma separated numbers")
+    if len(values) != 4 or not all(math.isfinite(v) for v in values):
+        abort(400, description=f"{name} must be four comma separated numbers")
+    min_1, min_2, max_1, max_2 = values
+    if min_1 > max_1 or min_2 > max_2:
+        abort(400, description=f"{name} min values must not exceed the max values")
+    return min_1, min_2, max_1, max_2
+
+
+def _encode_binary_chunks(chunks: Iterator[str]) -> Iterator[bytes]:
+    # the first chunk is the timings header
+    yield TrackDataBinaryEncoder.encode_header(next(chunks))
+    for chunk in chunks:
+        yield TrackDataBinaryEncoder.encode_tracks(chunk)
+
+
+def _is_binary_format_requested() -> bool:
+    """
+    the packed binary format is requested either as ?format=binary or with
+    the Accept header preferring it over text/plain
+    """
+    if request.args.get('format'):
+        return request.args.get('format') == 'binary'
+    best_match = request.accept_mimetypes.best_match(
+        ["text/plain", BINARY_TRACK_DATA_MIMETYPE])
+    return best_match == BINARY_TRACK_DATA_MIMETYPE
 
 
 @app.route('/cached_periods/')
 def cached_periods():
-    return PageDataCache.get_cached_intervals()
+    data = json.dumps(PageDataCache.get_cached_intervals()).encode()
+    encoding = _get_accepted_encoding([ENCODING_GZIP, ENCODING_IDENTITY])
+    if encoding == ENCODING_GZIP:
+        # mtime=0 keeps the compressed body (and so the ETag) stable
+        data = gzip.compress(data, mtime=0)
+    etag = f'"{hashlib.sha1(data).hexdigest()}"'
+    # the list changes as the data is cached, so it's always revalidated
+    return _make_cached_response(data, etag, "application/json", encoding, "no-cache")
+
+
+@app.route('/metrics')
+def metrics():
+    gauges = {f"page_cache_{k}": v for k, v in PageDataCache.get_stats().items()}
+    gauges["page_coalesced_loads"] = PageDataSource.get_coalesced_loads_count()
+    return Response(telemetry.render_prometheus(gauges),
+                    mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/cache_stats/')
+def cache_stats():
+    return PageDataCache.get_stats()
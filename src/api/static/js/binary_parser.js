@@ -0,0 +1,46 @@
+class BinaryTrackParser {
+    // decodes the zig-zag varint stream produced by TrackDataBinaryEncoder
+    constructor() {
+        this.i = 0;
+        this.bytes = null;
+    }
+
+    parseResponse(buffer) {
+        if (!buffer || !buffer.byteLength) return null;
+        this.bytes = new Uint8Array(buffer);
+        this.i = 0;
+        let data = {
+            start_time_stamp: this.readValue(),
+            end_time_stamp: this.readValue(),
+            start_time_min: this.readValue(),
+            end_time_min: this.readValue(),
+            tracks: []
+        };
+
+        while (this.i < this.bytes.length) {
+            let track = {id: this.readValue(), points: []};
+            let count = this.readValue();
+            let time = 0, x = 0, y = 0;
+            for (let j = 0; j < count; j++) {
+                time += this.readValue();
+                x += this.readValue();
+                y += this.readValue();
+                track.points.push([time, x, y]);
+            }
+            data.tracks.push(track);
+        }
+        return data;
+    }
+
+    readValue() {
+        // LEB128, the values may exceed 32 bits so no bitwise shifts here
+        let value = 0, scale = 1, byte = 0;
+        do {
+            byte = this.bytes[this.i++];
+            value += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+        // zig-zag
+        return (value % 2) ? -(value + 1) / 2 : value / 2;
+    }
+}
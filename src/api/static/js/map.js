@@ -55,7 +55,7 @@ class MapManager {
     }
 
     onPeriodSelected(start, end) {
-        let uri = `track_data?start_date=${start}&end_date=${end}`;
+        let uri = `track_data?start_date=${start}&end_date=${end}&format=binary`;
         let that = this;
 
         this.stopAnimation();
@@ -67,19 +67,19 @@ class MapManager {
         fetch(uri, {method: "GET"})
         .then(function (response) {
             that.showHideLoadingBanner(false);
-            return response.text();
+            return response.arrayBuffer();
         })
-        .then(function (json) {
-            that.prepareAnimation(json);
+        .then(function (buffer) {
+            that.prepareAnimation(buffer);
         })
         .catch(function (error) {
             console.log(error);
         });
     }
 
-    prepareAnimation(respText) {
-        let parser = new PlainTextParser();
-        let data = parser.parseResponse(respText);
+    prepareAnimation(respBuffer) {
+        let parser = new BinaryTrackParser();
+        let data = parser.parseResponse(respBuffer);
         this.tracks = data.tracks;
 
         this.timing = {
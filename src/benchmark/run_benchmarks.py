@@ -0,0 +1,259 @@
+"""
+Offline benchmarks: no DB, the tracks come from SyntheticFleet.
+
+    python -m benchmark.run_benchmarks --sizes 20x500,200x1000 --output results.json
+    python -m benchmark.run_benchmarks --baseline results.json
+
+The results are written as JSON; with --baseline the medians are compared to
+the baseline run's and the exit code is 1 if any benchmark got slower
+than the tolerance allows.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import pytz
+
+from benchmark.synthetic_fleet import SyntheticFleet
+from maps.map_descriptor import default_map, square_map
+from movie.entity.point_batch import PointBatch
+from movie.entity.visual_settings import TimerDrawingSettings
+from movie.movie_operator import MovieOperator, MovieTiming
+from movie.page_data_cache import PageDataCache
+from movie.page_data_source import PageDataSource
+from movie.render.video_encoder import VideoEncoder
+from movie.repository.memory_track_repository import MemoryTrackRepository
+from movie.repository.track_repository import LOADING_MODE_STREAM, LOADING_MODE_PARALLEL
+from movie.serializer.track_bag_json_serializer import TrackBagJsonSerializer
+from paths import OUTPUT_PATH
+
+START_TIME = datetime.datetime(2022, 10, 10, 0, 0, 0, 0, pytz.UTC)
+FRAMES_TO_SHOT = 5
+FRAMES_TO_ENCODE = 48
+
+
+class BenchmarkRunner:
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results: List[Dict[str, Any]] = []
+        self._app = None
+
+    def measure(
+            self,
+            name: str,
+            size: str,
+            function: Callable[[], Any],
+            items: int,
+            setup: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        run function repeat times (setup runs before each run, not timed),
+        items is the number of the points (frames, ...) the function processes
+        """
+        seconds, result = [], None
+        for _ in range(self.repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - started)
+        median = statistics.median(seconds)
+        self.results.append({
+            "name": name,
+            "size": size,
+            "items": items,
+            "runs": seconds,
+            "min_seconds": min(seconds),
+            "median_seconds": median,
+            "items_per_second": items / median if median else None
+        })
+        print(f"{size:>12} {name:<32} {median * 1000:10.1f} ms")
+        return result
+
+    def run_size(self, trackers: int, points_per_tracker: int):
+        size = f"{trackers}x{points_per_tracker}"
+        fleet = SyntheticFleet(trackers, points_per_tracker, START_TIME)
+        points = self.measure("generate_fleet", size, fleet.generate, trackers * points_per_tracker)
+        points_count = len(points)
+        start, end = fleet.start_time, fleet.end_time
+
+        self.measure("projection", size,
+                     lambda: square_map.geo_to_canvas_batch(points.lats, points.lons), points_count)
+        for mode in [LOADING_MODE_STREAM, LOADING_MODE_PARALLEL]:
+            repo = MemoryTrackRepository(points, loading_mode=mode)
+            track_bag = self.measure(f"load_tracks_{mode}", size,
+                                     lambda: self._load_merged(repo, start, end), points_count)
+        self.measure("serialize", size,
+                     lambda: TrackBagJsonSerializer.serialize(square_map, track_bag), points_count)
+
+        self._run_movie(size, points, start, end)
+        self._run_endpoints(size, points, start, end)
+
+    def _run_movie(self, size: str, points: PointBatch,
+                   start: datetime.datetime, end: datetime.datetime):
+        folder = tempfile.mkdtemp(prefix="benchmark_frames_")
+        try:
+            operator = MovieOperator(
+                folder,
+                default_map,
+                MovieTiming(
+                    start_time=start,
+                    end_time=end,
+                    seconds_per_frame=max(1, int((end - start).total_seconds() / FRAMES_TO_SHOT)),
+                    track_fading_seconds=60 * 60 * 4,
+                    track_cutting_seconds=60 * 60 * 10,
+                    video_framerate=24),
+                timer_drawing_settings=TimerDrawingSettings())
+            operator.track_bag = self._load_merged(
+                MemoryTrackRepository(points), start, end, default_map)
+            operator.track_bag.colorize(operator.color_map)
+            frame_times = operator._get_frame_times()
+            frame_path = os.path.join(folder, "frame.png")
+
+            def shot_frames():
+                for frame_time in frame_times:
+                    operator._shot_frame(frame_time, frame_path)
+            self.measure("shot_frames", size, shot_frames, len(frame_times))
+
+            image = operator._render_frame(frame_times[-1])
+
+            def encode_video():
+                with VideoEncoder(os.path.join(folder, "video.avi"), 24, 16) as encoder:
+                    for _ in range(FRAMES_TO_ENCODE):
+                        encoder.put(image)
+            self.measure("encode_video", size, encode_video, FRAMES_TO_ENCODE)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _run_endpoints(self, size: str, points: PointBatch,
+                       start: datetime.datetime, end: datetime.datetime):
+        client = self._get_app().test_client()
+        PageDataSource.repository_factory = lambda: MemoryTrackRepository(points)
+
+        last_day = (end - datetime.timedelta(microseconds=1)).date() + datetime.timedelta(days=1)
+        uri = f"/track_data/?start_date={start:%Y-%m-%d}&end_date={last_day:%Y-%m-%d}"
+        x_min, y_min = square_map.canvas_w * 0.4, square_map.canvas_h * 0.4
+        bbox = f"{x_min},{y_min},{x_min + square_map.canvas_w / 10},{y_min + square_map.canvas_h / 10}"
+        points_count = len(points)
+
+        def get(path: str, headers: Optional[Dict[str, str]] = None) -> bytes:
+            response = client.get(path, headers=headers or {})
+            assert response.status_code == 200, f"{path}: {response.status_code}"
+            return response.data
+
+        original_cache_folder, cache_folders = PageDataCache.cache_folder, []
+
+        def use_empty_cache():
+            cache_folders.append(tempfile.mkdtemp(prefix="benchmark_cache_"))
+            PageDataCache.use_folder(cache_folders[-1])
+
+        try:
+            self.measure("endpoint_track_data_cold", size, lambda: get(uri), points_count,
+                         setup=use_empty_cache)
+            self.measure("endpoint_track_data_cached", size, lambda: get(uri), points_count)
+            self.measure("endpoint_track_data_binary_gzip", size,
+                         lambda: get(uri + "&format=binary", {"Accept-Encoding": "gzip"}),
+                         points_count)
+            self.measure("endpoint_track_data_bbox", size, lambda: get(f"{uri}&bbox={bbox}"),
+                         points_count)
+            self.measure("endpoint_cached_periods", size, lambda: get("/cached_periods/"), 1)
+        finally:
+            PageDataSource.repository_factory = None
+            PageDataCache.use_folder(original_cache_folder)
+            for folder in cache_folders:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def _get_app(self):
+        # the routes are registered by the first create_app() only
+        if self._app is None:
+            from api import create_app
+            self._app = create_app()
+        return self._app
+
+    @classmethod
+    def _load_merged(cls, repo: MemoryTrackRepository,
+                     start: datetime.datetime, end: datetime.datetime, geo_map=square_map):
+        track_bag = repo.load_tracks(geo_map, start, end)
+        # the pending points are merged on the first access
+        _ = track_bag.points_count
+        return track_bag
+
+
+def parse_sizes(sizes_str: str) -> List[Tuple[int, int]]:
+    """
+    "20x500,200x1000" -> [(20, 500), (200, 1000)]
+    """
+    sizes = []
+    for size_str in sizes_str.split(","):
+        trackers, points = size_str.strip().split("x")
+        sizes.append((int(trackers), int(points)))
+    return sizes
+
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> bool:
+    """
+    print the median ratios to the baseline, False if any of them exceeds 1 + tolerance
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    passed = True
+    for result in results:
+        base = baseline.get((result["name"], result["size"]))
+        if not base or not base["median_seconds"]:
+            continue
+        ratio = result["median_seconds"] / base["median_seconds"]
+        regressed = ratio > 1 + tolerance
+        passed = passed and not regressed
+        print(f"{result['size']:>12} {result['name']:<32} x{ratio:6.2f}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks over a synthetic fleet")
+    parser.add_argument("--sizes", default="20x500,100x1000,300x2000",
+                        help="comma separated TRACKERSxPOINTS data sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each benchmark")
+    parser.add_argument("--output", default=None, help="results JSON file")
+    parser.add_argument("--baseline", default=None, help="results JSON file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown relative to the baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    runner = BenchmarkRunner(args.repeat)
+    for trackers, points_per_tracker in parse_sizes(args.sizes):
+        runner.run_size(trackers, points_per_tracker)
+
+    output_path = args.output or os.path.join(
+        OUTPUT_PATH, "benchmarks", f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    output_folder = os.path.dirname(os.path.abspath(output_path))
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    with open(output_path, "w") as f:
+        json.dump({
+            "created": datetime.datetime.now(pytz.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "repeat": args.repeat,
+            "results": runner.results
+        }, f, indent=2)
+    print(f"Results are written to {output_path}")
+
+    if args.baseline and not compare_with_baseline(runner.results, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import datetime
+from typing import List, Tuple
+
+import numpy as np
+
+from movie.entity.point_batch import PointBatch
+
+# (lat, lon) of the cities the synthetic trucks drive between
+EUROPEAN_CITIES: List[Tuple[float, float]] = [
+    (52.520, 13.405),   # Berlin
+    (48.857, 2.352),    # Paris
+    (40.417, -3.704),   # Madrid
+    (41.903, 12.496),   # Rome
+    (52.230, 21.012),   # Warsaw
+    (48.208, 16.373),   # Vienna
+    (52.370, 4.895),    # Amsterdam
+    (45.464, 9.190),    # Milan
+    (48.135, 11.582),   # Munich
+    (50.075, 14.438),   # Prague
+    (41.385, 2.173),    # Barcelona
+    (45.764, 4.836),    # Lyon
+    (53.551, 9.994),    # Hamburg
+    (47.498, 19.040),   # Budapest
+    (50.850, 4.352),    # Brussels
+    (41.008, 28.978),   # Istanbul
+    (44.426, 26.103),   # Bucharest
+    (38.722, -9.139),   # Lisbon
+    (55.676, 12.568),   # Copenhagen
+    (53.350, -6.260),   # Dublin
+]
+
+KM_PER_DEGREE = 111.2
+
+
+class SyntheticFleet:
+    """
+    Generates the GPS points of trackers x points_per_tracker trucks
+    driving between the European cities: the routes bend between
+    the cities, the speed and the fix interval vary, the fixes are noisy
+    and now and then a fix leaps far away (as the GPS glitches do).
+    The result is deterministic for the seed.
+    """
+    def __init__(
+            self,
+            trackers: int,
+            points_per_tracker: int,
+            start_time: datetime.datetime,
+            fix_interval_seconds: float = 60,
+            speed_kmh: float = 70,
+            leap_probability: float = 0.0005,
+            seed: int = 1):
+        self.trackers = trackers
+        self.points_per_tracker = points_per_tracker
+        self.start_time = start_time
+        self.fix_interval_seconds = fix_interval_seconds
+        self.speed_kmh = speed_kmh
+        self.leap_probability = leap_probability
+        self.seed = seed
+
+    @property
+    def end_time(self) -> datetime.datetime:
+        """
+        the time after the last point of any tracker
+        """
+        # the trackers start within the first fix interval,
+        # the fix intervals are at most 1.5 of the mean
+        seconds = self.fix_interval_seconds * (1.5 * self.points_per_tracker + 1) + 1
+        return self.start_time + datetime.timedelta(seconds=seconds)
+
+    def generate(self) -> PointBatch:
+        rng = np.random.default_rng(self.seed)
+        batches = [self._generate_tracker(rng, 1000 + i) for i in range(self.trackers)]
+        return PointBatch.concatenate(batches)
+
+    def _generate_tracker(self, rng: np.random.Generator, tracker_id: int) -> PointBatch:
+        n = self.points_per_tracker
+        interval = self.fix_interval_seconds
+        time_deltas = rng.uniform(0.5 * interval, 1.5 * interval, n)
+        time_deltas[0] = rng.uniform(0, interval)
+        times = self.start_time.timestamp() + np.cumsum(time_deltas)
+
+        # the distance driven by each fix, the truck stands still now and then
+        speeds = np.clip(rng.normal(self.speed_kmh, self.speed_kmh / 5, n), 0, None)
+        speeds[rng.random(n) < 0.05] = 0
+        distances = np.cumsum(speeds * time_deltas / 3600)
+
+        lats, lons = self._get_route(rng, distances[-1])
+        route_distances = self._get_route_distances(lats, lons)
+        point_lats = np.interp(distances, route_distances, lats)
+        point_lons = np.interp(distances, route_distances, lons)
+
+        # GPS noise (~50 m) and leaps
+        point_lats += rng.normal(0, 0.0005, n)
+        point_lons += rng.normal(0, 0.0005, n)
+        leaps = rng.random(n) < self.leap_probability
+        point_lats[leaps] += rng.uniform(-5, 5, np.count_nonzero(leaps))
+        point_lons[leaps] += rng.uniform(-5, 5, np.count_nonzero(leaps))
+
+        return PointBatch(
+            np.full(n, tracker_id, dtype=np.int64),
+            np.floor(times).astype(np.int64),
+            point_lats,
+            point_lons)
+
+    @classmethod
+    def _get_route(cls, rng: np.random.Generator, length_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        the route's waypoints: cities and the bends between them,
+        the route is at least length_km long
+        """
+        city = int(rng.integers(len(EUROPEAN_CITIES)))
+        lats, lons = [EUROPEAN_CITIES[city][0]], [EUROPEAN_CITIES[city][1]]
+        route_length = 0.0
+        while route_length <= length_km:
+            next_city = int(rng.integers(len(EUROPEAN_CITIES) - 1))
+            city = next_city if next_city < city else next_city + 1
+            target_lat, target_lon = EUROPEAN_CITIES[city]
+            # a bend halfway
+            bend_lat = (lats[-1] + target_lat) / 2 + rng.normal(0, 0.5)
+            bend_lon = (lons[-1] + target_lon) / 2 + rng.normal(0, 0.5)
+            for lat, lon in [(bend_lat, bend_lon), (target_lat, target_lon)]:
+                route_length += cls._get_distance_km(lats[-1], lons[-1], lat, lon)
+                lats.append(lat)
+                lons.append(lon)
+        return np.array(lats), np.array(lons)
+
+    @classmethod
+    def _get_route_distances(cls, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        steps = cls._get_distance_km(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        return np.concatenate([[0], np.cumsum(steps)])
+
+    @classmethod
+    def _get_distance_km(cls, lat_a, lon_a, lat_b, lon_b):
+        # equirectangular approximation, good enough for the synthetic routes
+        dx = (lon_b - lon_a) * np.cos(np.radians((lat_a + lat_b) / 2))
+        dy = lat_b - lat_a
+        return np.sqrt(dx * dx + dy * dy) * KM_PER_DEGREE
@@ -0,0 +1,43 @@
+"""Point archive export: copies the finished days of points from the DB to the local archive."""
+import argparse
+import datetime
+import logging
+
+import pytz
+
+from movie.entity.point_batch import PointBatch
+from movie.repository.engine import create_pooled_engine
+from movie.repository.point_archive import PointArchive
+from movie.repository.track_repository import TrackRepository, LOADING_MODE_STREAM
+from movie.telemetry import configure_logging
+from paths import ARCHIVE_PATH
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_date(date_str: str) -> datetime.date:
+    return datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+
+
+if __name__ == '__main__':
+    yesterday = datetime.datetime.now(pytz.utc).date() - datetime.timedelta(days=1)
+    parser = argparse.ArgumentParser(description="Archive the days of points from the DB")
+    parser.add_argument("--start", type=parse_date, required=True, help="first day to archive: 2022-10-10")
+    parser.add_argument("--end", type=parse_date, default=yesterday,
+                        help="last day to archive (yesterday by default, the days not over are skipped)")
+    parser.add_argument("--force", action="store_true", help="archive again the days already archived")
+    args = parser.parse_args()
+
+    configure_logging()
+    archive = PointArchive(settings.POINT_ARCHIVE_PATH or ARCHIVE_PATH)
+    repo = TrackRepository(create_pooled_engine(), loading_mode=LOADING_MODE_STREAM)
+    day = args.start
+    while day <= min(args.end, yesterday):
+        if args.force or not archive.has_day(day):
+            day_start = datetime.datetime.combine(day, datetime.time(), pytz.utc)
+            points = PointBatch.concatenate(
+                list(repo.iter_point_batches(day_start, day_start + datetime.timedelta(days=1))))
+            archive.write_day(day, points)
+            logger.info("Day is archived", extra={"day": day.isoformat(), "points": len(points)})
+        day += datetime.timedelta(days=1)
@@ -5,8 +5,10 @@ import pytz
 from maps.map_descriptor import default_map
 from movie.entity.visual_settings import TimerDrawingSettings
 from movie.movie_operator import MovieOperator, MovieTiming
+from movie.telemetry import configure_logging
 
 if __name__ == '__main__':
+    configure_logging()
     frames_folder = MovieOperator.create_default_frames_folder()
 
     operator = MovieOperator(
@@ -1,11 +1,17 @@
 import math
 import os
-from typing import Tuple, List
+import threading
+from typing import Tuple, List, Dict, Callable, Optional
 
 import cv2
+import numpy as np
+from numpy import ndarray
 
 from paths import IMAGES_PATH
 
+# guards the lazy decoding of the map images and the map registry
+_lock = threading.Lock()
+
 
 class GeoPivot:
     """
@@ -29,6 +35,9 @@ class MapDescriptor:
     - - map coords (canvas_x, canvas_y) in pixels
     For formulas check
     https://stackoverflow.com/questions/14329691/convert-latitude-longitude-point-to-a-pixels-x-y-on-mercator-projection
+
+    The map image is decoded on the first access to map_pic
+    (the projection doesn't need it)
     """
     def __init__(
             self,
@@ -37,7 +46,7 @@ class MapDescriptor:
             canvas_h: int,
             pivots: List[GeoPivot]):
         self.map_file_path = map_file_path
-        self.map_pic = cv2.imread(map_file_path)
+        self._map_pic: Optional[ndarray] = None
         self.canvas_w = canvas_w
         self.canvas_h = canvas_h
         self.pivots = pivots
@@ -51,18 +60,56 @@ class MapDescriptor:
         min_dim = min(canvas_w, canvas_h)
         self.leap_dist_px_square = (min_dim / 30) ** 2
 
+    @property
+    def map_pic(self) -> ndarray:
+        """
+        the map image, shared read-only by all the users: copy it to draw on it
+        """
+        if self._map_pic is None:
+            with _lock:
+                if self._map_pic is None:
+                    map_pic = cv2.imread(self.map_file_path)
+                    if map_pic is not None:
+                        map_pic.setflags(write=False)
+                    self._map_pic = map_pic
+        return self._map_pic
+
     def geo_to_canvas(self, coords: Tuple[float, float]) -> Tuple[float, float]:
         rel_x, rel_y = self._get_rel_canvas_coords(coords)
         x = rel_x * self.kx + self.left
         y = rel_y * self.ky + self.top
         return x, y
 
-    def is_leap(self, a: Tuple[int, int], b: Tuple[int, int]) -> bool:
-        # We calculate the squared distance in pixels. Two points that are separated further
-        # then this value are considered belonging to different segments
-        dx, dy = a[0] - b[0], a[1] - b[1]
-        distance = dx * dx + dy * dy
-        return distance > self.leap_dist_px_square
+    def geo_to_canvas_batch(self, lats: ndarray, lons: ndarray) -> Tuple[ndarray, ndarray]:
+        """
+        vectorized geo_to_canvas: project arrays of latitudes and longitudes
+        at once, returns (xs, ys) arrays of the canvas coordinates
+        """
+        rel_x, rel_y = self._get_rel_canvas_coords_batch(lats, lons)
+        xs = rel_x * self.kx + self.left
+        ys = rel_y * self.ky + self.top
+        return xs, ys
+
+    def leap_indices(self, points: ndarray) -> ndarray:
+        """
+        the split indices of a (n, 2) array of integer canvas coords:
+        the indices of the points that are leaps from the previous point
+        (further than leap_dist_px from it, so belonging to another segment),
+        one pass over the squared pixel distances of the adjacent points
+        """
+        if len(points) < 2:
+            return np.empty(0, dtype=np.int64)
+        deltas = np.diff(points.astype(np.int64, copy=False), axis=0)
+        distances = np.einsum("ij,ij->i", deltas, deltas)
+        return np.flatnonzero(distances > self.leap_dist_px_square) + 1
+
+    def split_leaps(self, points: ndarray) -> List[ndarray]:
+        """
+        a (n, 2) int32 array of canvas coords split at the leaps into the
+        (k, 1, 2) segments cv2.polylines takes, the segments are views of points
+        """
+        pts = np.ascontiguousarray(points, dtype=np.int32).reshape((-1, 1, 2))
+        return np.split(pts, self.leap_indices(points))
 
     @classmethod
     def _get_rel_canvas_coords(cls, coords: Tuple[float, float]) -> Tuple[float, float]:
@@ -78,6 +125,20 @@ class MapDescriptor:
         y = (h / 2) - (w * merc_n / (2 * math.pi))
         return x, y
 
+    @classmethod
+    def _get_rel_canvas_coords_batch(cls, lats: ndarray, lons: ndarray) -> Tuple[ndarray, ndarray]:
+        """
+        vectorized _get_rel_canvas_coords
+        """
+        w, h = 1.0, 1.0
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        x = (lons + 180) * (w / 360)
+        lat_rad = lats * math.pi / 180
+        merc_n = np.log(np.tan((math.pi / 4) + (lat_rad / 2)))
+        y = (h / 2) - (w * merc_n / (2 * math.pi))
+        return x, y
+
 
 def make_default_map_descriptor() -> MapDescriptor:
     london_pivot = GeoPivot(51.57733, -0.13942, 518, 386)
@@ -95,8 +156,28 @@ def make_square_map_descriptor() -> MapDescriptor:
                          1122, 976, [dublin_pivot, istanbul_pivot])
 
 
-# mapping for /src/img/map.png
-default_map = make_default_map_descriptor()
+_MAP_FACTORIES: Dict[str, Callable[[], MapDescriptor]] = {
+    # mapping for /src/img/map.png
+    "default_map": make_default_map_descriptor,
+    # mapping for /src/img/map_square.png
+    "square_map": make_square_map_descriptor,
+}
+_maps: Dict[str, MapDescriptor] = {}
+
 
-# mapping for /src/img/map_square.png
-square_map = make_square_map_descriptor()
+def get_map(name: str) -> MapDescriptor:
+    """
+    the registered map by name ("default_map", "square_map"), one instance per process
+    """
+    if name not in _maps:
+        with _lock:
+            if name not in _maps:
+                _maps[name] = _MAP_FACTORIES[name]()
+    return _maps[name]
+
+
+def __getattr__(name: str):
+    # default_map and square_map are created on the first import of them
+    if name in _MAP_FACTORIES:
+        return get_map(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,154 @@
+import datetime
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import List, Tuple, Optional
+
+import pytz
+
+from maps.map_descriptor import MapDescriptor
+from movie.page_data_cache import PageDataCache
+from movie.page_data_source import PageDataSource
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# the periods the page offers (see period_selector.js): two weeks, from Monday
+PAGE_PERIOD_WEEKS = 2
+# held by the web app's process running the background warm-up
+WARM_UP_LOCK_FILE_NAME = "warm_up.lock"
+
+
+class CacheWarmer:
+    """
+    Precomputes the page data cache entries for the latest periods
+    the page offers and for the configured ranges (CACHE_WARMUP_RANGES),
+    so the page requests for them are cache hits.
+
+    The periods that are over and cached already are skipped. The period
+    that isn't over yet is re-cached on every run (the past days
+    are read from the day shards, so it's cheap), the entries are replaced
+    atomically.
+    """
+    def __init__(
+            self,
+            geo_map: MapDescriptor,
+            periods_count: Optional[int] = None,
+            ranges: Optional[List[Tuple[datetime.datetime, datetime.datetime]]] = None):
+        self.geo_map = geo_map
+        self.periods_count = settings.CACHE_WARMUP_PERIODS if periods_count is None else periods_count
+        self.ranges = self.parse_ranges(settings.CACHE_WARMUP_RANGES) if ranges is None else ranges
+
+    def warm_up(self, now: Optional[datetime.datetime] = None) -> int:
+        """
+        cache the missing entries, returns the number of the entries cached
+        """
+        now = now or datetime.datetime.now(pytz.utc)
+        cached_count = 0
+        for start, end in self.get_periods(now):
+            if end <= now and PageDataCache.has_cached_data(start, end):
+                logger.info("Period is cached already", extra={
+                    "start": start.date().isoformat(), "end": end.date().isoformat()})
+                continue
+            started = time.monotonic()
+            PageDataSource(self.geo_map).cache_track(start, end)
+            cached_count += 1
+            logger.info("Period is cached", extra={
+                "start": start.date().isoformat(), "end": end.date().isoformat(),
+                "seconds": round(time.monotonic() - started, 1)})
+        return cached_count
+
+    def run_forever(self, interval_seconds: float, stop_event: threading.Event):
+        while not stop_event.is_set():
+            try:
+                self.warm_up()
+            except Exception:
+                logger.exception("Cache warm-up failed")
+            stop_event.wait(interval_seconds)
+
+    def get_periods(self, now: datetime.datetime) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        """
+        the latest page periods (newest first) and the configured ranges
+        """
+        return self.get_page_periods(now, self.periods_count) + \
+            [r for r in self.ranges if r[0] < now]
+
+    @classmethod
+    def get_page_periods(
+            cls,
+            now: datetime.datetime,
+            count: int) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        """
+        the same periods as PeriodSelector.get2weekPeriods() builds:
+        aligned to the even ISO weeks, the first one includes today
+        """
+        today = now.date()
+        interval_shift = (today.isocalendar()[1] + 1) % 2
+        end_date = today + datetime.timedelta(days=7 * (PAGE_PERIOD_WEEKS - interval_shift))
+        end_date -= datetime.timedelta(days=end_date.weekday())
+
+        periods = []
+        for _ in range(count):
+            start_date = end_date - datetime.timedelta(days=7 * PAGE_PERIOD_WEEKS)
+            periods.append((
+                datetime.datetime.combine(start_date, datetime.time(), pytz.utc),
+                datetime.datetime.combine(end_date, datetime.time(), pytz.utc)))
+            end_date = start_date
+        return periods
+
+    @classmethod
+    def parse_ranges(cls, ranges_str: str) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        """
+        "2022-10-10/2022-10-24,2022-10-24/2022-11-07" -> [(start, end), ...]
+        """
+        ranges = []
+        for range_str in ranges_str.split(","):
+            if not range_str.strip():
+                continue
+            start_str, end_str = range_str.strip().split("/")
+            ranges.append((
+                PageDataCache.parse_date_short_str(start_str),
+                PageDataCache.parse_date_short_str(end_str)))
+        return ranges
+
+
+def start_background_warm_up(geo_map: MapDescriptor) -> Optional[threading.Thread]:
+    """
+    run the warm-up every CACHE_WARMUP_INTERVAL_SECONDS in a daemon thread.
+    Only one of the web app's worker processes runs it: the one that takes
+    the warm-up lock file in the cache folder first (the lock is held for
+    the process' lifetime), for the rest None is returned
+    """
+    if not _take_warm_up_lock():
+        logger.info("Cache warm-up runs in another process")
+        return None
+    thread = threading.Thread(
+        target=CacheWarmer(geo_map).run_forever,
+        args=(settings.CACHE_WARMUP_INTERVAL_SECONDS, threading.Event()),
+        name="cache-warm-up",
+        daemon=True)
+    thread.start()
+    return thread
+
+
+# the open lock file of the process running the warm-up
+_warm_up_lock_file = None
+
+
+def _take_warm_up_lock() -> bool:
+    global _warm_up_lock_file
+    if _warm_up_lock_file is not None:
+        return True
+    folder = PageDataCache.cache_folder
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    lock_file = open(os.path.join(folder, WARM_UP_LOCK_FILE_NAME), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _warm_up_lock_file = lock_file
+    return True
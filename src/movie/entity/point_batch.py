@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+from typing import Sequence, Tuple, List
+
+import numpy as np
+from numpy import ndarray
+
+
+@dataclass
+class PointBatch:
+    """
+    raw (not projected) geo points stored as columns:
+    - tracker_ids: int64
+    - times: epoch seconds, int64
+    - lats, lons: float64
+    """
+    tracker_ids: ndarray
+    times: ndarray
+    lats: ndarray
+    lons: ndarray
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Tuple[int, int, float, float]]) -> 'PointBatch':
+        """
+        rows are (tracker_id, epoch_seconds, lat, lon) tuples
+        """
+        if not rows:
+            return cls.empty()
+        tracker_ids, times, lats, lons = zip(*rows)
+        return PointBatch(
+            np.array(tracker_ids, dtype=np.int64),
+            np.array(times, dtype=np.int64),
+            np.array(lats, dtype=np.float64),
+            np.array(lons, dtype=np.float64))
+
+    @classmethod
+    def empty(cls) -> 'PointBatch':
+        return PointBatch(
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64))
+
+    @classmethod
+    def concatenate(cls, batches: List['PointBatch']) -> 'PointBatch':
+        if not batches:
+            return cls.empty()
+        return PointBatch(
+            np.concatenate([b.tracker_ids for b in batches]),
+            np.concatenate([b.times for b in batches]),
+            np.concatenate([b.lats for b in batches]),
+            np.concatenate([b.lons for b in batches]))
+
+    def sorted_by_time(self) -> 'PointBatch':
+        """
+        the points ordered by the second and the ties by the tracker, the sort is
+        stable: a tracker's points of the same second keep their order
+        """
+        order = np.lexsort((self.tracker_ids, self.times))
+        return PointBatch(self.tracker_ids[order], self.times[order], self.lats[order], self.lons[order])
+
+    def split_at(self, index: int) -> Tuple['PointBatch', 'PointBatch']:
+        return (
+            PointBatch(self.tracker_ids[:index], self.times[:index], self.lats[:index], self.lons[:index]),
+            PointBatch(self.tracker_ids[index:], self.times[index:], self.lats[index:], self.lons[index:]))
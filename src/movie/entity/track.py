@@ -1,9 +1,18 @@
 import datetime
+import hashlib
+import os
+import threading
 from dataclasses import dataclass
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional
+
+import numpy as np
+import pytz
+from numpy import ndarray
 
 from movie.entity.visual_settings import TrackColorMap
 
+DEFAULT_TRACK_COLOR = (20, 20, 60)
+
 
 @dataclass
 class TrackPoint:
@@ -17,22 +26,268 @@ class TrackPoint:
 
 @dataclass
 class Track:
-    points: List[TrackPoint]
-    color: Tuple[int, int, int] = (20, 20, 60)
+    """
+    one tracker's points, stored as views over the TrackBag columns:
+    - times: epoch seconds (int64)
+    - xs, ys: canvas coords (float32)
+    """
+    times: ndarray
+    xs: ndarray
+    ys: ndarray
+    color: Tuple[int, int, int] = DEFAULT_TRACK_COLOR
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def time_index(self, track_time: float, side: str = "left") -> int:
+        """
+        index of the first point with time >= track_time (side="left") or
+        time > track_time (side="right"), binary search over the sorted times
+        """
+        return int(np.searchsorted(self.times, track_time, side=side))
+
+    def slice(self, begin: int, end: int) -> 'Track':
+        """
+        the points [begin, end) as a view
+        """
+        return Track(self.times[begin:end], self.xs[begin:end], self.ys[begin:end], self.color)
+
+    @property
+    def integer_xy_coords(self) -> ndarray:
+        """
+        (n, 2) array of the rounded canvas coords
+        """
+        xy = np.empty((len(self.times), 2), dtype=np.int32)
+        xy[:, 0] = np.rint(self.xs)
+        xy[:, 1] = np.rint(self.ys)
+        return xy
+
+    @property
+    def points(self) -> List[TrackPoint]:
+        """
+        compatibility view for the code that iterates TrackPoint-s,
+        the points are built on every call
+        """
+        return [
+            TrackPoint(
+                canvas_coords=(float(x), float(y)),
+                track_time=datetime.datetime.fromtimestamp(int(t), pytz.utc))
+            for t, x, y in zip(self.times, self.xs, self.ys)]
 
 
 class TrackBag:
+    """
+    Columnar track store: points of all the trackers are kept in
+    contiguous arrays grouped by tracker (trackers ordered by their first
+    appearance, points of a tracker ordered by time):
+    - tracker_ids: int64
+    - times: epoch seconds, int64
+    - xs, ys: canvas coords, float32
+    offsets maps tracker id to the (begin, end) range of its points.
+
+    New points are buffered and merged into the columns on the
+    first access to the columns or the tracks. Only the buffered points
+    are sorted by the merge, they are spliced into the sorted columns,
+    so adding points to a bag that was read doesn't sort it all again.
+    """
     def __init__(self):
-        self.track_by_id: Dict[int, Track] = {}
+        self._tracker_ids = np.empty(0, dtype=np.int64)
+        self._times = np.empty(0, dtype=np.int64)
+        self._xs = np.empty(0, dtype=np.float32)
+        self._ys = np.empty(0, dtype=np.float32)
+        self._offsets: Dict[int, Tuple[int, int]] = {}
+        self._track_by_id: Dict[int, Track] = {}
+
+        self._pending_chunks: List[Tuple[ndarray, ndarray, ndarray, ndarray]] = []
+        self._pending_points: List[Tuple[int, int, float, float]] = []
+        self._color_map: Optional[TrackColorMap] = None
 
     def add_point(self, point: TrackPoint, track_id: int):
-        track = self.track_by_id.get(track_id)
-        if track:
-            track.points.append(point)
+        self._pending_points.append((
+            track_id,
+            int(point.track_time.timestamp()),
+            point.canvas_coords[0],
+            point.canvas_coords[1]))
+
+    def add_points(
+            self,
+            tracker_ids: ndarray,
+            times: ndarray,
+            xs: ndarray,
+            ys: ndarray):
+        """
+        add a batch of points, times are epoch seconds
+        """
+        if not len(tracker_ids):
             return
-        track = Track([point])
-        self.track_by_id[track_id] = track
+        self._pending_chunks.append((
+            np.asarray(tracker_ids, dtype=np.int64),
+            np.asarray(times, dtype=np.int64),
+            np.asarray(xs, dtype=np.float32),
+            np.asarray(ys, dtype=np.float32)))
 
     def colorize(self, color_map: TrackColorMap):
-        for id, track in self.track_by_id.items():
+        self._color_map = color_map
+        for id, track in self._track_by_id.items():
             track.color = color_map.get_color(id)
+
+    @property
+    def track_by_id(self) -> Dict[int, Track]:
+        self._merge_pending()
+        return self._track_by_id
+
+    @property
+    def offsets(self) -> Dict[int, Tuple[int, int]]:
+        self._merge_pending()
+        return self._offsets
+
+    @property
+    def tracker_ids(self) -> ndarray:
+        self._merge_pending()
+        return self._tracker_ids
+
+    @property
+    def times(self) -> ndarray:
+        self._merge_pending()
+        return self._times
+
+    @property
+    def xs(self) -> ndarray:
+        self._merge_pending()
+        return self._xs
+
+    @property
+    def ys(self) -> ndarray:
+        self._merge_pending()
+        return self._ys
+
+    @property
+    def points_count(self) -> int:
+        self._merge_pending()
+        return len(self._times)
+
+    def select_time_range(self, start: float, end: float) -> 'TrackBag':
+        """
+        a new bag with the points start <= time < end (epoch seconds),
+        the points are added ordered by time and tracker id (as the
+        repositories return them) - as if the bag was loaded
+        for this time range only
+        """
+        self._merge_pending()
+        selected = np.flatnonzero((self._times >= start) & (self._times < end))
+        # the sort is stable: a tracker's points of the same second keep their order
+        selected = selected[np.lexsort((self._tracker_ids[selected], self._times[selected]))]
+        bag = TrackBag()
+        bag.add_points(self._tracker_ids[selected], self._times[selected],
+                       self._xs[selected], self._ys[selected])
+        return bag
+
+    def extend(self, track_bag: 'TrackBag'):
+        """
+        append the other bag's points (keeping the other bag's order)
+        """
+        self.add_points(track_bag.tracker_ids, track_bag.times, track_bag.xs, track_bag.ys)
+
+    def content_hash(self) -> str:
+        """
+        hash of the points, tells whether two bags hold the same data
+        """
+        self._merge_pending()
+        digest = hashlib.sha1()
+        for column in (self._tracker_ids, self._times, self._xs, self._ys):
+            digest.update(np.ascontiguousarray(column).tobytes())
+        return digest.hexdigest()
+
+    def save(self, file_path: str):
+        """
+        save the columns as .npz (the file is written atomically)
+        """
+        self._merge_pending()
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(f, tracker_ids=self._tracker_ids, times=self._times,
+                     xs=self._xs, ys=self._ys)
+        os.replace(temp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'TrackBag':
+        bag = TrackBag()
+        with np.load(file_path) as data:
+            bag.add_points(data["tracker_ids"], data["times"], data["xs"], data["ys"])
+        return bag
+
+    def _merge_pending(self):
+        if self._pending_points:
+            ids, times, xs, ys = zip(*self._pending_points)
+            self._pending_points = []
+            self.add_points(np.array(ids), np.array(times), np.array(xs), np.array(ys))
+        if not self._pending_chunks:
+            return
+
+        chunks = self._pending_chunks
+        self._pending_chunks = []
+        tracker_ids = np.concatenate([c[0] for c in chunks])
+        times = np.concatenate([c[1] for c in chunks])
+        xs = np.concatenate([c[2] for c in chunks])
+        ys = np.concatenate([c[3] for c in chunks])
+
+        # the trackers' ranks: the merged trackers keep theirs, the new ones follow
+        # in their first appearance order (for the points of the repositories, ordered
+        # by the second and the tracker, it's the order of the first second and the tracker id)
+        known_ids = np.fromiter(self._offsets.keys(), dtype=np.int64, count=len(self._offsets))
+        unique_ids, first_index, inverse = np.unique(
+            tracker_ids, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        is_known = np.isin(unique_ids, known_ids)
+        rank = np.empty(len(unique_ids), dtype=np.int64)
+        if is_known.any():
+            sorter = np.argsort(known_ids)
+            rank[is_known] = sorter[np.searchsorted(known_ids, unique_ids[is_known], sorter=sorter)]
+        new_ids = np.flatnonzero(~is_known)
+        rank[new_ids[np.argsort(first_index[new_ids])]] = np.arange(len(new_ids)) + len(known_ids)
+
+        # group the new points by tracker rank, sort each tracker's points by time
+        # (the sort is stable)
+        point_ranks = rank[inverse]
+        order = np.lexsort((times, point_ranks))
+        tracker_ids, times, xs, ys = tracker_ids[order], times[order], xs[order], ys[order]
+        if not len(self._times):
+            self._tracker_ids, self._times, self._xs, self._ys = tracker_ids, times, xs, ys
+            self._build_tracks()
+            return
+
+        # splice the sorted new points into the sorted columns: after the merged
+        # points of the same tracker and time, as the stable sort would
+        merged_ranks = np.repeat(
+            np.arange(len(known_ids), dtype=np.int64),
+            [end - begin for begin, end in self._offsets.values()])
+        min_time = min(int(self._times.min()), int(times.min()))
+        merged_keys = (merged_ranks << 32) + (self._times - min_time)
+        new_keys = (point_ranks[order] << 32) + (times - min_time)
+        new_positions = np.searchsorted(merged_keys, new_keys, side="right") + np.arange(len(new_keys))
+        is_new = np.zeros(len(merged_keys) + len(new_keys), dtype=bool)
+        is_new[new_positions] = True
+        for name, new_column in [("_tracker_ids", tracker_ids), ("_times", times), ("_xs", xs), ("_ys", ys)]:
+            merged_column = getattr(self, name)
+            column = np.empty(len(is_new), dtype=merged_column.dtype)
+            column[is_new] = new_column
+            column[~is_new] = merged_column
+            setattr(self, name, column)
+        self._build_tracks()
+
+    def _build_tracks(self):
+        self._offsets, self._track_by_id = {}, {}
+        if not len(self._tracker_ids):
+            return
+        starts = np.flatnonzero(np.diff(self._tracker_ids)) + 1
+        starts = np.concatenate([[0], starts])
+        ends = np.concatenate([starts[1:], [len(self._tracker_ids)]])
+        for begin, end in zip(starts.tolist(), ends.tolist()):
+            track_id = int(self._tracker_ids[begin])
+            self._offsets[track_id] = (begin, end)
+            color = self._color_map.get_color(track_id) if self._color_map else DEFAULT_TRACK_COLOR
+            self._track_by_id[track_id] = Track(
+                self._times[begin:end],
+                self._xs[begin:end],
+                self._ys[begin:end],
+                color)
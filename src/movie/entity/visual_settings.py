@@ -15,6 +15,58 @@ class DrawingSettings:
     head_thickness: float = 1
 
 
+@dataclass
+class RenderSettings:
+    # keep decaying overlay layers between the frames and draw only the
+    # new segments on each frame, see AccumulatingRenderer for the tolerance
+    incremental: bool = False
+    # the incremental mode's path weight left at the end of the fading (cutting)
+    # window, the paths are cleared when their weight falls below it
+    incremental_cutoff: float = 0.1
+    # make the paths' opacity proportional to their weights (smooth fading)
+    incremental_fade: bool = False
+
+    # draw the tracks of a frame with one OpenCV call per (color, thickness)
+    # instead of calls per track, see BatchedTrackDrawer for the tolerance
+    batched_drawing: bool = False
+
+    # render the frames in that many forked processes
+    workers: int = 1
+    # frames rendered by one task, by default the frames are split
+    # evenly between the workers; in the pipeline mode the tasks are
+    # encoder_queue_size / workers frames long and dealt to the workers
+    # in turn, a worker's incremental renderer replays the frames between
+    # its tasks (at most the visible window, see AccumulatingRenderer)
+    frames_per_task: Optional[int] = None
+
+    # stream the rendered frames into the video encoder through a queue
+    # instead of saving PNG frames and reading them back
+    pipeline: bool = True
+    # frames waiting in the encoder's queue (and, with the workers, rendered
+    # frames waiting for it)
+    encoder_queue_size: int = 16
+    # also save the frames as PNG files in the pipeline mode (for debugging)
+    write_frame_files: bool = False
+
+    # checkpoint the loaded tracks and keep the rendered frames in a
+    # content-addressed cache in the frames folder: a re-run with the same
+    # inputs (e.g. after a crash) skips the DB and the frames already rendered
+    resumable: bool = False
+
+    # load the points as the frames advance and keep only the visible window
+    # in memory (see SlidingTrackWindow) instead of loading the whole movie's
+    # tracks up front; the points are read by chunks of streaming_chunk_seconds.
+    # The tracks aren't simplified (simplify_tolerance_px must be None) and,
+    # with resumable, not checkpointed
+    streaming: bool = False
+    streaming_chunk_seconds: int = 60 * 60
+
+    # drop the points that don't change the tracks as drawn (within that many
+    # pixels from the simplified line, see TrackSimplifier), None (the default)
+    # keeps all the points
+    simplify_tolerance_px: Optional[float] = None
+
+
 def format_time_minutes(tm: datetime.datetime) -> str:
     return f"{tm:%Y/%m/%d/} {tm:%H:%M}"
 
@@ -1,20 +1,31 @@
 import datetime
+import logging
 import os
 from dataclasses import dataclass
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Union, Iterator
 
 import cv2
-import sqlalchemy
 import numpy as np
 from numpy import ndarray
 
 from maps.map_descriptor import MapDescriptor
 from movie.entity.track import TrackBag, Track
 from movie.entity.visual_settings import TrackColorMap, DEFAULT_COLOR_MAP, \
-    DrawingSettings, TimerDrawingSettings
+    DrawingSettings, TimerDrawingSettings, RenderSettings
+from movie.render.accumulating_renderer import AccumulatingRenderer
+from movie.render.batched_track_drawer import BatchedTrackDrawer
+from movie.render.frame_cache import FrameCache
+from movie.render.parallel_frames import shot_frames_parallel, iter_frames_parallel
+from movie.render.video_encoder import VideoEncoder
+from movie.repository.archive_track_repository import create_track_repository
+from movie.repository.engine import create_pooled_engine
 from movie.repository.track_repository import TrackRepository
+from movie.sliding_track_window import SlidingTrackWindow
+from movie.telemetry import telemetry, TelemetryRecord
+from movie.track_simplifier import TrackSimplifier
 from paths import OUTPUT_PATH
-from settings import settings
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -31,6 +42,14 @@ class MovieTiming:
         fc = (self.end_time - self.start_time).total_seconds() / self.seconds_per_frame
         return int(round(fc))
 
+    @property
+    def track_visible_seconds(self) -> int:
+        """
+        how long a point stays on the frames: the body is drawn for
+        track_fading_seconds, the tail for track_cutting_seconds
+        """
+        return max(self.track_fading_seconds, self.track_cutting_seconds)
+
 
 class MovieOperator:
     def __init__(
@@ -40,46 +59,253 @@ class MovieOperator:
             movie_timing: MovieTiming,
             color_map: Optional[TrackColorMap] = None,
             drawing_settings: Optional[DrawingSettings] = None,
-            timer_drawing_settings: Optional[TimerDrawingSettings] = None):
+            timer_drawing_settings: Optional[TimerDrawingSettings] = None,
+            render_settings: Optional[RenderSettings] = None):
         self.frames_folder = frames_folder
         self.geo_map = geo_map
         self.movie_timing = movie_timing
         self.color_map = color_map or DEFAULT_COLOR_MAP
         self.drawing_settings = drawing_settings or DrawingSettings()
         self.timer_drawing_settings = timer_drawing_settings
+        self.render_settings = render_settings or RenderSettings()
         self.track_bag = TrackBag()
+        self.frame_cache: Optional[FrameCache] = None
+        self.track_drawer: Optional[BatchedTrackDrawer] = None
+        # the trackers in their first appearance order, read for the streaming windows
+        self.tracker_order: Optional[ndarray] = None
 
     def shot(self):
-        engine = sqlalchemy.create_engine(settings.db_uri)
-        repo = TrackRepository(engine)
-        self.track_bag = repo.load_tracks(
+        if self.render_settings.streaming and self.render_settings.simplify_tolerance_px is not None:
+            raise ValueError("The streamed tracks aren't simplified, set simplify_tolerance_px to None")
+        with telemetry.record() as record:
+            with telemetry.stage("movie.shot"):
+                if self.render_settings.streaming:
+                    # the frames load their points through the SlidingTrackWindow,
+                    # the trackers' order is read before the workers are forked
+                    self.track_bag = TrackBag()
+                    self.tracker_order = self._read_tracker_order()
+                else:
+                    self._prepare_track_bag()
+                self.frame_cache = FrameCache(
+                    os.path.join(self.frames_folder, "frame_cache"), self) \
+                    if self.render_settings.resumable else None
+                if self.render_settings.pipeline:
+                    self._shot_video()
+                else:
+                    self._shot_all_frames()
+                    logger.info("Rendering video")
+                    self._render_video()
+        self._write_timing_summary(record)
+        telemetry.dump_profiles()
+        logger.info("Video's ready", extra={"folder": self.frames_folder})
+
+    def _prepare_track_bag(self):
+        with telemetry.stage("movie.load_tracks"):
+            if self.render_settings.resumable:
+                self.track_bag = self._load_tracks_checkpointed()
+            else:
+                self.track_bag = self._load_tracks()
+        if self.render_settings.simplify_tolerance_px is not None:
+            simplifier = TrackSimplifier(self.geo_map, self.render_settings.simplify_tolerance_px)
+            with telemetry.stage("movie.simplify"):
+                self.track_bag, _ = simplifier.simplify(self.track_bag)
+        self.track_bag.colorize(self.color_map)
+
+    def _write_timing_summary(self, record: TelemetryRecord):
+        """
+        the run's stage timings and counters, as JSON in the frames folder
+        """
+        file_path = os.path.join(self.frames_folder, "timing_summary.json")
+        record.write_summary(file_path)
+        for name, stage in sorted(record.get_summary()["stages"].items()):
+            logger.info("Stage timing", extra={
+                "stage": name, "count": stage["count"], "seconds": round(stage["seconds"], 3)})
+        logger.info("Timing summary is written", extra={"path": file_path})
+
+    def _create_repository(self) -> TrackRepository:
+        return create_track_repository(create_pooled_engine())
+
+    def _read_tracker_order(self) -> ndarray:
+        with telemetry.stage("movie.window_ranks"):
+            tracker_ids, _ = self._create_repository().get_tracker_first_times(
+                self.movie_timing.start_time, self.movie_timing.end_time)
+        return tracker_ids
+
+    def _create_track_window(self, first_frame_time: datetime.datetime) -> SlidingTrackWindow:
+        """
+        the window of the points drawn on the frames from first_frame_time on
+        """
+        if self.tracker_order is None:
+            self.tracker_order = self._read_tracker_order()
+        timing = self.movie_timing
+        # the incremental renderer replays the frames a bit beyond the visible window
+        window_seconds = timing.track_visible_seconds + 2 * timing.seconds_per_frame
+        return SlidingTrackWindow(
+            self._create_repository(),
+            self.geo_map,
+            self.color_map,
+            timing.start_time,
+            timing.end_time,
+            window_seconds,
+            max(self.render_settings.streaming_chunk_seconds, timing.seconds_per_frame),
+            self.tracker_order)
+
+    def _load_tracks(self) -> TrackBag:
+        repo = self._create_repository()
+        return repo.load_tracks(
             self.geo_map,
             self.movie_timing.start_time,
             self.movie_timing.end_time
         )
-        self.track_bag.colorize(self.color_map)
-        self._shot_all_frames()
-        print("Rendering video...")
-        self._render_video()
-        print(f"Video's ready in the {self.frames_folder} folder")
 
-    def _shot_all_frames(self):
-        frame_num, frames_total = 1, self.movie_timing.frames_count
+    def _load_tracks_checkpointed(self) -> TrackBag:
+        """
+        the loaded tracks are saved to the frames folder,
+        re-running the same movie reads them back instead of querying the DB
+        """
         start, end = self.movie_timing.start_time, self.movie_timing.end_time
+        map_name, _ = os.path.splitext(os.path.basename(self.geo_map.map_file_path))
+        file_path = os.path.join(
+            self.frames_folder,
+            f"tracks_{map_name}_{start:%Y%m%d%H%M%S}-{end:%Y%m%d%H%M%S}.npz")
+        if os.path.isfile(file_path):
+            logger.info("Reading tracks", extra={"path": file_path})
+            return TrackBag.load(file_path)
+        track_bag = self._load_tracks()
+        track_bag.save(file_path)
+        return track_bag
+
+    def _shot_video(self):
+        """
+        render the frames and stream them straight into the video encoder
+        """
+        frame_times = self._get_frame_times()
+        sets = self.render_settings
+        video_path = os.path.join(self.frames_folder, 'video.avi')
+
+        with VideoEncoder(video_path, self.movie_timing.video_framerate,
+                          sets.encoder_queue_size) as encoder:
+            for i, image in self._iter_frames(frame_times):
+                if sets.write_frame_files:
+                    with telemetry.stage("movie.write_png"):
+                        cv2.imwrite(self._get_frame_path(i + 1), image)
+                encoder.put(image)
+
+    def _iter_frames(
+            self,
+            frame_times: List[datetime.datetime]) -> Iterator[Tuple[int, ndarray]]:
+        """
+        (frame index, image) pairs in the frames' order
+        """
+        sets = self.render_settings
+        if sets.workers > 1:
+            return iter_frames_parallel(
+                self, frame_times, sets.workers, self._get_frames_per_task(),
+                sets.encoder_queue_size)
+        return self._iter_frame_range(frame_times, 0, len(frame_times))
 
+    def _get_frames_per_task(self) -> int:
+        """
+        the pipeline mode's task length: a worker renders its task ahead
+        into its share of the encoder queue while the other workers' frames
+        are encoded
+        """
+        sets = self.render_settings
+        return sets.frames_per_task or max(1, sets.encoder_queue_size // sets.workers)
+
+    def _shot_all_frames(self):
+        frame_times = self._get_frame_times()
+        workers = self.render_settings.workers
+        if workers > 1:
+            shot_frames_parallel(
+                self, frame_times, workers, self.render_settings.frames_per_task)
+            return
+        self._shot_frame_range(frame_times, 0, len(frame_times))
+
+    def _shot_frame_range(
+            self,
+            frame_times: List[datetime.datetime],
+            begin: int,
+            end: int):
+        """
+        render and save the frames [begin, end) of frame_times
+        """
+        for i, image in self._iter_frame_range(frame_times, begin, end):
+            with telemetry.stage("movie.write_png"):
+                cv2.imwrite(self._get_frame_path(i + 1), image)
+
+    def _iter_frame_ranges(
+            self,
+            frame_times: List[datetime.datetime],
+            frame_ranges: List[Tuple[int, int]]) -> Iterator[Tuple[int, ndarray]]:
+        """
+        render the frames of the [begin, end) ranges of frame_times, the ranges
+        share the incremental renderer: it replays only the frames between them
+        """
+        renderer = AccumulatingRenderer(self, frame_times) \
+            if self.render_settings.incremental else None
+        for begin, end in frame_ranges:
+            yield from self._iter_frame_range(frame_times, begin, end, renderer)
+
+    def _iter_frame_range(
+            self,
+            frame_times: List[datetime.datetime],
+            begin: int,
+            end: int,
+            renderer: Optional[AccumulatingRenderer] = None) -> Iterator[Tuple[int, ndarray]]:
+        """
+        render the frames [begin, end) of frame_times
+        """
+        frames_total = len(frame_times)
+        if renderer is None and self.render_settings.incremental:
+            renderer = AccumulatingRenderer(self, frame_times)
+        window = self._create_track_window(frame_times[begin]) \
+            if self.render_settings.streaming and begin < end else None
+
+        for i in range(begin, end):
+            cache_key = ""
+            if window:
+                with telemetry.stage("movie.advance_window"):
+                    self.track_bag = window.advance_to(frame_times[i])
+                if self.frame_cache:
+                    # the frame's data is the window, not the whole movie's tracks
+                    cache_key = self.frame_cache.get_key(frame_times[i], self.track_bag.content_hash())
+            elif self.frame_cache:
+                cache_key = self.frame_cache.get_key(frame_times[i])
+            if cache_key:
+                with telemetry.stage("movie.frame_cache_load"):
+                    image = self.frame_cache.load(cache_key)
+                if image is not None:
+                    logger.info("Frame is cached", extra={"frame": i + 1, "frames_total": frames_total})
+                    telemetry.count("movie.frames_cached")
+                    yield i, image
+                    continue
+
+            logger.info("Filming frame", extra={"frame": i + 1, "frames_total": frames_total})
+            with telemetry.stage("movie.render_frame"):
+                if renderer:
+                    image = renderer.render(i)
+                else:
+                    image = self._render_frame(frame_times[i])
+            telemetry.count("movie.frames_rendered")
+            if cache_key:
+                with telemetry.stage("movie.frame_cache_save"):
+                    self.frame_cache.save(cache_key, image)
+            yield i, image
+
+    def _get_frame_path(self, frame_num: int) -> str:
+        return os.path.join(self.frames_folder, f"frame_{frame_num:04}.png")
+
+    def _get_frame_times(self) -> List[datetime.datetime]:
+        frame_times = []
+        start, end = self.movie_timing.start_time, self.movie_timing.end_time
         while start < end:
-            print(f"Filming frame {frame_num} of {frames_total}")
             query_end = start + datetime.timedelta(
                 seconds=self.movie_timing.seconds_per_frame)
             query_end = min(end, query_end)
-
-            frame_path = os.path.join(
-                self.frames_folder, f"frame_{frame_num:04}.png")
-            self._shot_frame(query_end, frame_path)
-
+            frame_times.append(query_end)
             start = query_end
-            frame_num += 1
-            # break
+        return frame_times
 
     def _render_video(self):
         image_folder = self.frames_folder
@@ -94,7 +320,10 @@ class MovieOperator:
             video_path, 0, self.movie_timing.video_framerate, (width, height))
 
         for image in images:
-            video.write(cv2.imread(os.path.join(image_folder, image)))
+            with telemetry.stage("movie.read_png"):
+                frame = cv2.imread(os.path.join(image_folder, image))
+            with telemetry.stage("movie.encode_frame"):
+                video.write(frame)
 
         cv2.destroyAllWindows()
         video.release()
@@ -103,19 +332,29 @@ class MovieOperator:
             self,
             frame_time: datetime.datetime,
             frame_file_name: str):
+        image = self._render_frame(frame_time)
+        with telemetry.stage("movie.write_png"):
+            cv2.imwrite(frame_file_name, image)
+
+    def _render_frame(self, frame_time: datetime.datetime) -> ndarray:
         alpha = self.drawing_settings.path_transparency
-        background = self.geo_map.map_pic.copy()
+        # the map is shared read-only, the paths are drawn on a copy
+        background = self.geo_map.map_pic
         overlay = background.copy()
 
         tail_start = frame_time - datetime.timedelta(seconds=self.movie_timing.track_cutting_seconds)
         body_start = frame_time - datetime.timedelta(seconds=self.movie_timing.track_fading_seconds)
 
-        for _, track in self.track_bag.track_by_id.items():
-            overlay = self._draw_track(
-                overlay, track, frame_time, tail_start, body_start)
+        if self.render_settings.batched_drawing:
+            if self.track_drawer is None:
+                self.track_drawer = BatchedTrackDrawer(self.geo_map, self.drawing_settings)
+            overlay = self.track_drawer.draw(overlay, self.track_bag, frame_time, tail_start, body_start)
+        else:
+            for _, track in self.track_bag.track_by_id.items():
+                overlay = self._draw_track(
+                    overlay, track, frame_time, tail_start, body_start)
         merged_image = cv2.addWeighted(overlay, alpha, background, 1 - alpha, 0)
-        merged_image = self._draw_time_stamp(merged_image, frame_time)
-        cv2.imwrite(frame_file_name, merged_image)
+        return self._draw_time_stamp(merged_image, frame_time)
 
     def _draw_track(
             self,
@@ -124,63 +363,54 @@ class MovieOperator:
             frame_time: datetime.datetime,
             tail_start: datetime.datetime,
             body_start: datetime.datetime) -> ndarray:
-        if tail_start > track.points[-1].track_time:
+        times = track.times
+        if tail_start.timestamp() > times[-1]:
             return overlay
-        if frame_time < track.points[0].track_time:
+        if frame_time.timestamp() < times[0]:
             return overlay
-        points_body, points_tail = [], []
 
-        for pt in track.points:
-            if pt.track_time > frame_time:
-                break
-            if pt.track_time >= body_start:
-                points_body.append(pt.integer_xy_coords)
-                continue
-            if pt.track_time >= tail_start:
-                points_tail.append(pt.integer_xy_coords)
+        # the points are sorted by time: the tail is [tail_begin, body_begin),
+        # the body is [body_begin, body_end). The body isn't limited by the tail
+        # start: with the fading window longer than the cutting one there's no tail
+        tail_begin = track.time_index(tail_start.timestamp())
+        body_begin = track.time_index(body_start.timestamp())
+        body_end = track.time_index(frame_time.timestamp(), side="right")
+        points_body = track.slice(body_begin, body_end).integer_xy_coords
+        points_tail = track.slice(tail_begin, max(tail_begin, min(body_begin, body_end))).integer_xy_coords
 
         # draw the tail and the body
         for points, thickness in [
             (points_tail, self.drawing_settings.path_tail_thickness),
             (points_body, self.drawing_settings.path_thickness)]:
-            if not points:
+            if not len(points):
                 continue
             overlay = self._draw_track_polyline(overlay, points, thickness, track.color)
         # draw the head
         if len(points_body) > 1:
             # if the track is being updated
-            if points_body[0] != points_body[-1]:
+            if not np.array_equal(points_body[0], points_body[-1]):
                 overlay = cv2.circle(
-                    overlay, points_body[-1],
+                    overlay, tuple(points_body[-1].tolist()),
                     self.drawing_settings.head_radius,
                     track.color,
                     self.drawing_settings.head_thickness)
         return overlay
 
     def _draw_track_polyline(
-            self, overlay: ndarray, points: List[Tuple[int, int]],
-            thickness: float, color: Tuple[int, int, int]):
+            self, overlay: ndarray, points: ndarray,
+            thickness: float, color: Union[Tuple[int, int, int], float]):
+        """
+        points is (n, 2) int32 array of canvas coords
+        """
         # split the line to a number of lines if there are
         # leaps (huge distances between 2 adjacent points)
-        prev_pt = points[0]
-        segments = [[]]
-        for point in points:
-            if self.geo_map.is_leap(point, prev_pt):
-                segments.append([point])
-            else:
-                segments[-1].append(point)
-            prev_pt = point
-
-        for segment in segments:
-            pts = np.array(segment, np.int32)
-            pts = pts.reshape((-1, 1, 2))
-            overlay = cv2.polylines(
-                overlay,
-                [pts],
-                False,
-                color,
-                thickness=thickness)
-        return overlay
+        segments = self.geo_map.split_leaps(points)
+        return cv2.polylines(
+            overlay,
+            segments,
+            False,
+            color,
+            thickness=thickness)
 
     def _draw_time_stamp(self, image: ndarray, frame_time: datetime.datetime) -> ndarray:
         sets = self.timer_drawing_settings
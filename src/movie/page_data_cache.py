@@ -1,14 +1,81 @@
 import datetime
+import hashlib
 import os
-from typing import Optional, List, Tuple
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from stat import S_ISREG
+from typing import Optional, List, Tuple, Dict, Iterable, Iterator, Union
 import re
 
 import pytz
 
+from movie.entity.track import TrackBag
+from movie.page_data_variants import PageDataVariantWriter, VARIANT_FORMATS, \
+    get_available_encodings, get_variant_name
+from movie.telemetry import telemetry
+from movie.track_grid_index import TrackGridIndex
 from paths import CACHE_PATH
+from settings import settings
+
+
+@dataclass
+class CachedVariant:
+    """
+    complete response body in one of the formats / content encodings
+    and its (strong) ETag
+    """
+    data: bytes
+    etag: str
 
 
 class PageDataCache:
+    """
+    Page data cached as text files in CACHE_PATH, one file per (start, end) interval.
+    On top of the files there are:
+    - an in-memory LRU of the entries, limited by PAGE_CACHE_MEMORY_MB
+    - an index of the cached intervals, updated by cache_data and re-read from
+      the folder every PAGE_CACHE_INDEX_TTL_SECONDS (to notice the files
+      written by other processes); the in-memory entries of the files replaced
+      or removed since the previous read are evicted
+    so the hot requests don't touch the file system.
+
+    Each entry also has the complete response bodies precompressed
+    in CACHE_PATH/variants/ (see PageDataVariantWriter), served with an ETag,
+    and a spatial index (TrackGridIndex) for the bounding box queries.
+
+    Besides, the loaded tracks are cached as per-day shards (TrackBag .npz files
+    in CACHE_PATH/days/<map name>/), so an arbitrary range of days
+    can be assembled from the cached days.
+    """
+    cache_folder = CACHE_PATH
+    _lock = threading.RLock()
+    # cache file name -> data, variant key -> CachedVariant, index key -> TrackGridIndex
+    _entries: 'OrderedDict[str, Union[str, CachedVariant, TrackGridIndex]]' = OrderedDict()
+    _entries_size = 0
+    # cache file name -> (start, end) date strings
+    _intervals: Dict[str, Tuple[str, str]] = {}
+    # cache file name -> the file's (inode, mtime, size) when the index was read
+    _file_versions: Dict[str, Tuple[int, int, int]] = {}
+    _intervals_read_time: Optional[float] = None
+    _stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @classmethod
+    def use_folder(cls, cache_folder: str):
+        """
+        keep the cache in another folder (e.g. a temp folder for the benchmarks),
+        the in-memory state is reset
+        """
+        with cls._lock:
+            cls.cache_folder = cache_folder
+            cls._entries.clear()
+            cls._entries_size = 0
+            cls._intervals = {}
+            cls._file_versions = {}
+            cls._intervals_read_time = None
+            cls._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
     @classmethod
     def parse_date_short_str(cls, date_str: str) -> datetime.datetime:
         year_month_date = [int(s) for s in date_str.split('-')]
@@ -16,19 +83,66 @@ class PageDataCache:
 
     @classmethod
     def get_cached_intervals(cls) -> List[Tuple[str, str]]:
+        with cls._lock:
+            return list(cls._get_interval_index().values())
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, int]:
+        with cls._lock:
+            return {
+                **cls._stats,
+                "entries": len(cls._entries),
+                "bytes": cls._entries_size
+            }
 
-        file_names = [o for o in os.listdir(CACHE_PATH)
-                      if os.path.isfile(os.path.join(CACHE_PATH, o))]
+    @classmethod
+    def _get_interval_index(cls) -> Dict[str, Tuple[str, str]]:
+        now = time.monotonic()
+        if cls._intervals_read_time is None or \
+                now - cls._intervals_read_time > settings.PAGE_CACHE_INDEX_TTL_SECONDS:
+            intervals, file_versions = cls._read_interval_index()
+            # the entries read from the files replaced (e.g. re-cached by
+            # another process) or removed since
+            for key, version in cls._file_versions.items():
+                if file_versions.get(key) != version:
+                    cls._evict_entries(key)
+            cls._intervals, cls._file_versions = intervals, file_versions
+            cls._intervals_read_time = now
+        return cls._intervals
 
-        date_strings = []
-        for file_name in file_names:
-            dates = cls._parse_file_name(file_name)
-            if not dates:
+    @classmethod
+    def _read_interval_index(cls) -> Tuple[Dict[str, Tuple[str, str]], Dict[str, Tuple[int, int, int]]]:
+        intervals, file_versions = {}, {}
+        for file_name in os.listdir(cls.cache_folder):
+            interval = cls._get_file_interval(file_name)
+            if not interval:
                 continue
+            version = cls._get_file_version(os.path.join(cls.cache_folder, file_name))
+            if version:
+                intervals[file_name] = interval
+                file_versions[file_name] = version
+        return intervals, file_versions
 
-            name_dates = [f"{d[0]}-{d[1]}-{d[2]}" for d in dates]
-            date_strings.append((name_dates[0], name_dates[1]))
-        return date_strings
+    @classmethod
+    def _get_file_version(cls, file_path: str) -> Optional[Tuple[int, int, int]]:
+        """
+        (inode, mtime, size) of the file, a replaced file has another inode
+        """
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        if not S_ISREG(file_stat.st_mode):
+            return None
+        return file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size
+
+    @classmethod
+    def _get_file_interval(cls, file_name: str) -> Optional[Tuple[str, str]]:
+        dates = cls._parse_file_name(file_name)
+        if not dates:
+            return None
+        name_dates = [f"{d[0]}-{d[1]}-{d[2]}" for d in dates]
+        return name_dates[0], name_dates[1]
 
     @classmethod
     def _parse_file_name(cls, file_name: str) -> Optional[List[Tuple[int, int, int]]]:
@@ -49,20 +163,245 @@ class PageDataCache:
     def cache_data(cls,
                    start_time_utc: datetime.datetime,
                    end_time_utc: datetime.datetime,
-                   data: str) -> None:
+                   data: str,
+                   header: str) -> None:
+        for _ in cls.iter_caching_data(start_time_utc, end_time_utc, [data], header):
+            pass
+        key = cls._get_cache_key(start_time_utc, end_time_utc)
+        with cls._lock:
+            cls._put_entry(key, data)
+
+    @classmethod
+    def iter_caching_data(cls,
+                          start_time_utc: datetime.datetime,
+                          end_time_utc: datetime.datetime,
+                          chunks: Iterable[str],
+                          header: str) -> Iterator[str]:
+        """
+        pass the data chunks through writing them to the cache file,
+        the entry appears in the cache when all the chunks are written.
+        The complete response bodies (header + data) are written
+        alongside in every format and content encoding.
+        If the iteration is abandoned nothing is cached
+        """
+        key = cls._get_cache_key(start_time_utc, end_time_utc)
         file_path = cls._get_cache_file_path(start_time_utc, end_time_utc, False)
-        with open(file_path, 'w') as f:
-            f.write(data)
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        variant_writer = PageDataVariantWriter(
+            cls._get_variant_file_paths(start_time_utc, end_time_utc), header)
+        try:
+            with open(temp_path, 'w') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    variant_writer.write(chunk)
+                    yield chunk
+            variant_writer.commit()
+            os.replace(temp_path, file_path)
+        finally:
+            variant_writer.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        version = cls._get_file_version(file_path)
+        with cls._lock:
+            interval = cls._get_file_interval(key)
+            if interval and version:
+                cls._get_interval_index()[key] = interval
+                cls._file_versions[key] = version
+            # the stale entries (if any) will be re-read from the files
+            cls._evict_entries(key)
+
+    @classmethod
+    def has_cached_data(cls, start_time_utc: datetime.datetime,
+                        end_time_utc: datetime.datetime) -> bool:
+        return bool(cls._get_cache_file_path(start_time_utc, end_time_utc, True))
 
     @classmethod
     def get_cached_data(cls, start_time_utc: datetime.datetime,
                         end_time_utc: datetime.datetime) -> Optional[str]:
+        data = cls._read_cached_data(start_time_utc, end_time_utc)
+        cls._count_lookup(data is not None)
+        return data
+
+    @classmethod
+    def get_cached_variant(cls,
+                           start_time_utc: datetime.datetime,
+                           end_time_utc: datetime.datetime,
+                           variant: str,
+                           header: str) -> Optional[CachedVariant]:
+        """
+        the complete response body in the given variant (see get_variant_name)
+        with its ETag. The variants missing for an existing cache entry
+        (cached before the variants were introduced) are built from the entry
+        """
+        entry = cls._read_cached_variant(start_time_utc, end_time_utc, variant, header)
+        cls._count_lookup(entry is not None)
+        return entry
+
+    @classmethod
+    def get_grid_index(cls, start_time_utc: datetime.datetime,
+                       end_time_utc: datetime.datetime) -> Optional[TrackGridIndex]:
+        """
+        the spatial index over the cached data, built on the first call
+        and kept in the LRU with the entries
+        """
+        index = cls._read_grid_index(start_time_utc, end_time_utc)
+        cls._count_lookup(index is not None)
+        return index
+
+    @classmethod
+    def _count_lookup(cls, hit: bool):
+        """
+        one hit or miss per lookup: the entries read from the files are hits
+        """
+        with cls._lock:
+            cls._stats["hits" if hit else "misses"] += 1
+
+    @classmethod
+    def _read_cached_data(cls, start_time_utc: datetime.datetime,
+                          end_time_utc: datetime.datetime) -> Optional[str]:
+        key = cls._get_cache_key(start_time_utc, end_time_utc)
+        with cls._lock:
+            # re-read the index first: it evicts the stale entries
+            if key not in cls._get_interval_index():
+                return None
+            data = cls._entries.get(key)
+            if data is not None:
+                cls._entries.move_to_end(key)
+                return data
+
         file_path = cls._get_cache_file_path(start_time_utc, end_time_utc, True)
         if not file_path:
             return None
         # read file and deserialize
-        with open(file_path) as f:
-            return f.read()
+        with telemetry.stage("cache.read_file"), open(file_path) as f:
+            data = f.read()
+        with cls._lock:
+            cls._put_entry(key, data)
+        return data
+
+    @classmethod
+    def _read_cached_variant(cls,
+                             start_time_utc: datetime.datetime,
+                             end_time_utc: datetime.datetime,
+                             variant: str,
+                             header: str) -> Optional[CachedVariant]:
+        key = cls._get_cache_key(start_time_utc, end_time_utc)
+        variant_key = cls._get_variant_key(key, variant)
+        with cls._lock:
+            if key not in cls._get_interval_index():
+                return None
+            entry = cls._entries.get(variant_key)
+            if entry is not None:
+                cls._entries.move_to_end(variant_key)
+                return entry
+
+        file_path_by_variant = cls._get_variant_file_paths(start_time_utc, end_time_utc)
+        file_path = file_path_by_variant[variant]
+        if not os.path.isfile(file_path):
+            data = cls._read_cached_data(start_time_utc, end_time_utc)
+            if data is None:
+                return None
+            with telemetry.stage("cache.build_variants"):
+                variant_writer = PageDataVariantWriter(file_path_by_variant, header)
+                try:
+                    variant_writer.write(data)
+                    variant_writer.commit()
+                finally:
+                    variant_writer.close()
+
+        with telemetry.stage("cache.read_file"), open(file_path, 'rb') as f:
+            data = f.read()
+        entry = CachedVariant(data, f'"{hashlib.sha1(data).hexdigest()}"')
+        with cls._lock:
+            cls._put_entry(variant_key, entry)
+        return entry
+
+    @classmethod
+    def _read_grid_index(cls, start_time_utc: datetime.datetime,
+                         end_time_utc: datetime.datetime) -> Optional[TrackGridIndex]:
+        key = cls._get_cache_key(start_time_utc, end_time_utc)
+        index_key = f"{key}.grid"
+        with cls._lock:
+            if key not in cls._get_interval_index():
+                return None
+            index = cls._entries.get(index_key)
+            if index is not None:
+                cls._entries.move_to_end(index_key)
+                return index
+
+        data = cls._read_cached_data(start_time_utc, end_time_utc)
+        if data is None:
+            return None
+        with telemetry.stage("cache.build_grid_index"):
+            index = TrackGridIndex(data, settings.TRACK_GRID_CELL_PX)
+        with cls._lock:
+            cls._put_entry(index_key, index)
+        return index
+
+    @classmethod
+    def _put_entry(cls, key: str, entry: Union[str, CachedVariant, TrackGridIndex]):
+        """
+        put the entry in the LRU and evict the least recently used
+        entries exceeding the memory budget, should be called under the lock
+        """
+        budget = settings.PAGE_CACHE_MEMORY_MB * 1024 * 1024
+        old_entry = cls._entries.pop(key, None)
+        if old_entry is not None:
+            cls._entries_size -= cls._get_entry_size(old_entry)
+        size = cls._get_entry_size(entry)
+        if size > budget:
+            return
+        cls._entries[key] = entry
+        cls._entries_size += size
+        while cls._entries_size > budget:
+            _, evicted = cls._entries.popitem(last=False)
+            cls._entries_size -= cls._get_entry_size(evicted)
+            cls._stats["evictions"] += 1
+
+    @classmethod
+    def _evict_entries(cls, key: str):
+        """
+        remove the in-memory entries of the cache file (the data, the variants
+        and the grid index), should be called under the lock
+        """
+        entry_keys = [key, f"{key}.grid"] + \
+            [cls._get_variant_key(key, v) for v in cls._get_variant_names()]
+        for entry_key in entry_keys:
+            old_entry = cls._entries.pop(entry_key, None)
+            if old_entry is not None:
+                cls._entries_size -= cls._get_entry_size(old_entry)
+
+    @classmethod
+    def _get_entry_size(cls, entry: Union[str, CachedVariant, TrackGridIndex]) -> int:
+        if isinstance(entry, TrackGridIndex):
+            return entry.nbytes
+        return len(entry.data) if isinstance(entry, CachedVariant) else len(entry)
+
+    @classmethod
+    def has_day_shard(cls, map_name: str, day: datetime.datetime) -> bool:
+        return os.path.isfile(cls._get_day_shard_path(map_name, day))
+
+    @classmethod
+    def get_day_shard(cls, map_name: str, day: datetime.datetime) -> Optional[TrackBag]:
+        file_path = cls._get_day_shard_path(map_name, day)
+        if not os.path.isfile(file_path):
+            return None
+        with telemetry.stage("cache.read_day_shard"):
+            return TrackBag.load(file_path)
+
+    @classmethod
+    def cache_day_shard(cls, map_name: str, day: datetime.datetime, track_bag: TrackBag):
+        file_path = cls._get_day_shard_path(map_name, day)
+        folder = os.path.dirname(file_path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        with telemetry.stage("cache.write_day_shard"):
+            track_bag.save(file_path)
+
+    @classmethod
+    def _get_day_shard_path(cls, map_name: str, day: datetime.datetime) -> str:
+        return os.path.join(cls.cache_folder, "days", map_name, f"{day:%y_%m_%d}.npz")
 
     @classmethod
     def _get_cache_file_path(cls,
@@ -70,11 +409,35 @@ class PageDataCache:
                              end_time_utc: datetime.datetime,
                              check_file_exists: bool) -> str:
         key = cls._get_cache_key(start_time_utc, end_time_utc)
-        file_path = os.path.join(CACHE_PATH, key)
+        file_path = os.path.join(cls.cache_folder, key)
         if check_file_exists and not os.path.isfile(file_path):
             return ""
         return file_path
 
+    @classmethod
+    def _get_variant_file_paths(cls,
+                                start_time_utc: datetime.datetime,
+                                end_time_utc: datetime.datetime) -> Dict[str, str]:
+        key = cls._get_cache_key(start_time_utc, end_time_utc)
+        return {v: os.path.join(cls.cache_folder, "variants", cls._get_variant_file_name(key, v))
+                for v in cls._get_variant_names()}
+
+    @classmethod
+    def _get_variant_names(cls) -> List[str]:
+        return [get_variant_name(data_format, encoding)
+                for data_format in VARIANT_FORMATS
+                for encoding in get_available_encodings()]
+
+    @classmethod
+    def _get_variant_key(cls, key: str, variant: str) -> str:
+        # differs from the entry keys (the text variant's file name doesn't)
+        return f"variants/{cls._get_variant_file_name(key, variant)}"
+
+    @classmethod
+    def _get_variant_file_name(cls, key: str, variant: str) -> str:
+        name, _ = os.path.splitext(key)
+        return f"{name}.{variant}"
+
     @classmethod
     def _get_cache_key(cls, start_time_utc: datetime.datetime,
                        end_time_utc: datetime.datetime) -> str:
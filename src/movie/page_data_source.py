@@ -1,17 +1,34 @@
 import datetime
+import os
+import threading
+from typing import List, Tuple, Iterator, Optional, Callable
 
-import sqlalchemy
+import numpy as np
+import pytz
 
 from maps.map_descriptor import MapDescriptor
 from movie.entity.track import TrackBag
-from movie.page_data_cache import PageDataCache
+from movie.page_data_cache import PageDataCache, CachedVariant
+from movie.page_data_variants import get_variant_name
+from movie.repository.archive_track_repository import create_track_repository
+from movie.repository.engine import get_shared_engine
 from movie.repository.track_repository import TrackRepository
 from movie.serializer.time_conversion import time_to_minutes, time_to_timespan
 from movie.serializer.track_bag_json_serializer import TrackBagJsonSerializer
+from movie.single_flight import SingleFlight
+from movie.telemetry import telemetry
+from movie.track_grid_index import BBox
+from movie.track_simplifier import TrackSimplifier
 from settings import settings
 
 
 class PageDataSource:
+    # creates the repository the missing data is loaded from, by default
+    # TrackRepository over the shared engine (replaced to run without the DB)
+    repository_factory: Optional[Callable[[], TrackRepository]] = None
+    _track_loads = SingleFlight()
+    _load_semaphore = threading.BoundedSemaphore(settings.PAGE_DATA_MAX_CONCURRENT_LOADS)
+
     def __init__(
             self,
             geo_map: MapDescriptor):
@@ -22,35 +39,206 @@ class PageDataSource:
             self,
             start_time_utc: datetime.datetime,
             end_time_utc: datetime.datetime) -> str:
+        return "".join(self.iter_track(start_time_utc, end_time_utc))
+
+    def iter_track(
+            self,
+            start_time_utc: datetime.datetime,
+            end_time_utc: datetime.datetime) -> Iterator[str]:
+        """
+        yields the timings header, then the tracks data: the whole cached
+        data or, if not cached, one chunk per track as they are serialized
+        """
+        yield self._get_data_timings(start_time_utc, end_time_utc)
         data = PageDataCache.get_cached_data(start_time_utc, end_time_utc)
-        if not data:
-            data = self._read_data_from_server(start_time_utc, end_time_utc)
-        data = self._set_data_timings(data, start_time_utc, end_time_utc)
-        return data
+        if data is not None:
+            yield data
+            return
+        yield from self._iter_data_from_server(start_time_utc, end_time_utc)
 
-    def _read_data_from_server(
+    def iter_track_in_bbox(
             self,
             start_time_utc: datetime.datetime,
-            end_time_utc: datetime.datetime) -> str:
-        engine = sqlalchemy.create_engine(settings.db_uri)
-        repo = TrackRepository(engine)
-        track_bag = repo.load_tracks(
-            self.geo_map,
-            start_time_utc,
-            end_time_utc
-        )
-        data = TrackBagJsonSerializer.serialize(self.geo_map, track_bag)
-        PageDataCache.cache_data(start_time_utc, end_time_utc, data)
-        return data
+            end_time_utc: datetime.datetime,
+            bbox: BBox) -> Iterator[str]:
+        """
+        as iter_track, but only the parts of the tracks within the bounding box
+        (canvas coords), read from the cached data's spatial index.
+        The data is cached first if it isn't
+        """
+        yield self._get_data_timings(start_time_utc, end_time_utc)
+        index = PageDataCache.get_grid_index(start_time_utc, end_time_utc)
+        if index is None:
+            self.cache_track(start_time_utc, end_time_utc)
+            index = PageDataCache.get_grid_index(start_time_utc, end_time_utc)
+        yield from index.iter_serialize_bbox(bbox)
+
+    def get_geo_bbox(self, lat_min: float, lon_min: float, lat_max: float, lon_max: float) -> BBox:
+        """
+        the canvas bounding box of the geo (lat, lon) box
+        """
+        xs, ys = self.geo_map.geo_to_canvas_batch(
+            np.array([lat_min, lat_max]), np.array([lon_min, lon_max]))
+        return float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+
+    def cache_track(
+            self,
+            start_time_utc: datetime.datetime,
+            end_time_utc: datetime.datetime):
+        """
+        (re)build the cache entry from the day shards / DB,
+        the entry is replaced when it's completely written
+        """
+        for _ in self._iter_data_from_server(start_time_utc, end_time_utc):
+            pass
+
+    def get_cached_variant(
+            self,
+            start_time_utc: datetime.datetime,
+            end_time_utc: datetime.datetime,
+            data_format: str,
+            encoding: str) -> Optional[CachedVariant]:
+        """
+        the complete precompressed response body if the data is cached
+        """
+        return PageDataCache.get_cached_variant(
+            start_time_utc, end_time_utc,
+            get_variant_name(data_format, encoding),
+            self._get_data_timings(start_time_utc, end_time_utc))
+
+    def _iter_data_from_server(
+            self,
+            start_time_utc: datetime.datetime,
+            end_time_utc: datetime.datetime) -> Iterator[str]:
+        track_bag = self._load_day_sharded(start_time_utc, end_time_utc)
+        if settings.TRACK_SIMPLIFY:
+            simplifier = TrackSimplifier(self.geo_map, settings.TRACK_SIMPLIFY_TOLERANCE_PX)
+            with telemetry.stage("page.simplify"):
+                track_bag, _ = simplifier.simplify(track_bag)
+        chunks = TrackBagJsonSerializer.iter_serialize(self.geo_map, track_bag)
+        yield from PageDataCache.iter_caching_data(
+            start_time_utc, end_time_utc, chunks,
+            self._get_data_timings(start_time_utc, end_time_utc))
+
+    def _load_day_sharded(
+            self,
+            start_time_utc: datetime.datetime,
+            end_time_utc: datetime.datetime) -> TrackBag:
+        """
+        assemble the tracks from the cached day shards, only the missing
+        days are read from the DB. The days that are over are cached as shards.
+        The result is the same as loading the whole range at once.
+        """
+        map_name = self._get_map_name()
+        now = datetime.datetime.now(pytz.utc)
+        days = self._split_days(start_time_utc, end_time_utc)
+
+        bag_by_day = {}
+        missing_days = [d for d in days
+                        if not self._is_whole_day(*d)
+                        or not PageDataCache.has_day_shard(map_name, d[0])]
+        if missing_days:
+            for run_start, run_end in self._join_adjacent_days(missing_days):
+                run_bag = self._load_tracks(run_start, run_end)
+                for day_start, day_end in missing_days:
+                    if day_start < run_start or day_end > run_end:
+                        continue
+                    day_bag = run_bag.select_time_range(
+                        day_start.timestamp(), day_end.timestamp())
+                    if self._is_whole_day(day_start, day_end) and day_end <= now:
+                        PageDataCache.cache_day_shard(map_name, day_start, day_bag)
+                    bag_by_day[day_start] = day_bag
+
+        track_bag = TrackBag()
+        for day_start, _ in days:
+            day_bag = bag_by_day.get(day_start)
+            if day_bag is None:
+                day_bag = PageDataCache.get_day_shard(map_name, day_start)
+            track_bag.extend(day_bag)
+        return track_bag
+
+    def _load_tracks(
+            self,
+            start_time_utc: datetime.datetime,
+            end_time_utc: datetime.datetime) -> TrackBag:
+        """
+        load the tracks from the DB, the concurrent loads of the same range
+        are coalesced into one, at most PAGE_DATA_MAX_CONCURRENT_LOADS loads run at once.
+        The bag may be shared by the requests, so it shouldn't be modified
+        """
+        def load() -> TrackBag:
+            with telemetry.stage("page.wait_load_slot"):
+                self._load_semaphore.acquire()
+            try:
+                repo = self._create_repository()
+                with telemetry.stage("page.load_tracks"):
+                    track_bag = repo.load_tracks(self.geo_map, start_time_utc, end_time_utc)
+            finally:
+                self._load_semaphore.release()
+            # merge the pending points now, not concurrently in the requests
+            _ = track_bag.points_count
+            return track_bag
+
+        key = (self._get_map_name(), start_time_utc, end_time_utc)
+        return self._track_loads.do(key, load)
+
+    @classmethod
+    def get_coalesced_loads_count(cls) -> int:
+        """
+        the loads the requests didn't run as they waited for the same load
+        """
+        return cls._track_loads.coalesced_calls
 
     @classmethod
-    def _set_data_timings(
+    def _create_repository(cls) -> TrackRepository:
+        factory = PageDataSource.repository_factory
+        return factory() if factory else create_track_repository(get_shared_engine())
+
+    def _get_map_name(self) -> str:
+        map_name, _ = os.path.splitext(os.path.basename(self.geo_map.map_file_path))
+        return map_name
+
+    @classmethod
+    def _split_days(
             cls,
-            data: str,
             start_time_utc: datetime.datetime,
-            end_time_utc: datetime.datetime):
-        prefix = f"{time_to_timespan(start_time_utc)}," + \
-                 f"{time_to_timespan(end_time_utc)}," + \
-                 f"{time_to_minutes(start_time_utc)}," + \
-                 f"{time_to_minutes(end_time_utc)},"
-        return prefix + data
+            end_time_utc: datetime.datetime) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        """
+        [start, end) split by the day (UTC midnight) boundaries
+        """
+        days = []
+        start = start_time_utc
+        while start < end_time_utc:
+            next_day = datetime.datetime.combine(
+                start.date() + datetime.timedelta(days=1), datetime.time(), pytz.utc)
+            end = min(end_time_utc, next_day)
+            days.append((start, end))
+            start = end
+        return days
+
+    @classmethod
+    def _is_whole_day(cls, start: datetime.datetime, end: datetime.datetime) -> bool:
+        return start.time() == datetime.time() and end - start == datetime.timedelta(days=1)
+
+    @classmethod
+    def _join_adjacent_days(
+            cls,
+            days: List[Tuple[datetime.datetime, datetime.datetime]]) \
+            -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        runs = []
+        for start, end in days:
+            if runs and runs[-1][1] == start:
+                runs[-1] = (runs[-1][0], end)
+                continue
+            runs.append((start, end))
+        return runs
+
+    @classmethod
+    def _get_data_timings(
+            cls,
+            start_time_utc: datetime.datetime,
+            end_time_utc: datetime.datetime) -> str:
+        return f"{time_to_timespan(start_time_utc)}," + \
+               f"{time_to_timespan(end_time_utc)}," + \
+               f"{time_to_minutes(start_time_utc)}," + \
+               f"{time_to_minutes(end_time_utc)},"
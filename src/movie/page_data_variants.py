@@ -0,0 +1,132 @@
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple, IO
+
+from movie.serializer.track_data_binary_encoder import TrackDataBinaryEncoder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+VARIANT_FORMAT_TEXT = "txt"
+VARIANT_FORMAT_BINARY = "bin"
+VARIANT_FORMATS = [VARIANT_FORMAT_TEXT, VARIANT_FORMAT_BINARY]
+
+ENCODING_IDENTITY = "identity"
+ENCODING_GZIP = "gzip"
+ENCODING_BROTLI = "br"
+# file name suffix per content encoding
+ENCODING_SUFFIXES = {ENCODING_IDENTITY: "", ENCODING_GZIP: ".gz", ENCODING_BROTLI: ".br"}
+
+
+def get_available_encodings() -> List[str]:
+    """
+    the encodings the variants are stored in, most preferred first
+    (brotli only if the brotli package is installed)
+    """
+    encodings = [ENCODING_GZIP, ENCODING_IDENTITY]
+    if brotli is not None:
+        encodings.insert(0, ENCODING_BROTLI)
+    return encodings
+
+
+def get_variant_name(data_format: str, encoding: str) -> str:
+    return f"{data_format}{ENCODING_SUFFIXES[encoding]}"
+
+
+class _GzipCompressor:
+    def __init__(self):
+        # wbits = 16 + MAX_WBITS: gzip header and trailer
+        self.compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=9)
+
+    def process(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class PageDataVariantWriter:
+    """
+    Writes the complete /track_data/ response bodies (the timings header
+    followed by the tracks data) in every format and content encoding as the
+    tracks data chunks come, so the compressed bodies are ready when a cache
+    entry is written.
+
+    The files are written as temp files and renamed by commit(),
+    abandoned writers are cleaned up by close().
+    """
+    def __init__(self, file_path_by_variant: Dict[str, str], header: str):
+        self.file_path_by_variant = file_path_by_variant
+        self.temp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        # (data format, variant name, file, compressor or None)
+        self.outputs: List[Tuple[str, str, IO[bytes], Optional[object]]] = []
+        try:
+            for data_format in VARIANT_FORMATS:
+                for encoding in get_available_encodings():
+                    variant = get_variant_name(data_format, encoding)
+                    file_path = file_path_by_variant[variant] + self.temp_suffix
+                    folder = os.path.dirname(file_path)
+                    if not os.path.exists(folder):
+                        os.makedirs(folder, exist_ok=True)
+                    compressor = self._make_compressor(encoding)
+                    self.outputs.append((data_format, variant, open(file_path, 'wb'), compressor))
+
+            self._write({
+                VARIANT_FORMAT_TEXT: header.encode(),
+                VARIANT_FORMAT_BINARY: TrackDataBinaryEncoder.encode_header(header)
+            })
+        except BaseException:
+            # the files opened so far are closed and removed
+            self.close()
+            raise
+
+    def write(self, chunk: str):
+        if not chunk:
+            return
+        self._write({
+            VARIANT_FORMAT_TEXT: chunk.encode(),
+            VARIANT_FORMAT_BINARY: TrackDataBinaryEncoder.encode_tracks(chunk)
+        })
+
+    def commit(self):
+        for _, variant, f, compressor in self.outputs:
+            if compressor:
+                f.write(compressor.finish())
+            f.close()
+            file_path = self.file_path_by_variant[variant]
+            os.replace(file_path + self.temp_suffix, file_path)
+
+    def close(self):
+        for _, variant, f, _ in self.outputs:
+            f.close()
+            temp_path = self.file_path_by_variant[variant] + self.temp_suffix
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _write(self, data_by_format: Dict[str, bytes]):
+        for data_format, _, f, compressor in self.outputs:
+            data = data_by_format[data_format]
+            f.write(compressor.process(data) if compressor else data)
+
+    @classmethod
+    def _make_compressor(cls, encoding: str):
+        if encoding == ENCODING_GZIP:
+            return _GzipCompressor()
+        if encoding == ENCODING_BROTLI:
+            return _BrotliCompressor()
+        return None
@@ -0,0 +1,158 @@
+import datetime
+from typing import List
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+
+class AccumulatingRenderer:
+    """
+    Incremental frame renderer. Instead of redrawing all the visible history
+    on every frame it keeps persistent float layers between the frames:
+    - body weights: paths drawn with path_thickness,
+      fading to cutoff within track_fading_seconds
+    - tail weights: paths drawn with path_tail_thickness,
+      fading to cutoff within track_cutting_seconds
+    - colors: the color of the latest path drawn over the pixel
+    Each frame multiplies the weights by the decay factor for the elapsed
+    time, clears the weights that fell below cutoff and draws only the
+    segments added since the previous frame.
+
+    The weight of a path of age `a` is cutoff ** (a / window), so the weight
+    tells whether the path is still within the window. By default the paths are
+    shown with the constant path_transparency until they are cleared, which
+    keeps the tail / body look of MovieOperator._render_frame. With
+    RenderSettings.incremental_fade the opacity is path_transparency * weight,
+    i.e. the paths fade out smoothly.
+
+    Tolerance (without fading), compared to MovieOperator._render_frame:
+    - where paths of different trackers overlap the latest drawn one's color
+      wins instead of the one drawn last in the track bag's order
+    - a segment is aged by the frame it was drawn on rather than by its
+      starting point's time, so the segment crossing the body / tail boundary
+      is drawn (thick) a bit longer
+    - a path may stay one frame longer or shorter at the end of its window
+      because of the accumulated rounding of the decay factors
+    The rest of the pixels are the same.
+
+    The frames should be rendered in order. If a frame is requested
+    out of order the layers are rebuilt by replaying the frames that
+    fall into the visible window (the longer of the cutting and the fading
+    windows), so the result doesn't depend
+    on where the rendering started. A frame requested a bit ahead of
+    the last rendered one renders only the frames in between.
+    """
+    def __init__(self, operator, frame_times: List[datetime.datetime]):
+        """
+        operator is the MovieOperator owning the track bag and the settings,
+        frame_times are the times of all the movie's frames
+        """
+        self.operator = operator
+        self.frame_datetimes = frame_times
+        self.frame_times = [t.timestamp() for t in frame_times]
+        self.movie_start = operator.movie_timing.start_time.timestamp()
+        self.cutoff = operator.render_settings.incremental_cutoff
+        self.fade = operator.render_settings.incremental_fade
+
+        h, w = operator.geo_map.map_pic.shape[:2]
+        self.body_weights = np.zeros((h, w), dtype=np.float32)
+        self.tail_weights = np.zeros((h, w), dtype=np.float32)
+        self.colors = np.zeros((h, w, 3), dtype=np.float32)
+        self.last_index = -1
+
+    def render(self, frame_index: int) -> ndarray:
+        if frame_index != self.last_index + 1:
+            self._warm_up(frame_index)
+        self._advance(frame_index)
+        return self._compose(frame_index)
+
+    def _warm_up(self, frame_index: int):
+        # replay the frames which paths are still visible at frame_index
+        # (plus one frame as a margin against rounding errors)
+        timing = self.operator.movie_timing
+        window_start = self.frame_times[frame_index] - \
+            timing.track_visible_seconds - timing.seconds_per_frame
+        first_index = frame_index
+        while first_index > 0 and self.frame_times[first_index - 1] >= window_start:
+            first_index -= 1
+        if self.last_index < first_index - 1 or self.last_index >= frame_index:
+            self.body_weights[:] = 0
+            self.tail_weights[:] = 0
+            self.colors[:] = 0
+        else:
+            # the layers are those of an earlier frame within the window:
+            # render on from it as in order
+            first_index = self.last_index + 1
+        for i in range(first_index, frame_index):
+            self._advance(i)
+
+    def _advance(self, frame_index: int):
+        timing = self.operator.movie_timing
+        settings = self.operator.drawing_settings
+        frame_time = self.frame_times[frame_index]
+        prev_time = self.frame_times[frame_index - 1] if frame_index else self.movie_start
+        elapsed = frame_time - prev_time
+
+        for weights, window in [
+            (self.body_weights, timing.track_fading_seconds),
+            (self.tail_weights, timing.track_cutting_seconds)]:
+            weights *= self.cutoff ** (elapsed / window)
+            weights[weights < self.cutoff] = 0
+
+        tail_start = frame_time - timing.track_cutting_seconds
+        for track in self.operator.track_bag.track_by_id.values():
+            times = track.times
+            if times[-1] <= prev_time or times[0] > frame_time:
+                continue
+            begin = track.time_index(prev_time, side="right")
+            end = track.time_index(frame_time, side="right")
+            if begin == end:
+                continue
+            # connect the new points to the last one already drawn
+            if begin > 0 and times[begin - 1] >= tail_start:
+                begin -= 1
+            points = track.slice(begin, end).integer_xy_coords
+            color = tuple(float(c) for c in track.color)
+
+            for layer, thickness in [
+                (self.tail_weights, settings.path_tail_thickness),
+                (self.body_weights, settings.path_thickness)]:
+                self.operator._draw_track_polyline(layer, points, thickness, 1.0)
+                self.operator._draw_track_polyline(self.colors, points, thickness, color)
+        self.last_index = frame_index
+
+    def _compose(self, frame_index: int) -> ndarray:
+        settings = self.operator.drawing_settings
+        frame_time = self.frame_times[frame_index]
+        weights = np.maximum(self.body_weights, self.tail_weights)
+        if not self.fade:
+            weights = (weights > 0).astype(np.float32)
+        colors = self.colors.copy()
+        self._draw_heads(weights, colors, frame_time)
+
+        alpha = (weights * settings.path_transparency)[:, :, np.newaxis]
+        background = self.operator.geo_map.map_pic.astype(np.float32)
+        merged_image = background * (1 - alpha) + colors * alpha
+        merged_image = np.rint(merged_image).astype(np.uint8)
+        return self.operator._draw_time_stamp(merged_image, self.frame_datetimes[frame_index])
+
+    def _draw_heads(self, weights: ndarray, colors: ndarray, frame_time: float):
+        settings = self.operator.drawing_settings
+        body_start = frame_time - self.operator.movie_timing.track_fading_seconds
+        for track in self.operator.track_bag.track_by_id.values():
+            times = track.times
+            if times[-1] < body_start or times[0] > frame_time:
+                continue
+            begin = track.time_index(body_start)
+            end = track.time_index(frame_time, side="right")
+            if end - begin < 2:
+                continue
+            # if the track is being updated
+            head = track.slice(end - 1, end).integer_xy_coords[0]
+            if np.array_equal(track.slice(begin, begin + 1).integer_xy_coords[0], head):
+                continue
+            center = tuple(head.tolist())
+            cv2.circle(weights, center, settings.head_radius, 1.0, settings.head_thickness)
+            cv2.circle(colors, center, settings.head_radius,
+                       tuple(float(c) for c in track.color), settings.head_thickness)
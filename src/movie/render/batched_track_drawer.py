@@ -0,0 +1,154 @@
+import datetime
+from typing import List, Tuple, Dict, Optional
+
+import cv2
+import numpy as np
+from numpy import ndarray
+
+from maps.map_descriptor import MapDescriptor
+from movie.entity.track import TrackBag
+from movie.entity.visual_settings import DrawingSettings
+
+
+class BatchedTrackDrawer:
+    """
+    Draws the tracks of a frame with a constant number of OpenCV calls:
+    the visible tail and body segments of all the tracks are gathered with
+    vectorized searches over the bag's columns and drawn with one
+    cv2.polylines call per (color, thickness), the heads are stamped
+    with the pixels of cv2.circle all at once.
+
+    Tolerance, compared to MovieOperator._draw_track drawing track by track:
+    - where paths of different colors overlap the color drawn last wins:
+      the tails are drawn first, then the bodies, color by color
+    - the heads are drawn over all the paths
+    The rest of the pixels are the same.
+    """
+    def __init__(self, geo_map: MapDescriptor, drawing_settings: DrawingSettings):
+        self.geo_map = geo_map
+        self.drawing_settings = drawing_settings
+        self.head_offsets = self._get_head_offsets()
+        self._track_bag: Optional[TrackBag] = None
+
+    def draw(
+            self,
+            overlay: ndarray,
+            track_bag: TrackBag,
+            frame_time: datetime.datetime,
+            tail_start: datetime.datetime,
+            body_start: datetime.datetime) -> ndarray:
+        if track_bag is not self._track_bag:
+            self._prepare(track_bag)
+        if not len(self.track_colors):
+            return overlay
+
+        # the same ranges as MovieOperator._draw_track finds track by track
+        tail_begins = self._search(tail_start.timestamp(), "left")
+        body_begins = self._search(body_start.timestamp(), "left")
+        body_ends = self._search(frame_time.timestamp(), "right")
+        # the tracks that ended before the tail start aren't drawn at all
+        ended = self.last_times < tail_start.timestamp()
+        body_ends[ended] = body_begins[ended]
+        tail_ends = np.maximum(tail_begins, np.minimum(body_begins, body_ends))
+        tail_ends[ended] = tail_begins[ended]
+
+        sets = self.drawing_settings
+        for begins, ends, thickness in [
+            (tail_begins, tail_ends, sets.path_tail_thickness),
+            (body_begins, body_ends, sets.path_thickness)]:
+            for color, segments in self._get_segments_by_color(begins, ends).items():
+                overlay = cv2.polylines(overlay, segments, False, color, thickness=thickness)
+
+        # the track is being updated
+        heads = np.flatnonzero(body_ends - body_begins > 1)
+        heads = heads[np.any(self.xy[body_begins[heads], 0] != self.xy[body_ends[heads] - 1, 0], axis=1)]
+        self._stamp_heads(overlay, self.xy[body_ends[heads] - 1, 0], self.track_colors[heads])
+        return overlay
+
+    def _prepare(self, track_bag: TrackBag):
+        """
+        the bag's columns as the frames search them: the points are grouped by
+        track (in the bag's order) and ordered by time within a track
+        """
+        self._track_bag = track_bag
+        tracks = track_bag.track_by_id
+        offsets = track_bag.offsets
+        self.xy = np.empty((track_bag.points_count, 1, 2), dtype=np.int32)
+        self.xy[:, 0, 0] = np.rint(track_bag.xs)
+        self.xy[:, 0, 1] = np.rint(track_bag.ys)
+        self.track_colors = np.array([t.color for t in tracks.values()], dtype=np.int64).reshape((-1, 3))
+
+        # the key of a point orders the points by track, then by time
+        begins = np.array([offsets[i][0] for i in tracks], dtype=np.int64)
+        ends = np.array([offsets[i][1] for i in tracks], dtype=np.int64)
+        times = track_bag.times
+        self.last_times = np.full(len(begins), -np.inf)
+        self.last_times[begins < ends] = times[ends[begins < ends] - 1]
+        self.min_time = int(times.min()) if len(times) else 0
+        self.time_span = (int(times.max()) - self.min_time + 2) if len(times) else 2
+        self.track_bases = np.arange(len(begins), dtype=np.int64) * self.time_span
+        # float keys: the searched times are float, the keys aren't converted on every search
+        self.keys = (np.repeat(self.track_bases, ends - begins) + (times - self.min_time)).astype(np.float64)
+
+        # the points a line is split at: the tracks' first points and the leaps
+        breaks = np.zeros(len(times), dtype=bool)
+        breaks[begins[begins < ends]] = True
+        breaks[self.geo_map.leap_indices(self.xy[:, 0])] = True
+        self.break_indices = np.flatnonzero(breaks)
+
+    def _search(self, track_time: float, side: str) -> ndarray:
+        """
+        Track.time_index for all the tracks at once: the global indices
+        """
+        # clipped to the track's key range: -1 is before any point, span - 1 after
+        relative_time = min(max(track_time - self.min_time, -1), self.time_span - 1)
+        return np.searchsorted(self.keys, self.track_bases + relative_time, side=side)
+
+    def _get_segments_by_color(
+            self,
+            begins: ndarray,
+            ends: ndarray) -> Dict[Tuple[int, int, int], List[ndarray]]:
+        """
+        the point ranges [begin, end) split at the leaps, as the views of xy
+        """
+        visible = np.flatnonzero(ends > begins)
+        begins, ends = begins[visible], ends[visible]
+        # the breaks within (begin, end) of each range
+        firsts = np.searchsorted(self.break_indices, begins, side="right")
+        counts = np.searchsorted(self.break_indices, ends, side="left") - firsts
+        inner = np.arange(counts.sum()) + np.repeat(firsts - np.cumsum(counts) + counts, counts)
+        inner_breaks = self.break_indices[inner]
+        # the ranges don't overlap: the sorted starts and ends make the segments
+        starts = np.sort(np.concatenate([begins, inner_breaks]))
+        stops = np.sort(np.concatenate([ends, inner_breaks]))
+        segment_tracks = np.repeat(visible, counts + 1)
+
+        segments_by_color = {}
+        colors = self.track_colors[segment_tracks]
+        for color in np.unique(colors, axis=0):
+            selected = np.flatnonzero(np.all(colors == color, axis=1))
+            segments_by_color[tuple(color.tolist())] = [
+                self.xy[s:e] for s, e in zip(starts[selected].tolist(), stops[selected].tolist())]
+        return segments_by_color
+
+    def _stamp_heads(self, overlay: ndarray, centers: ndarray, colors: ndarray):
+        if not len(centers):
+            return
+        dx, dy = self.head_offsets
+        xs = (centers[:, 0, np.newaxis] + dx).ravel()
+        ys = (centers[:, 1, np.newaxis] + dy).ravel()
+        pixel_colors = np.repeat(colors, len(dx), axis=0)
+        h, w = overlay.shape[:2]
+        inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        overlay[ys[inside], xs[inside]] = pixel_colors[inside]
+
+    def _get_head_offsets(self) -> Tuple[ndarray, ndarray]:
+        """
+        the pixels cv2.circle draws for a head, relative to the center
+        """
+        sets = self.drawing_settings
+        center = int(np.ceil(sets.head_radius + max(sets.head_thickness, 0))) + 2
+        stamp = np.zeros((2 * center + 1, 2 * center + 1), dtype=np.uint8)
+        cv2.circle(stamp, (center, center), sets.head_radius, 255, sets.head_thickness)
+        dy, dx = np.nonzero(stamp)
+        return dx - center, dy - center
@@ -0,0 +1,89 @@
+import dataclasses
+import datetime
+import hashlib
+import json
+import os
+from typing import Optional, Any
+
+import cv2
+from numpy import ndarray
+
+
+class FrameCache:
+    """
+    Content-addressed storage of the rendered frames. A frame is saved as
+    <folder>/<key>.png where the key is a hash of everything the frame's
+    pixels depend on: the frame's time window, the drawing, timer and render
+    settings, the color map, the map and the track data version.
+    Re-running a movie with the same inputs skips the frames already on disk.
+    """
+    def __init__(self, folder: str, operator):
+        self.folder = folder
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.fingerprint = self._get_operator_fingerprint(operator)
+
+    def get_key(self, frame_time: datetime.datetime, data_hash: str = "") -> str:
+        """
+        data_hash is the hash of the frame's own track data if the frame
+        isn't drawn from the whole movie's tracks (the streaming mode)
+        """
+        if data_hash:
+            return self._hash(self.fingerprint, frame_time.isoformat(), data_hash)
+        return self._hash(self.fingerprint, frame_time.isoformat())
+
+    def load(self, key: str) -> Optional[ndarray]:
+        file_path = self._get_file_path(key)
+        if not os.path.isfile(file_path):
+            return None
+        return cv2.imread(file_path)
+
+    def save(self, key: str, image: ndarray):
+        # write to a temp file first: a crash doesn't leave a broken frame
+        file_path = self._get_file_path(key)
+        temp_path = f"{file_path}.tmp.png"
+        cv2.imwrite(temp_path, image)
+        os.replace(temp_path, file_path)
+
+    def _get_file_path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}.png")
+
+    @classmethod
+    def _get_operator_fingerprint(cls, operator) -> str:
+        timing, geo_map = operator.movie_timing, operator.geo_map
+        render_sets = operator.render_settings
+        timer_sets = operator.timer_drawing_settings
+        map_stat = os.stat(geo_map.map_file_path)
+        inputs = {
+            "fading": timing.track_fading_seconds,
+            "cutting": timing.track_cutting_seconds,
+            "drawing": dataclasses.asdict(operator.drawing_settings),
+            "timer": cls._describe_timer_settings(timer_sets) if timer_sets else None,
+            "colors": operator.color_map.colors,
+            "map": [os.path.basename(geo_map.map_file_path), map_stat.st_size,
+                    map_stat.st_mtime, geo_map.canvas_w, geo_map.canvas_h,
+                    [vars(p) for p in geo_map.pivots]],
+            "data": operator.track_bag.content_hash(),
+            "incremental": [render_sets.incremental_cutoff, render_sets.incremental_fade,
+                            timing.start_time.isoformat(), timing.seconds_per_frame]
+            if render_sets.incremental else None
+        }
+        if render_sets.batched_drawing:
+            inputs["batched"] = True
+        return cls._hash(json.dumps(inputs, sort_keys=True, default=str))
+
+    @classmethod
+    def _describe_timer_settings(cls, sets) -> Any:
+        format_function = sets.format_time_string
+        return [
+            f"{format_function.__module__}.{format_function.__qualname__}",
+            sets.relative_coords, sets.abs_coords, sets.font, sets.font_scale,
+            sets.color, sets.thickness, sets.background_color, sets.background_size]
+
+    @classmethod
+    def _hash(cls, *parts: str) -> str:
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
@@ -0,0 +1,136 @@
+import datetime
+import math
+import multiprocessing
+import traceback
+from queue import Empty
+from typing import List, Tuple, Optional, Iterator
+
+from numpy import ndarray
+
+from movie.telemetry import telemetry
+
+# how often the caller waiting for a frame checks the worker is alive
+WORKER_POLL_SECONDS = 1
+
+# the operator and the frame times are set in the parent process right before
+# the workers are forked: the workers inherit the decoded map and the track
+# arrays instead of receiving them pickled with every task
+_operator = None
+_frame_times: List[datetime.datetime] = []
+
+
+def shot_frames_parallel(
+        operator,
+        frame_times: List[datetime.datetime],
+        workers: int,
+        frames_per_task: Optional[int] = None):
+    """
+    render the frames with a pool of forked processes, each task is a
+    contiguous range of frames written by MovieOperator._shot_frame_range
+    """
+    global _operator, _frame_times
+    ranges = split_frame_ranges(len(frame_times), workers, frames_per_task)
+
+    _operator, _frame_times = operator, frame_times
+    # decode the map before forking, not in every worker
+    _ = operator.geo_map.map_pic
+    # the workers dump only the stats they've profiled
+    telemetry.dump_profiles()
+    try:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers) as pool:
+            for _ in pool.imap_unordered(_shot_frame_range, ranges):
+                pass
+    finally:
+        _operator, _frame_times = None, []
+
+
+def iter_frames_parallel(
+        operator,
+        frame_times: List[datetime.datetime],
+        workers: int,
+        frames_per_task: int,
+        queue_size: int) -> Iterator[Tuple[int, ndarray]]:
+    """
+    render the frames with forked processes and yield (frame index, image)
+    pairs in the frames' order. The tasks are dealt to the workers in turn,
+    a worker sends its frames one by one through its own queue of
+    queue_size / workers frames, so at most about queue_size rendered frames
+    wait for the caller whatever the tasks' length
+    """
+    global _operator, _frame_times
+    ranges = split_frame_ranges(len(frame_times), workers, frames_per_task)
+    workers = min(workers, len(ranges))
+
+    _operator, _frame_times = operator, frame_times
+    # decode the map before forking, not in every worker
+    _ = operator.geo_map.map_pic
+    # the workers dump only the stats they've profiled
+    telemetry.dump_profiles()
+    context = multiprocessing.get_context("fork")
+    queues = [context.Queue(max(1, queue_size // workers)) for _ in range(workers)]
+    processes = [
+        context.Process(target=_render_frame_ranges, args=(ranges[i::workers], queues[i]), daemon=True)
+        for i in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+        for task, (begin, end) in enumerate(ranges):
+            for _ in range(begin, end):
+                yield _get_rendered_frame(processes[task % workers], queues[task % workers])
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        _operator, _frame_times = None, []
+
+
+def split_frame_ranges(
+        frames_count: int,
+        workers: int,
+        frames_per_task: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    [begin, end) frame index ranges, by default each worker gets one range
+    """
+    frames_per_task = frames_per_task or math.ceil(frames_count / workers)
+    frames_per_task = max(1, frames_per_task)
+    return [(begin, min(frames_count, begin + frames_per_task))
+            for begin in range(0, frames_count, frames_per_task)]
+
+
+def _shot_frame_range(frame_range: Tuple[int, int]):
+    begin, end = frame_range
+    _operator._shot_frame_range(_frame_times, begin, end)
+    # the pool's workers exit without the atexit hooks
+    telemetry.dump_profiles()
+
+
+def _render_frame_ranges(frame_ranges: List[Tuple[int, int]], frames: multiprocessing.Queue):
+    try:
+        for i, image in _operator._iter_frame_ranges(_frame_times, frame_ranges):
+            frames.put((i, image))
+        # the forked processes exit without the atexit hooks
+        telemetry.dump_profiles()
+    except BaseException:
+        frames.put(_WorkerError(traceback.format_exc()))
+
+
+def _get_rendered_frame(process: multiprocessing.Process, frames: multiprocessing.Queue) -> Tuple[int, ndarray]:
+    while True:
+        try:
+            frame = frames.get(timeout=WORKER_POLL_SECONDS)
+        except Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"Frame rendering worker exited with code {process.exitcode}")
+            continue
+        if isinstance(frame, _WorkerError):
+            raise RuntimeError(f"Frame rendering worker failed:\n{frame.traceback}")
+        return frame
+
+
+class _WorkerError:
+    def __init__(self, traceback_text: str):
+        self.traceback = traceback_text
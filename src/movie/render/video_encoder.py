@@ -0,0 +1,75 @@
+import queue
+import threading
+from typing import Optional
+
+import cv2
+from numpy import ndarray
+
+from movie.telemetry import telemetry
+
+
+class VideoEncoder:
+    """
+    Writes frames to cv2.VideoWriter in a background thread. The frames
+    are passed through a bounded queue, so the producer blocks when it's
+    queue_size frames ahead of the encoder.
+    """
+    _STOP = None
+
+    def __init__(self, video_path: str, framerate: float, queue_size: int):
+        self.video_path = video_path
+        self.framerate = framerate
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.frames_written = 0
+        self.error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="video-encoder", daemon=True)
+
+    def __enter__(self) -> 'VideoEncoder':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def put(self, frame: ndarray):
+        with telemetry.stage("movie.wait_encoder"):
+            while True:
+                self._raise_on_error()
+                try:
+                    self.queue.put(frame, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put(self._STOP)
+            self._thread.join()
+        self._raise_on_error()
+
+    def _raise_on_error(self):
+        if self.error:
+            raise RuntimeError(f"Video encoding failed: {self.error}") from self.error
+
+    def _run(self):
+        video = None
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is self._STOP:
+                    break
+                if video is None:
+                    height, width = frame.shape[:2]
+                    video = cv2.VideoWriter(
+                        self.video_path, 0, self.framerate, (width, height))
+                with telemetry.stage("movie.encode_frame"):
+                    video.write(frame)
+                self.frames_written += 1
+        except BaseException as e:
+            self.error = e
+            # unblock the producer
+            while not self.queue.empty():
+                self.queue.get_nowait()
+        finally:
+            if video is not None:
+                video.release()
@@ -0,0 +1,164 @@
+import datetime
+import logging
+from typing import Iterator, Optional, List, Tuple
+
+import numpy as np
+
+import pytz
+from numpy import ndarray
+
+from movie.entity.point_batch import PointBatch
+from movie.repository.point_archive import PointArchive
+from movie.repository.track_repository import TrackRepository, LOADING_MODE_HOURLY
+from movie.telemetry import telemetry
+from paths import ARCHIVE_PATH
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveTrackRepository(TrackRepository):
+    """
+    Reads the archived days from the local PointArchive and only the days
+    not archived yet from the DB (through the fallback repository). With
+    write_through the whole days read from the DB that are over are archived.
+    """
+    def __init__(
+            self,
+            archive: PointArchive,
+            fallback: TrackRepository,
+            write_through: bool = False):
+        super().__init__(fallback.engine, fallback.loading_mode, fallback.batch_size)
+        if self.loading_mode == LOADING_MODE_HOURLY:
+            raise ValueError("The hourly loading mode reads the DB rows, use stream or parallel")
+        self.archive = archive
+        self.fallback = fallback
+        self.write_through = write_through
+
+    def iter_point_batches(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Iterator[PointBatch]:
+        for day, run_start, run_end, missing_days in self._split_runs(start, end):
+            if day:
+                yield from self._iter_archived_points(day, run_start, run_end)
+            else:
+                yield from self._iter_db_points(run_start, run_end, missing_days)
+
+    def get_tracker_first_times(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Tuple[ndarray, ndarray]:
+        tracker_ids, first_times = [], []
+        for day, run_start, run_end, _ in self._split_runs(start, end):
+            points = self.archive.read_range(day, run_start, run_end) if day else None
+            if points is None:
+                ids, times = self.fallback.get_tracker_first_times(run_start, run_end)
+            else:
+                # the archived points are ordered by time
+                ids, first_index = np.unique(points.tracker_ids, return_index=True)
+                times = points.times[first_index]
+            tracker_ids.append(ids)
+            first_times.append(times)
+        if not tracker_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return self.order_first_times(np.concatenate(tracker_ids), np.concatenate(first_times))
+
+    def _split_runs(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> List[Tuple[Optional[datetime.date], datetime.datetime,
+                                                  datetime.datetime, List[datetime.date]]]:
+        """
+        [start, end) split into the archived days and the runs of the adjacent
+        days not archived (read with one query): (archived day or None,
+        start, end, the days not archived) tuples
+        """
+        runs = []
+        missing_days: List[datetime.date] = []
+        missing_start: Optional[datetime.datetime] = None
+        for day, day_start, day_end in self.archive.split_days(start, end):
+            if not self.archive.has_day(day):
+                missing_start = missing_start or day_start
+                missing_days.append(day)
+                continue
+            if missing_start:
+                runs.append((None, missing_start, day_start, missing_days))
+                missing_start, missing_days = None, []
+            runs.append((day, day_start, day_end, []))
+        if missing_start:
+            runs.append((None, missing_start, end, missing_days))
+        return runs
+
+    def _iter_archived_points(
+            self,
+            day: datetime.date,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Iterator[PointBatch]:
+        with telemetry.stage("repository.read_archive"):
+            points = self.archive.read_range(day, start, end)
+        if points is None:
+            # the day is being replaced right now
+            logger.info("Reading the archived day from the DB", extra={"day": day.isoformat()})
+            yield from self.fallback.iter_point_batches(start, end)
+            return
+        telemetry.count("repository.archived_points", len(points))
+        for begin in range(0, len(points), self.batch_size):
+            yield PointBatch(
+                points.tracker_ids[begin:begin + self.batch_size],
+                points.times[begin:begin + self.batch_size],
+                points.lats[begin:begin + self.batch_size],
+                points.lons[begin:begin + self.batch_size])
+
+    def _iter_db_points(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime,
+            days: List[datetime.date]) -> Iterator[PointBatch]:
+        logger.info("Reading the days not archived from the DB",
+                    extra={"start": start.isoformat(), "end": end.isoformat()})
+        if not self.write_through:
+            yield from self.fallback.iter_point_batches(start, end)
+            return
+
+        batches = []
+        for batch in self.fallback.iter_point_batches(start, end):
+            batches.append(batch)
+            yield batch
+        self._archive_whole_days(PointBatch.concatenate(batches), start, end, days)
+
+    def _archive_whole_days(
+            self,
+            points: PointBatch,
+            start: datetime.datetime,
+            end: datetime.datetime,
+            days: List[datetime.date]):
+        now = datetime.datetime.now(pytz.utc)
+        for day in days:
+            day_start = datetime.datetime.combine(day, datetime.time(), pytz.utc)
+            day_end = day_start + datetime.timedelta(days=1)
+            if day_start < start or day_end > end or day_end > now:
+                continue
+            selected = (points.times >= day_start.timestamp()) & (points.times < day_end.timestamp())
+            self.archive.write_day(day, PointBatch(
+                points.tracker_ids[selected], points.times[selected],
+                points.lats[selected], points.lons[selected]))
+            logger.info("Day is archived", extra={"day": day.isoformat()})
+
+
+def create_track_repository(engine) -> TrackRepository:
+    """
+    the DB repository, behind the point archive if POINT_ARCHIVE is on
+    (the hourly loading mode always reads the DB, a warning is logged)
+    """
+    repository = TrackRepository(engine)
+    if not settings.POINT_ARCHIVE:
+        return repository
+    if repository.loading_mode == LOADING_MODE_HOURLY:
+        logger.warning("The point archive isn't used by the hourly loading mode, use stream or parallel",
+                       extra={"loading_mode": repository.loading_mode})
+        return repository
+    return ArchiveTrackRepository(
+        PointArchive(settings.POINT_ARCHIVE_PATH or ARCHIVE_PATH),
+        repository,
+        settings.POINT_ARCHIVE_WRITE_THROUGH)
@@ -0,0 +1,38 @@
+import threading
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy.engine import Engine
+
+from settings import settings
+
+
+def create_pooled_engine() -> Engine:
+    """
+    engine with a bounded connection pool, large enough
+    for the parallel track loader's workers
+    """
+    return sqlalchemy.create_engine(
+        settings.db_uri,
+        pool_size=settings.TRACK_LOADING_WORKERS,
+        max_overflow=0)
+
+
+_shared_engine: Optional[Engine] = None
+_shared_engine_lock = threading.Lock()
+
+
+def get_shared_engine() -> Engine:
+    """
+    the app-wide engine: one connection pool (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW
+    connections) shared by all the requests, created on the first call
+    """
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = sqlalchemy.create_engine(
+                settings.db_uri,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+                pool_pre_ping=True)
+        return _shared_engine
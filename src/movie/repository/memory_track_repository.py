@@ -0,0 +1,54 @@
+import datetime
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from movie.entity.point_batch import PointBatch
+from movie.repository.track_repository import TrackRepository, LOADING_MODE_HOURLY, LOADING_MODE_STREAM
+
+
+class MemoryTrackRepository(TrackRepository):
+    """
+    TrackRepository over the points kept in memory instead of the DB
+    (for the benchmarks and running the app without the DB).
+    The points are read in batches of batch_size as from the server-side
+    cursor, so the "stream" and "parallel" loading modes work as with the DB
+    """
+    def __init__(
+            self,
+            points: PointBatch,
+            loading_mode: Optional[str] = None,
+            batch_size: Optional[int] = None):
+        # stream unless told otherwise: the default hourly mode reads the DB rows
+        super().__init__(None, loading_mode or LOADING_MODE_STREAM, batch_size)
+        if self.loading_mode == LOADING_MODE_HOURLY:
+            raise ValueError("The hourly loading mode reads the DB rows, use stream or parallel")
+        # ordered by time and tracker as the DB query does
+        order = np.lexsort((points.tracker_ids, points.times))
+        self.points = PointBatch(
+            points.tracker_ids[order], points.times[order],
+            points.lats[order], points.lons[order])
+
+    def iter_point_batches(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Iterator[PointBatch]:
+        begin, end = np.searchsorted(
+            self.points.times, [start.timestamp(), end.timestamp()], side="left")
+        for batch_begin in range(begin, end, self.batch_size):
+            batch_end = min(end, batch_begin + self.batch_size)
+            yield PointBatch(
+                self.points.tracker_ids[batch_begin:batch_end],
+                self.points.times[batch_begin:batch_end],
+                self.points.lats[batch_begin:batch_end],
+                self.points.lons[batch_begin:batch_end])
+
+    def get_tracker_first_times(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Tuple[ndarray, ndarray]:
+        begin, end = np.searchsorted(
+            self.points.times, [start.timestamp(), end.timestamp()], side="left")
+        tracker_ids, first_index = np.unique(self.points.tracker_ids[begin:end], return_index=True)
+        return self.order_first_times(tracker_ids, self.points.times[begin:end][first_index])
@@ -0,0 +1,100 @@
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Tuple, Callable, Iterator, Optional
+
+from maps.map_descriptor import MapDescriptor
+from movie.entity.point_batch import PointBatch
+from movie.entity.track import TrackBag
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ShardReport:
+    index: int
+    completed: int
+    shards_total: int
+    start: datetime.datetime
+    end: datetime.datetime
+    rows: int
+    seconds: float
+
+
+class ParallelTrackLoader:
+    """
+    Splits [start, end) into shards of shard_hours and fetches them
+    concurrently in a pool of workers threads. The threads share the engine's
+    connection pool, so the engine should be created with pool_size >= workers
+    (see movie.repository.engine.create_pooled_engine).
+    The shards are merged into the TrackBag in time order.
+    """
+    def __init__(
+            self,
+            fetch_points: Callable[[datetime.datetime, datetime.datetime], Iterator[PointBatch]],
+            workers: int,
+            shard_hours: float,
+            on_shard_loaded: Optional[Callable[[ShardReport], None]] = None):
+        """
+        fetch_points reads [start, end) points ordered by time,
+        e.g. TrackRepository.iter_point_batches
+        """
+        self.fetch_points = fetch_points
+        self.workers = workers
+        self.shard_hours = shard_hours
+        self.on_shard_loaded = on_shard_loaded or self._log_shard_report
+
+    def load_tracks(
+            self,
+            map: MapDescriptor,
+            start: datetime.datetime,
+            end: datetime.datetime) -> TrackBag:
+        shards = self.split_shards(start, end)
+        batches: List[Optional[PointBatch]] = [None] * len(shards)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                pool.submit(self._fetch_shard, shard_start, shard_end): i
+                for i, (shard_start, shard_end) in enumerate(shards)}
+            for completed, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                batch, seconds = future.result()
+                batches[i] = batch
+                shard_start, shard_end = shards[i]
+                self.on_shard_loaded(ShardReport(
+                    i + 1, completed, len(shards), shard_start, shard_end, len(batch), seconds))
+
+        tracks = TrackBag()
+        for batch in batches:
+            xs, ys = map.geo_to_canvas_batch(batch.lats, batch.lons)
+            tracks.add_points(batch.tracker_ids, batch.times, xs, ys)
+        return tracks
+
+    def split_shards(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        step = datetime.timedelta(hours=self.shard_hours)
+        shards = []
+        while start < end:
+            shard_end = min(end, start + step)
+            shards.append((start, shard_end))
+            start = shard_end
+        return shards
+
+    def _fetch_shard(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Tuple[PointBatch, float]:
+        started = time.perf_counter()
+        batch = PointBatch.concatenate(list(self.fetch_points(start, end)))
+        return batch, time.perf_counter() - started
+
+    @classmethod
+    def _log_shard_report(cls, report: ShardReport):
+        logger.info("Downloaded shard", extra={
+            "shard": report.index, "start": report.start.isoformat(), "end": report.end.isoformat(),
+            "rows": report.rows, "seconds": round(report.seconds, 2),
+            "completed": report.completed, "shards_total": report.shards_total})
@@ -0,0 +1,113 @@
+import datetime
+import os
+import shutil
+import threading
+from typing import List, Tuple, Optional
+
+import numpy as np
+import pytz
+
+from movie.entity.point_batch import PointBatch
+
+# PointBatch columns, stored as <column>.npy
+ARCHIVE_COLUMNS = ["tracker_ids", "times", "lats", "lons"]
+# the reads of a day that's being replaced are retried that many times
+READ_ATTEMPTS = 3
+
+
+class PointArchive:
+    """
+    Local archive of the raw (not projected) points, one folder per UTC day:
+    <folder>/<yyyy>/<yyyy_mm_dd>/{tracker_ids,times,lats,lons}.npy,
+    the points of a day are ordered by time and tracker.
+
+    The days are read memory-mapped, so reading a range of a day touches
+    only its pages. A day is written to a temp folder and renamed,
+    so a reader never sees a half-written day; a day replaced while it's
+    read is read again (or reported missing).
+    """
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def has_day(self, day: datetime.date) -> bool:
+        return os.path.isdir(self._get_day_folder(day))
+
+    def read_day(self, day: datetime.date) -> Optional[PointBatch]:
+        """
+        the day's points as read-only memory-mapped arrays,
+        None if the day isn't archived
+        """
+        folder = self._get_day_folder(day)
+        for _ in range(READ_ATTEMPTS):
+            try:
+                inode = os.stat(folder).st_ino
+                columns = [np.load(os.path.join(folder, f"{c}.npy"), mmap_mode='r') for c in ARCHIVE_COLUMNS]
+                # the columns are of the same version of the day
+                # if the folder wasn't replaced while they were opened
+                if os.stat(folder).st_ino == inode:
+                    return PointBatch(*columns)
+            except (FileNotFoundError, ValueError):
+                # np.load opens a column twice (the header, the memory map),
+                # a replaced column fails to map
+                if not os.path.isdir(folder):
+                    return None
+        return None
+
+    def read_range(
+            self,
+            day: datetime.date,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Optional[PointBatch]:
+        """
+        the day's points start <= time < end, binary search over the day's times
+        """
+        points = self.read_day(day)
+        if points is None:
+            return None
+        begin, end = np.searchsorted(points.times, [start.timestamp(), end.timestamp()], side="left")
+        return PointBatch(
+            points.tracker_ids[begin:end], points.times[begin:end],
+            points.lats[begin:end], points.lons[begin:end])
+
+    def write_day(self, day: datetime.date, points: PointBatch):
+        """
+        archive the day's points (replacing the archived day if any)
+        """
+        # ordered by time and tracker as the DB query does
+        order = np.lexsort((points.tracker_ids, points.times))
+        folder = self._get_day_folder(day)
+        temp_folder = f"{folder}.{os.getpid()}.{threading.get_ident()}.tmp"
+        old_folder = f"{folder}.{os.getpid()}.{threading.get_ident()}.old"
+        os.makedirs(temp_folder, exist_ok=True)
+        try:
+            for column in ARCHIVE_COLUMNS:
+                np.save(os.path.join(temp_folder, f"{column}.npy"),
+                        np.ascontiguousarray(getattr(points, column)[order]))
+            # the old day is moved aside (a rename, the readers that have it
+            # open keep reading it) and deleted when the new one is in place
+            if os.path.isdir(folder):
+                os.replace(folder, old_folder)
+            os.replace(temp_folder, folder)
+        finally:
+            for leftover in (temp_folder, old_folder):
+                if os.path.isdir(leftover):
+                    shutil.rmtree(leftover)
+
+    @classmethod
+    def split_days(
+            cls,
+            start: datetime.datetime,
+            end: datetime.datetime) -> List[Tuple[datetime.date, datetime.datetime, datetime.datetime]]:
+        """
+        [start, end) split by the UTC day boundaries: (day, start, end) tuples
+        """
+        days = []
+        while start < end:
+            day = start.astimezone(pytz.utc).date()
+            next_day = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(), pytz.utc)
+            days.append((day, start, min(end, next_day)))
+            start = min(end, next_day)
+        return days
+
+    def _get_day_folder(self, day: datetime.date) -> str:
+        return os.path.join(self.folder, f"{day:%Y}", f"{day:%Y_%m_%d}")
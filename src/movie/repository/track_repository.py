@@ -1,34 +1,207 @@
 import datetime
+import logging
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
 
 import pytz
+from numpy import ndarray
 from shapely import wkb
 from shapely.geometry import Point
-from sqlalchemy import select
+from sqlalchemy import select, func, cast, BigInteger
+from sqlalchemy.sql import Select
 
 from maps.map_descriptor import MapDescriptor
 from movie.entity.geolocation import GeoLocation
-from movie.entity.track import TrackBag, TrackPoint
+from movie.entity.point_batch import PointBatch
+from movie.entity.track import TrackBag
+from movie.repository.parallel_track_loader import ParallelTrackLoader
+from movie.telemetry import telemetry
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# one query per hour of the window, the coordinates are parsed from WKB
+LOADING_MODE_HOURLY = "hourly"
+# single server-side cursor query, the coordinates are extracted by the DB
+LOADING_MODE_STREAM = "stream"
+# time shards are fetched concurrently by ParallelTrackLoader
+LOADING_MODE_PARALLEL = "parallel"
 
 
 class TrackRepository:
-    def __init__(self, engine):
+    def __init__(
+            self,
+            engine,
+            loading_mode: Optional[str] = None,
+            batch_size: Optional[int] = None):
         """
         engine could be obtained as
         engine = sqlalchemy.create_engine(settings.db_uri)
+        or, for the parallel loading mode, as
+        engine = create_pooled_engine()
         """
         self.engine = engine
+        self.loading_mode = loading_mode or settings.TRACK_LOADING_MODE
+        self.batch_size = batch_size or settings.TRACK_LOADING_BATCH_SIZE
 
     def load_tracks(
             self,
             map: MapDescriptor,
             start: datetime.datetime,
             end: datetime.datetime) -> TrackBag:
+        if self.loading_mode == LOADING_MODE_STREAM:
+            return self.stream_tracks(map, start, end)
+        if self.loading_mode == LOADING_MODE_PARALLEL:
+            return self.load_tracks_parallel(map, start, end)
+        if self.loading_mode == LOADING_MODE_HOURLY:
+            return self.load_tracks_hourly(map, start, end)
+        raise ValueError(f"Unknown track loading mode: {self.loading_mode}")
+
+    def stream_tracks(
+            self,
+            map: MapDescriptor,
+            start: datetime.datetime,
+            end: datetime.datetime) -> TrackBag:
+        tracks = TrackBag()
+        for batch in self.iter_point_batches(start, end):
+            self.add_batch(tracks, map, batch)
+        return tracks
+
+    def load_tracks_parallel(
+            self,
+            map: MapDescriptor,
+            start: datetime.datetime,
+            end: datetime.datetime,
+            workers: Optional[int] = None,
+            shard_hours: Optional[float] = None) -> TrackBag:
+        loader = ParallelTrackLoader(
+            self.iter_point_batches,
+            workers or settings.TRACK_LOADING_WORKERS,
+            shard_hours or settings.TRACK_LOADING_SHARD_HOURS)
+        return loader.load_tracks(map, start, end)
+
+    def iter_point_batches(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Iterator[PointBatch]:
+        """
+        read [start, end) points ordered by time with a single query,
+        the rows are streamed from a server-side cursor
+        in batches of about batch_size rows (see _iter_whole_seconds)
+        """
+        yield from self._iter_whole_seconds(self._iter_fetched_batches(start, end))
+
+    def _iter_fetched_batches(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Iterator[PointBatch]:
+        query = self._get_points_query(start, end)
+        with self.engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, yield_per=self.batch_size).execute(query)
+            partitions = result.partitions()
+            while True:
+                with telemetry.stage("repository.fetch"):
+                    rows = next(partitions, None)
+                if rows is None:
+                    break
+                with telemetry.stage("repository.parse_rows"):
+                    batch = PointBatch.from_rows(rows)
+                telemetry.count("repository.points", len(batch))
+                yield batch
+
+    @classmethod
+    def _iter_whole_seconds(cls, batches: Iterator[PointBatch]) -> Iterator[PointBatch]:
+        """
+        the batches of points ordered by the exact time (see _get_point_order)
+        reordered by the second and the tracker: the points of the last second
+        of a batch are held back until the next batch, so a second is never
+        split between two batches
+        """
+        held = PointBatch.empty()
+        for batch in batches:
+            batch = PointBatch.concatenate([held, batch])
+            if not len(batch):
+                continue
+            complete, held = batch.split_at(int(np.searchsorted(batch.times, batch.times[-1])))
+            if len(complete):
+                yield complete.sorted_by_time()
+        if len(held):
+            yield held.sorted_by_time()
+
+    def get_tracker_first_times(
+            self,
+            start: datetime.datetime,
+            end: datetime.datetime) -> Tuple[ndarray, ndarray]:
+        """
+        the trackers with points in [start, end) and the times of their first
+        points, in the order the trackers first appear in iter_point_batches
+        """
+        query = self._get_first_times_query(start, end)
+        with telemetry.stage("repository.fetch_first_times"):
+            with self.engine.connect() as conn:
+                rows = conn.execute(query).fetchall()
+        return self.order_first_times(
+            np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype=np.int64))
+
+    @classmethod
+    def _get_points_query(cls, start: datetime.datetime, end: datetime.datetime) -> Select:
+        """
+        (tracker id, epoch seconds, lat, lon) rows of [start, end), the coordinates
+        and the epoch seconds are extracted by the DB
+        """
+        return (
+            select(
+                GeoLocation.tracker_id,
+                cast(func.floor(func.extract("epoch", GeoLocation.time)), BigInteger),
+                func.ST_Y(GeoLocation.coordinates),
+                func.ST_X(GeoLocation.coordinates))
+                .where(GeoLocation.time >= start)
+                .where(GeoLocation.time < end)
+                .order_by(*cls._get_point_order())
+        )
+
+    @classmethod
+    def _get_first_times_query(cls, start: datetime.datetime, end: datetime.datetime) -> Select:
+        """
+        (tracker id, epoch seconds of the first point) rows of [start, end)
+        """
+        first_time = func.min(func.floor(func.extract("epoch", GeoLocation.time)))
+        return (
+            select(GeoLocation.tracker_id, cast(first_time, BigInteger))
+                .where(GeoLocation.time >= start)
+                .where(GeoLocation.time < end)
+                .group_by(GeoLocation.tracker_id)
+        )
+
+    @classmethod
+    def order_first_times(cls, tracker_ids: ndarray, first_times: ndarray) -> Tuple[ndarray, ndarray]:
+        """
+        the earliest time of every tracker (the ids may repeat), ordered by
+        the time and the tracker as the points are (see _get_point_order)
+        """
+        tracker_ids, first_times = tracker_ids.astype(np.int64), first_times.astype(np.int64)
+        order = np.lexsort((first_times, tracker_ids))
+        tracker_ids, first_times = tracker_ids[order], first_times[order]
+        earliest = np.ones(len(tracker_ids), dtype=bool)
+        earliest[1:] = tracker_ids[1:] != tracker_ids[:-1]
+        tracker_ids, first_times = tracker_ids[earliest], first_times[earliest]
+        order = np.lexsort((tracker_ids, first_times))
+        return tracker_ids[order], first_times[order]
+
+    def load_tracks_hourly(
+            self,
+            map: MapDescriptor,
+            start: datetime.datetime,
+            end: datetime.datetime) -> TrackBag:
         tracks = TrackBag()
 
         step, steps_total = 1, round((end - start).total_seconds() / 60 / 60)
 
         while start < end:
-            print(f"Downloading part {step} of {steps_total}")
+            logger.info("Downloading part", extra={"part": step, "parts_total": steps_total})
             step += 1
             query_end = start + datetime.timedelta(hours=1)
             query_end = min(end, query_end)
@@ -36,22 +209,42 @@ class TrackRepository:
                 select(GeoLocation)
                     .where(GeoLocation.time >= start)
                     .where(GeoLocation.time < query_end)
-                    .order_by(GeoLocation.time)
+                    .order_by(*self._get_point_order())
             )
-            result = self.engine.execute(query)
+            with telemetry.stage("repository.fetch"):
+                result_rows = self.engine.execute(query).fetchall()
 
+            rows = []
             row: GeoLocation
-            for row in result.fetchall():
-                coords, track_time, tracker_id = row.coordinates, row.time, row.tracker_id
-                world_point: Point = wkb.loads(bytes(coords.data))
-                canvas_point = map.geo_to_canvas(
-                    (world_point.y, world_point.x))
-                tracks.add_point(TrackPoint(
-                    canvas_coords=canvas_point,
-                    track_time=track_time.astimezone(pytz.utc)
-                ), tracker_id)
+            with telemetry.stage("repository.parse_wkb"):
+                for row in result_rows:
+                    coords, track_time, tracker_id = row.coordinates, row.time, row.tracker_id
+                    world_point: Point = wkb.loads(bytes(coords.data))
+                    rows.append((
+                        tracker_id,
+                        int(track_time.astimezone(pytz.utc).timestamp()),
+                        world_point.y,
+                        world_point.x))
+            telemetry.count("repository.points", len(rows))
+            # the queries start at whole seconds, so a second isn't split between two of them
+            self.add_batch(tracks, map, PointBatch.from_rows(rows).sorted_by_time())
             start = query_end
-        # for track in tracks.track_by_id.values():
-        #     track.points.sort(key=lambda p: p.track_time)
 
         return tracks
+
+    @classmethod
+    def _get_point_order(cls) -> list:
+        """
+        the points are ordered by the time column, so the index on it serves the
+        order. The points of the same second (the precision of the point times)
+        are ordered by the tracker on the client (PointBatch.sorted_by_time): the
+        order doesn't depend on how the time range is split into the queries
+        (TrackBag.select_time_range orders the points the same way)
+        """
+        return [GeoLocation.time, GeoLocation.tracker_id, GeoLocation.id]
+
+    @classmethod
+    def add_batch(cls, tracks: TrackBag, map: MapDescriptor, batch: PointBatch):
+        with telemetry.stage("repository.projection"):
+            xs, ys = map.geo_to_canvas_batch(batch.lats, batch.lons)
+        tracks.add_points(batch.tracker_ids, batch.times, xs, ys)
@@ -1,9 +1,12 @@
 import datetime
 import time
 
+import numpy as np
 import pytz
+from numpy import ndarray
 
 START_DATE = datetime.datetime(2016, 1, 1, 0, 0, 0, 0, pytz.UTC)
+START_TIMESTAMP = int(START_DATE.timestamp())
 
 
 def time_to_minutes(t: datetime.datetime) -> int:
@@ -12,3 +15,10 @@ def time_to_minutes(t: datetime.datetime) -> int:
 
 def time_to_timespan(t: datetime.datetime) -> int:
     return int(time.mktime(t.timetuple()))
+
+
+def epochs_to_minutes(times: ndarray) -> ndarray:
+    """
+    vectorized time_to_minutes for epoch seconds
+    """
+    return (np.asarray(times, dtype=np.int64) - START_TIMESTAMP) // 60
@@ -1,37 +1,48 @@
+from typing import Iterator
+
+import numpy as np
+
 from maps.map_descriptor import MapDescriptor
 from movie.entity.track import TrackBag, Track
-from movie.serializer.time_conversion import time_to_minutes
+from movie.serializer.time_conversion import epochs_to_minutes
+from movie.telemetry import telemetry
 
 
 class TrackBagJsonSerializer:
     @classmethod
     def serialize(cls, map: MapDescriptor, track_bag: TrackBag) -> str:
-        data = ""
+        return "".join(cls.iter_serialize(map, track_bag))
+
+    @classmethod
+    def iter_serialize(cls, map: MapDescriptor, track_bag: TrackBag) -> Iterator[str]:
+        """
+        serialize the bag track by track, yields one chunk per track
+        """
         for i, track in track_bag.track_by_id.items():
-            data += cls.serialize_track(map, i, track)
-        return data
+            with telemetry.stage("serializer.serialize_track"):
+                chunk = cls.serialize_track(map, i, track)
+            if chunk:
+                yield chunk
 
     @classmethod
     def serialize_track(cls, map: MapDescriptor, track_id: int, track: Track) -> str:
-        if not track.points:
+        if not len(track):
             return ""
-        str_data = f"{track_id},"
-        prev_minute = 0
-        last_coords = None
-
-        for p in track.points:
-            minute = time_to_minutes(p.track_time)
-            time_delta = minute - prev_minute
-
-            prev_minute = minute
-
-            xy = round(p.canvas_coords[0]), round(p.canvas_coords[1])
-            if last_coords and map.is_leap(xy, last_coords):
-                # there's a sudden leap from one geo point to another
-                # we'll insert an empty point as an indication of this anomaly
-                str_data += f"{time_delta},0,0,"
-            last_coords = xy
-
-            str_data += f"{time_delta},{xy[0]},{xy[1]},"
-        str_data += "#"
-        return str_data
+        xy = track.integer_xy_coords
+        minutes = epochs_to_minutes(track.times)
+        time_deltas = np.diff(minutes, prepend=0)
+        leaps = map.leap_indices(xy)
+
+        # each point is a (time_delta, x, y) triple. If there's a sudden leap
+        # from one geo point to another we insert an empty point (time_delta, 0, 0)
+        # before it as an indication of this anomaly
+        shifts = np.zeros(len(minutes), dtype=np.int64)
+        shifts[leaps] = 1
+        point_rows = np.arange(len(minutes)) + np.cumsum(shifts)
+        rows = np.zeros((len(minutes) + len(leaps), 3), dtype=np.int64)
+        rows[point_rows, 0] = time_deltas
+        rows[point_rows, 1:] = xy
+        rows[point_rows[leaps] - 1, 0] = time_deltas[leaps]
+
+        values = ",".join([str(v) for v in rows.ravel().tolist()])
+        return f"{track_id},{values},#"
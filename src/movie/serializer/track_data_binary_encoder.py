@@ -0,0 +1,83 @@
+from typing import List
+
+import numpy as np
+from numpy import ndarray
+
+# MIME type of the packed binary track data
+BINARY_TRACK_DATA_MIMETYPE = "application/octet-stream"
+
+
+class TrackDataBinaryEncoder:
+    """
+    Packs the text track data (see TrackBagJsonSerializer and
+    PageDataSource._get_data_timings) into a stream of zig-zag LEB128 varints:
+    - start timestamp, end timestamp, start minute, end minute
+    - for each track: track id, number of points N,
+      then N times (time_delta, dx, dy), where dx, dy are the differences
+      from the previous point's x, y (the first point's from 0, 0).
+    The empty points marking the leaps are encoded as regular points.
+    Decoded by BinaryTrackParser (static/js/binary_parser.js).
+    """
+    HEADER_VALUES = 4
+
+    @classmethod
+    def encode(cls, text_data: str) -> bytes:
+        header = text_data.split(",", cls.HEADER_VALUES)
+        values = [np.array(header[:cls.HEADER_VALUES], dtype=np.int64)]
+        values += cls._get_tracks_values(header[cls.HEADER_VALUES])
+        return encode_varints(np.concatenate(values))
+
+    @classmethod
+    def encode_header(cls, header_data: str) -> bytes:
+        """
+        encode the timings header only ("start_ts,end_ts,start_min,end_min,")
+        """
+        header = header_data.split(",")[:cls.HEADER_VALUES]
+        return encode_varints(np.array(header, dtype=np.int64))
+
+    @classmethod
+    def encode_tracks(cls, tracks_data: str) -> bytes:
+        """
+        encode the tracks only (no header), the result can be appended to
+        the encoded header or to the other encoded tracks
+        """
+        values = cls._get_tracks_values(tracks_data)
+        if not values:
+            return b""
+        return encode_varints(np.concatenate(values))
+
+    @classmethod
+    def _get_tracks_values(cls, tracks_data: str) -> List[ndarray]:
+        values = []
+        for track_str in tracks_data.split("#")[:-1]:
+            track_values = np.array(track_str[:-1].split(","), dtype=np.int64)
+            points = track_values[1:].reshape((-1, 3))
+            packed = np.empty_like(points)
+            packed[:, 0] = points[:, 0]
+            packed[:, 1] = np.diff(points[:, 1], prepend=0)
+            packed[:, 2] = np.diff(points[:, 2], prepend=0)
+            values.append(np.array([track_values[0], len(points)], dtype=np.int64))
+            values.append(packed.ravel())
+        return values
+
+
+def encode_varints(values: ndarray) -> bytes:
+    """
+    zig-zag + LEB128 encode signed integers (7 bits per byte,
+    the high bit tells there's one more byte)
+    """
+    values = np.asarray(values, dtype=np.int64)
+    zigzag = ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+    byte_counts = np.ones(len(zigzag), dtype=np.int64)
+    rest = zigzag >> np.uint64(7)
+    while rest.any():
+        byte_counts += rest > 0
+        rest >>= np.uint64(7)
+
+    max_bytes = int(byte_counts.max()) if len(byte_counts) else 1
+    byte_positions = np.arange(max_bytes)
+    shifts = (byte_positions * 7).astype(np.uint64)
+    groups = ((zigzag[:, np.newaxis] >> shifts) & np.uint64(0x7f)).astype(np.uint8)
+    groups[byte_positions < byte_counts[:, np.newaxis] - 1] |= 0x80
+    return groups[byte_positions < byte_counts[:, np.newaxis]].tobytes()
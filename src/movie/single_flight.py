@@ -0,0 +1,51 @@
+import threading
+from typing import Callable, Dict, Hashable, Optional, TypeVar, Generic
+
+T = TypeVar('T')
+
+
+class _Call(Generic[T]):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces the concurrent calls for the same key: the first caller
+    runs the function, the callers coming while it runs wait for
+    and share its result (or its exception).
+    The result isn't kept after the call is over.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.coalesced_calls = 0
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced_calls += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,138 @@
+import datetime
+from typing import Optional
+
+import numpy as np
+from numpy import ndarray
+
+from maps.map_descriptor import MapDescriptor
+from movie.entity.point_batch import PointBatch
+from movie.entity.track import TrackBag
+from movie.entity.visual_settings import TrackColorMap
+from movie.repository.track_repository import TrackRepository
+from movie.telemetry import telemetry
+
+
+class SlidingTrackWindow:
+    """
+    The points the frames need, loaded forward in time as the frames advance:
+    advance_to(frame_time) reads the repository up to the frame (by chunks of
+    chunk_seconds) and evicts the points older than window_seconds before it,
+    so the memory is bounded by the window rather than by the movie length.
+
+    The returned bag holds the window's points with the trackers in the order
+    they first appeared since the movie start (not since the window start),
+    so the tracks are drawn in the same order as from the bag loaded for
+    the whole movie. The order is read once for the movie
+    (TrackRepository.get_tracker_first_times) and shared by the windows.
+    """
+    def __init__(
+            self,
+            repository: TrackRepository,
+            geo_map: MapDescriptor,
+            color_map: TrackColorMap,
+            start: datetime.datetime,
+            end: datetime.datetime,
+            window_seconds: float,
+            chunk_seconds: float,
+            tracker_order: ndarray):
+        """
+        [start, end) is the movie's time range, the points outside it aren't loaded,
+        tracker_order is the movie's trackers in their first appearance order
+        """
+        self.repository = repository
+        self.geo_map = geo_map
+        self.color_map = color_map
+        self.start = start
+        self.end = end
+        self.window_seconds = window_seconds
+        self.chunk_seconds = chunk_seconds
+
+        self.loaded_end: Optional[datetime.datetime] = None
+        self._tracker_ids = np.empty(0, dtype=np.int64)
+        self._times = np.empty(0, dtype=np.int64)
+        self._xs = np.empty(0, dtype=np.float32)
+        self._ys = np.empty(0, dtype=np.float32)
+        # the trackers (sorted) and their first appearance ranks
+        tracker_order = np.asarray(tracker_order, dtype=np.int64)
+        order = np.argsort(tracker_order)
+        self._known_ids = tracker_order[order]
+        self._known_ranks = np.arange(len(tracker_order), dtype=np.int64)[order]
+        self._track_bag: Optional[TrackBag] = None
+
+    @property
+    def points_count(self) -> int:
+        return len(self._times)
+
+    def advance_to(self, frame_time: datetime.datetime) -> TrackBag:
+        """
+        the bag with the points window_start <= time <= frame_time
+        (and maybe some points of the chunk after the frame)
+        """
+        window_start = frame_time - datetime.timedelta(seconds=self.window_seconds)
+        if self.loaded_end is None:
+            # the first frame (or the first frame of a worker's range)
+            self.loaded_end = max(self.start, window_start)
+        while self.loaded_end <= frame_time and self.loaded_end < self.end:
+            chunk_end = min(self.end, self.loaded_end + datetime.timedelta(seconds=self.chunk_seconds))
+            self._load(self.loaded_end, chunk_end)
+            self.loaded_end = chunk_end
+        self._evict(window_start.timestamp())
+
+        if self._track_bag is None:
+            self._track_bag = self._build_track_bag()
+        return self._track_bag
+
+    def _load(self, start: datetime.datetime, end: datetime.datetime):
+        with telemetry.stage("movie.window_load"):
+            batches = list(self.repository.iter_point_batches(start, end))
+            points = PointBatch.concatenate(batches)
+        if not len(points):
+            return
+        with telemetry.stage("repository.projection"):
+            xs, ys = self.geo_map.geo_to_canvas_batch(points.lats, points.lons)
+        self._rank_trackers(points.tracker_ids)
+        self._tracker_ids = np.concatenate([self._tracker_ids, points.tracker_ids.astype(np.int64)])
+        self._times = np.concatenate([self._times, points.times.astype(np.int64)])
+        self._xs = np.concatenate([self._xs, np.asarray(xs, dtype=np.float32)])
+        self._ys = np.concatenate([self._ys, np.asarray(ys, dtype=np.float32)])
+        self._track_bag = None
+
+    def _evict(self, window_start: float):
+        kept = self._times >= window_start
+        if kept.all():
+            return
+        telemetry.count("movie.window_evicted_points", len(kept) - np.count_nonzero(kept))
+        self._tracker_ids = self._tracker_ids[kept]
+        self._times = self._times[kept]
+        self._xs = self._xs[kept]
+        self._ys = self._ys[kept]
+        self._track_bag = None
+
+    def _rank_trackers(self, tracker_ids: ndarray):
+        """
+        give the trackers missing in the movie's order (their points were added
+        after it was read) the next ranks, the points come ordered by time
+        """
+        unique_ids, first_index = np.unique(tracker_ids, return_index=True)
+        is_new = ~np.isin(unique_ids, self._known_ids)
+        new_ids = unique_ids[is_new][np.argsort(first_index[is_new])]
+        if not len(new_ids):
+            return
+        ranks = np.concatenate([
+            self._known_ranks,
+            np.arange(len(new_ids), dtype=np.int64) + len(self._known_ids)])
+        ids = np.concatenate([self._known_ids, new_ids.astype(np.int64)])
+        order = np.argsort(ids)
+        self._known_ids, self._known_ranks = ids[order], ranks[order]
+
+    def _build_track_bag(self) -> TrackBag:
+        with telemetry.stage("movie.window_build_bag"):
+            ranks = self._known_ranks[np.searchsorted(self._known_ids, self._tracker_ids)]
+            # grouped by the rank: the bag keeps the trackers' first appearance order
+            order = np.lexsort((self._times, ranks))
+            bag = TrackBag()
+            bag.add_points(self._tracker_ids[order], self._times[order],
+                           self._xs[order], self._ys[order])
+            bag.colorize(self.color_map)
+            _ = bag.points_count
+        return bag
@@ -0,0 +1,234 @@
+import atexit
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set
+
+from paths import OUTPUT_PATH
+from settings import settings
+
+# the Prometheus metrics' names prefix
+METRICS_PREFIX = "cargo"
+
+# LogRecord's own attributes, the rest are the fields passed as extra={...}
+_LOG_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class StageTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+class TelemetryRecord:
+    """
+    the counters and the stage timers added while the record is active
+    """
+    def __init__(self):
+        self.counters: Dict[str, float] = {}
+        self.timers: Dict[str, StageTimer] = {}
+
+    def add_count(self, name: str, value: float):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_stage(self, name: str, seconds: float):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = StageTimer()
+        timer.add(seconds)
+
+    def get_summary(self) -> Dict[str, Dict]:
+        return {
+            "counters": dict(self.counters),
+            "stages": {
+                name: {"count": t.count, "seconds": t.seconds, "max_seconds": t.max_seconds}
+                for name, t in self.timers.items()
+            }
+        }
+
+    def write_summary(self, file_path: str):
+        with open(file_path, "w") as f:
+            json.dump(self.get_summary(), f, indent=2, sort_keys=True)
+
+
+class Telemetry:
+    """
+    Process-wide counters and stage timers:
+
+        with telemetry.stage("movie.render_frame"):
+            ...
+        telemetry.count("cache.hits")
+
+    The process-wide values only grow (they're exported as the Prometheus
+    counters), the values of a single run are collected with a record:
+
+        with telemetry.record() as record:
+            ...
+        record.write_summary(file_path)
+
+    The stages listed in PROFILE_STAGES ("*" for all) are also profiled with
+    cProfile, the stats accumulated by a stage are dumped to
+    PROFILE_PATH/<stage>.prof by dump_profiles() (and at the process exit),
+    the other processes (the forked workers) write <stage>.<pid>.prof.
+
+    The values are per process: the frames rendered by the worker processes
+    (RenderSettings.workers > 1) are counted in the workers.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = TelemetryRecord()
+        self._records: List[TelemetryRecord] = []
+        self._profiles: Dict[str, cProfile.Profile] = {}
+        # the profiles with the stats not dumped yet
+        self._undumped_profiles: Set[str] = set()
+        self._profiled_stages: Set[str] = {
+            s.strip() for s in settings.PROFILE_STAGES.split(",") if s.strip()}
+        # one profiler at a time: the nested and the concurrent
+        # stages aren't profiled while a stage is
+        self._profiling = False
+        self._pid = os.getpid()
+        if self._profiled_stages:
+            atexit.register(self.dump_profiles)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self._totals.add_count(name, value)
+            for record in self._records:
+                record.add_count(name, value)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        profile = self._start_profile(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if profile:
+                self._stop_profile(name, profile)
+            with self._lock:
+                self._totals.add_stage(name, seconds)
+                for record in self._records:
+                    record.add_stage(name, seconds)
+
+    @contextmanager
+    def record(self) -> Iterator[TelemetryRecord]:
+        """
+        the values added (by any thread of the process) within the block
+        """
+        record = TelemetryRecord()
+        with self._lock:
+            self._records.append(record)
+        try:
+            yield record
+        finally:
+            with self._lock:
+                self._records.remove(record)
+
+    def get_summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            return self._totals.get_summary()
+
+    def write_summary(self, file_path: str):
+        summary = self.get_summary()
+        with open(file_path, "w") as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+    def dump_profiles(self):
+        """
+        write the stats of the profiled stages, the stage being profiled
+        right now is written by the next call
+        """
+        with self._lock:
+            if self._profiling or not self._undumped_profiles:
+                return
+            folder = settings.PROFILE_PATH or os.path.join(OUTPUT_PATH, "profiles")
+            if not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            suffix = "" if os.getpid() == self._pid else f".{os.getpid()}"
+            for name in sorted(self._undumped_profiles):
+                self._profiles[name].dump_stats(os.path.join(folder, f"{name}{suffix}.prof"))
+            self._undumped_profiles.clear()
+
+    def render_prometheus(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """
+        the metrics in the Prometheus text exposition format,
+        gauges are the extra values sampled by the caller
+        """
+        summary = self.get_summary()
+        lines = []
+        for name, value in sorted(summary["counters"].items()):
+            metric = f"{METRICS_PREFIX}_{self._get_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+
+        if summary["stages"]:
+            metric = f"{METRICS_PREFIX}_stage_seconds"
+            lines += [f"# TYPE {metric} summary"]
+            for name, stage in sorted(summary["stages"].items()):
+                lines += [f'{metric}_count{{stage="{name}"}} {stage["count"]}',
+                          f'{metric}_sum{{stage="{name}"}} {stage["seconds"]}']
+            lines += [f"# TYPE {metric}_max gauge"]
+            for name, stage in sorted(summary["stages"].items()):
+                lines += [f'{metric}_max{{stage="{name}"}} {stage["max_seconds"]}']
+
+        for name, value in sorted((gauges or {}).items()):
+            metric = f"{METRICS_PREFIX}_{self._get_metric_name(name)}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def _start_profile(self, name: str) -> Optional[cProfile.Profile]:
+        if not self._profiled_stages:
+            return None
+        if name not in self._profiled_stages and "*" not in self._profiled_stages:
+            return None
+        with self._lock:
+            if self._profiling:
+                return None
+            self._profiling = True
+            profile = self._profiles.get(name)
+            if profile is None:
+                profile = self._profiles[name] = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def _stop_profile(self, name: str, profile: cProfile.Profile):
+        profile.disable()
+        with self._lock:
+            self._undumped_profiles.add(name)
+            self._profiling = False
+
+    @classmethod
+    def _get_metric_name(cls, name: str) -> str:
+        return "".join(c if c.isalnum() else "_" for c in name)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    appends the fields passed to the logger as extra={...} to the message:
+    "Filming frame frame=12 frames_total=96"
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _LOG_RECORD_ATTRIBUTES}
+        if not fields:
+            return message
+        return message + " " + " ".join(f"{k}={v}" for k, v in fields.items())
+
+
+def configure_logging(level: int = logging.INFO):
+    handler = logging.StreamHandler()
+    handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logging.basicConfig(level=level, handlers=[handler])
+
+
+telemetry = Telemetry()
@@ -0,0 +1,131 @@
+from typing import Iterator, Tuple, List
+
+import numpy as np
+from numpy import ndarray
+
+# (x_min, y_min, x_max, y_max) in canvas coords
+BBox = Tuple[float, float, float, float]
+
+
+class TrackGridIndex:
+    """
+    Spatial index over the serialized track data (see TrackBagJsonSerializer).
+    The track points are bucketed by the cells of a square grid over the
+    canvas: for each cell the index keeps the sorted range of the points
+    falling into it, the points are numbered across the tracks, so a point
+    maps back to its track and its row in the data.
+
+    The index is built once per cached period, a bounding box query
+    reads only the cells the box covers.
+    """
+    def __init__(self, tracks_data: str, cell_size_px: int):
+        self.cell_size_px = cell_size_px
+        track_ids, track_rows = [], []
+        for track_str in tracks_data.split("#")[:-1]:
+            track_values = np.array(track_str[:-1].split(","), dtype=np.int64)
+            track_ids.append(track_values[0])
+            track_rows.append(track_values[1:].reshape((-1, 3)))
+        self.track_ids = np.array(track_ids, dtype=np.int64)
+
+        # the point times as the page computes them: cumulative per track
+        # over all the rows (the leap markers included)
+        rows = np.concatenate(track_rows) if track_rows else np.empty((0, 3), dtype=np.int64)
+        row_counts = np.array([len(r) for r in track_rows], dtype=np.int64)
+        row_track = np.repeat(np.arange(len(track_rows)), row_counts)
+        track_row_begins = np.cumsum(row_counts) - row_counts
+        cumulative = np.cumsum(rows[:, 0])
+        track_base = np.concatenate([[0], cumulative])[track_row_begins]
+        minutes = cumulative - np.repeat(track_base, row_counts)
+
+        # the leap markers are (time delta, 0, 0)
+        is_marker = (rows[:, 1] == 0) & (rows[:, 2] == 0)
+        point_rows = np.flatnonzero(~is_marker)
+        self.point_track = row_track[point_rows]
+        self.point_minutes = minutes[point_rows]
+        self.point_xs = rows[point_rows, 1]
+        self.point_ys = rows[point_rows, 2]
+        # the line doesn't connect the point to the previous one:
+        # a track's first point or a point after a leap marker
+        self.point_breaks = np.ones(len(point_rows), dtype=bool)
+        self.point_breaks[1:] = (np.diff(point_rows) > 1) | (np.diff(self.point_track) != 0)
+
+        cells = self._get_cells(self.point_xs, self.point_ys)
+        self.cell_order = np.argsort(cells, kind='stable')
+        self.sorted_cells = cells[self.cell_order]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in [
+            self.track_ids, self.point_track, self.point_minutes, self.point_xs,
+            self.point_ys, self.point_breaks, self.cell_order, self.sorted_cells])
+
+    def iter_serialize_bbox(self, bbox: BBox) -> Iterator[str]:
+        """
+        serialize the parts of the tracks within the bounding box, one chunk
+        per track in the data's format. The parts are extended by one point
+        on each side, so the lines crossing the box edges are kept.
+        The parts of a track are separated by the leap markers (0, 0, 0)
+        """
+        points = self.query_bbox(bbox)
+        if not len(points):
+            return
+        track_bounds = np.flatnonzero(np.diff(self.point_track[points])) + 1
+        for track_points in np.split(points, track_bounds):
+            track_id = self.track_ids[self.point_track[track_points[0]]]
+            yield self._serialize_track(track_id, track_points)
+
+    def query_bbox(self, bbox: BBox) -> ndarray:
+        """
+        sorted indices of the points within the box and their line neighbours
+        """
+        x_min, y_min, x_max, y_max = bbox
+        col_min, col_max = int(max(0, x_min) // self.cell_size_px), int(max(0, x_max) // self.cell_size_px)
+        row_min, row_max = int(max(0, y_min) // self.cell_size_px), int(max(0, y_max) // self.cell_size_px)
+
+        candidates: List[ndarray] = []
+        for row in range(row_min, row_max + 1):
+            # the cells of a grid row make a continuous range of the sorted cells
+            begin = np.searchsorted(self.sorted_cells, self._get_cell(col_min, row), side="left")
+            end = np.searchsorted(self.sorted_cells, self._get_cell(col_max, row), side="right")
+            candidates.append(self.cell_order[begin:end])
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        hits = np.concatenate(candidates)
+        hits = hits[(self.point_xs[hits] >= x_min) & (self.point_xs[hits] <= x_max) &
+                    (self.point_ys[hits] >= y_min) & (self.point_ys[hits] <= y_max)]
+
+        selected = np.zeros(len(self.point_xs), dtype=bool)
+        selected[hits] = True
+        # the neighbours on the same line
+        previous = hits[~self.point_breaks[hits]] - 1
+        selected[previous] = True
+        following = hits[hits + 1 < len(selected)] + 1
+        selected[following[~self.point_breaks[following]]] = True
+        return np.flatnonzero(selected)
+
+    def _serialize_track(self, track_id: int, points: ndarray) -> str:
+        # the deltas are recomputed from the page's times, so the page gets
+        # the same times for the points; the marker has zero delta
+        minutes = self.point_minutes[points]
+        time_deltas = np.diff(minutes, prepend=0)
+        breaks = np.zeros(len(points), dtype=bool)
+        breaks[1:] = (np.diff(points) > 1) | self.point_breaks[points[1:]]
+
+        rows = np.zeros((len(points) + np.count_nonzero(breaks), 3), dtype=np.int64)
+        point_rows = np.arange(len(points)) + np.cumsum(breaks)
+        rows[point_rows, 0] = time_deltas
+        rows[point_rows, 1] = self.point_xs[points]
+        rows[point_rows, 2] = self.point_ys[points]
+
+        values = ",".join([str(v) for v in rows.ravel().tolist()])
+        return f"{track_id},{values},#"
+
+    def _get_cells(self, xs: ndarray, ys: ndarray) -> ndarray:
+        cols = np.maximum(xs, 0) // self.cell_size_px
+        rows = np.maximum(ys, 0) // self.cell_size_px
+        return self._get_cell(cols, rows)
+
+    @classmethod
+    def _get_cell(cls, col, row):
+        # the columns are limited by the canvas width, 2 ** 20 is plenty
+        return row * (1 << 20) + col
@@ -0,0 +1,107 @@
+import logging
+from typing import Dict, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+from maps.map_descriptor import MapDescriptor
+from movie.entity.track import TrackBag, Track
+
+logger = logging.getLogger(__name__)
+
+
+class TrackSimplifier:
+    """
+    Drops the points that don't change the tracks as drawn on the canvas:
+    - the points within a run of points falling into the same pixel
+      (the first and the last points of the run are kept)
+    - the points closer than tolerance_px to the line through the kept points
+      (Douglas-Peucker, applied to each segment between the leaps)
+    The kept points keep their times, so the playback timing stays the same.
+    Two adjacent kept points are never further apart than the map's leap
+    distance, so no new leaps appear.
+    """
+    def __init__(self, geo_map: MapDescriptor, tolerance_px: float):
+        self.geo_map = geo_map
+        self.tolerance_px = tolerance_px
+
+    def simplify(self, track_bag: TrackBag) -> Tuple[TrackBag, Dict[int, int]]:
+        """
+        returns the new bag and the number of the points removed per tracker id
+        """
+        keep = np.zeros(track_bag.points_count, dtype=bool)
+        removed_by_track = {}
+        for track_id, (begin, end) in track_bag.offsets.items():
+            track_keep = self.get_kept_points_mask(track_bag.track_by_id[track_id])
+            keep[begin:end] = track_keep
+            removed_by_track[track_id] = int(len(track_keep) - np.count_nonzero(track_keep))
+
+        simplified = TrackBag()
+        simplified.add_points(track_bag.tracker_ids[keep], track_bag.times[keep],
+                              track_bag.xs[keep], track_bag.ys[keep])
+        removed_total = sum(removed_by_track.values())
+        logger.info("Simplified tracks", extra={
+            "tracks": len(removed_by_track), "points_removed": removed_total, "points_total": len(keep)})
+        for track_id, removed in removed_by_track.items():
+            logger.debug("Simplified track", extra={"track": track_id, "points_removed": removed})
+        return simplified, removed_by_track
+
+    def get_kept_points_mask(self, track: Track) -> ndarray:
+        xy = track.integer_xy_coords
+        keep = self._get_pixel_run_ends_mask(xy)
+        kept_indices = np.flatnonzero(keep)
+        xs = track.xs[kept_indices].astype(np.float64)
+        ys = track.ys[kept_indices].astype(np.float64)
+
+        # leaps are preserved: the line is simplified between them
+        leaps = self.geo_map.leap_indices(xy[kept_indices])
+        bounds = np.concatenate([[0], leaps, [len(kept_indices)]])
+        segment_keep = np.zeros(len(kept_indices), dtype=bool)
+        for begin, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            segment_keep[begin:end] = self._douglas_peucker(xs[begin:end], ys[begin:end])
+
+        keep[kept_indices[~segment_keep]] = False
+        return keep
+
+    @classmethod
+    def _get_pixel_run_ends_mask(cls, xy: ndarray) -> ndarray:
+        """
+        mask of the points except the inner points of the runs of the same pixel
+        """
+        keep = np.ones(len(xy), dtype=bool)
+        if len(xy) < 3:
+            return keep
+        same_as_next = np.all(xy[1:] == xy[:-1], axis=1)
+        keep[1:-1] = ~(same_as_next[:-1] & same_as_next[1:])
+        return keep
+
+    def _douglas_peucker(self, xs: ndarray, ys: ndarray) -> ndarray:
+        keep = np.zeros(len(xs), dtype=bool)
+        if not len(xs):
+            return keep
+        keep[0] = keep[-1] = True
+        tolerance_square = self.tolerance_px ** 2
+        max_gap_square = self.geo_map.leap_dist_px_square
+
+        ranges = [(0, len(xs) - 1)]
+        while ranges:
+            begin, end = ranges.pop()
+            if end - begin < 2:
+                continue
+            # squared distances from the inner points to the segment [begin, end]
+            dx, dy = xs[end] - xs[begin], ys[end] - ys[begin]
+            px, py = xs[begin + 1:end] - xs[begin], ys[begin + 1:end] - ys[begin]
+            segment_square = dx * dx + dy * dy
+            if segment_square > 0:
+                t = np.clip((px * dx + py * dy) / segment_square, 0, 1)
+                px, py = px - t * dx, py - t * dy
+            distances_square = px * px + py * py
+
+            farthest = int(np.argmax(distances_square))
+            if distances_square[farthest] <= tolerance_square and segment_square <= max_gap_square:
+                continue
+            split = begin + 1 + farthest
+            keep[split] = True
+            ranges.append((begin, split))
+            ranges.append((split, end))
+        return keep
@@ -4,3 +4,4 @@ BASE_PATH = os.path.dirname(os.path.realpath(__file__))
 IMAGES_PATH = os.path.join(BASE_PATH, "img")
 OUTPUT_PATH = os.path.join(BASE_PATH, "..", "output")
 CACHE_PATH = os.path.join(BASE_PATH, "..", "cache")
+ARCHIVE_PATH = os.path.join(BASE_PATH, "..", "archive")
@@ -14,6 +14,61 @@ class AppSettings:
     DB_NAME = os.getenv("DB_NAME")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+    # "hourly" (a query per hour), "stream" (single server-side cursor query)
+    # or "parallel" (time shards fetched concurrently). The stream and parallel
+    # modes take the epoch seconds from the DB, which reads the timestamps without
+    # a time zone as UTC, while the hourly mode converts them in the local time zone
+    TRACK_LOADING_MODE = os.getenv("TRACK_LOADING_MODE", "hourly")
+    # rows fetched from the server-side cursor at once
+    TRACK_LOADING_BATCH_SIZE = int(os.getenv("TRACK_LOADING_BATCH_SIZE", "50000"))
+    # parallel loading mode: threads (and pooled DB connections) and shard length
+    TRACK_LOADING_WORKERS = int(os.getenv("TRACK_LOADING_WORKERS", "4"))
+    TRACK_LOADING_SHARD_HOURS = float(os.getenv("TRACK_LOADING_SHARD_HOURS", "6"))
+
+    # drop the points that don't change the tracks as drawn on the page's map
+    # (see TrackSimplifier), the tolerance is in canvas pixels; off by default
+    # since the output is no longer byte-identical to the raw points
+    TRACK_SIMPLIFY = os.getenv("TRACK_SIMPLIFY", "0") == "1"
+    TRACK_SIMPLIFY_TOLERANCE_PX = float(os.getenv("TRACK_SIMPLIFY_TOLERANCE_PX", "0.5"))
+
+    # page data cache: in-memory LRU budget and how often the list
+    # of the cached intervals is re-read from the cache folder
+    PAGE_CACHE_MEMORY_MB = float(os.getenv("PAGE_CACHE_MEMORY_MB", "256"))
+    PAGE_CACHE_INDEX_TTL_SECONDS = float(os.getenv("PAGE_CACHE_INDEX_TTL_SECONDS", "60"))
+    # cell size (canvas pixels) of the spatial index answering the bbox queries
+    TRACK_GRID_CELL_PX = int(os.getenv("TRACK_GRID_CELL_PX", "32"))
+    # Cache-Control max-age of the cached /track_data/ responses
+    TRACK_DATA_MAX_AGE_SECONDS = int(os.getenv("TRACK_DATA_MAX_AGE_SECONDS", "3600"))
+
+    # page data loads from the DB running at once (the other cache
+    # misses wait), the concurrent requests for the same range share one load
+    PAGE_DATA_MAX_CONCURRENT_LOADS = int(os.getenv("PAGE_DATA_MAX_CONCURRENT_LOADS", "2"))
+    # the web app's connection pool, by default enough for the concurrent
+    # loads in the parallel loading mode
+    DB_POOL_SIZE = int(os.getenv(
+        "DB_POOL_SIZE", str(TRACK_LOADING_WORKERS * PAGE_DATA_MAX_CONCURRENT_LOADS)))
+    DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "0"))
+
+    # cache warm-up: the background thread in the web app (off by default, see also
+    # warm_cache.py), how often it runs, how many latest page periods it caches
+    # and the extra ranges to cache ("2022-10-10/2022-10-24,...")
+    CACHE_WARMUP_ENABLED = os.getenv("CACHE_WARMUP_ENABLED", "0") == "1"
+    CACHE_WARMUP_INTERVAL_SECONDS = float(os.getenv("CACHE_WARMUP_INTERVAL_SECONDS", "3600"))
+    CACHE_WARMUP_PERIODS = int(os.getenv("CACHE_WARMUP_PERIODS", "2"))
+    CACHE_WARMUP_RANGES = os.getenv("CACHE_WARMUP_RANGES", "")
+
+    # comma separated telemetry stages profiled with cProfile ("*" for all),
+    # the stats are written to PROFILE_PATH (OUTPUT_PATH/profiles by default)
+    PROFILE_STAGES = os.getenv("PROFILE_STAGES", "")
+    PROFILE_PATH = os.getenv("PROFILE_PATH", "")
+
+    # the days of points archived locally (see export_archive.py) are read from
+    # the archive instead of the DB, with write-through the finished days read
+    # from the DB are archived on the way; the archive is in ARCHIVE_PATH by default
+    POINT_ARCHIVE = os.getenv("POINT_ARCHIVE", "0") == "1"
+    POINT_ARCHIVE_WRITE_THROUGH = os.getenv("POINT_ARCHIVE_WRITE_THROUGH", "0") == "1"
+    POINT_ARCHIVE_PATH = os.getenv("POINT_ARCHIVE_PATH", "")
+
     @property
     def db_uri(self) -> str:
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:5432/{self.DB_NAME}"
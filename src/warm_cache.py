@@ -0,0 +1,25 @@
+"""Cache warm-up entry point: precomputes the page data cache entries."""
+import argparse
+import threading
+
+from maps.map_descriptor import square_map
+from movie.cache_warmer import CacheWarmer
+from movie.telemetry import configure_logging
+from settings import settings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute the page data cache entries")
+    parser.add_argument("--periods", type=int, default=settings.CACHE_WARMUP_PERIODS,
+                        help="number of the latest page periods (two weeks each) to cache")
+    parser.add_argument("--ranges", default=settings.CACHE_WARMUP_RANGES,
+                        help="extra ranges to cache: 2022-10-10/2022-10-24,...")
+    parser.add_argument("--interval", type=float, default=None,
+                        help="repeat every INTERVAL seconds instead of running once")
+    args = parser.parse_args()
+
+    configure_logging()
+    warmer = CacheWarmer(square_map, args.periods, CacheWarmer.parse_ranges(args.ranges))
+    if args.interval:
+        warmer.run_forever(args.interval, threading.Event())
+    else:
+        warmer.warm_up()
@@ -0,0 +1,73 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import pytest
+import pytz
+
+# the modules are imported from src as the app does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from maps.map_descriptor import get_map  # noqa: E402
+from movie.entity.point_batch import PointBatch  # noqa: E402
+from movie.entity.track import TrackBag  # noqa: E402
+from movie.page_data_cache import PageDataCache  # noqa: E402
+from movie.serializer.track_bag_json_serializer import TrackBagJsonSerializer  # noqa: E402
+from paths import CACHE_PATH  # noqa: E402
+
+START_TIME = datetime.datetime(2022, 10, 10, tzinfo=pytz.utc)
+
+
+@pytest.fixture
+def page_cache(tmp_path):
+    """
+    PageDataCache in a temp folder, with the in-memory state reset
+    """
+    PageDataCache.use_folder(str(tmp_path))
+    yield PageDataCache
+    PageDataCache.use_folder(CACHE_PATH)
+
+
+def make_points(
+        trackers: int = 12,
+        points_per_tracker: int = 200,
+        seconds: int = 6 * 3600,
+        seed: int = 7) -> PointBatch:
+    """
+    random walks of the trackers around Germany, with the leaps of the
+    lost signal and the points of several trackers in the same second
+    """
+    rng = np.random.default_rng(seed)
+    tracker_ids, times, lats, lons = [], [], [], []
+    for tracker in range(trackers):
+        tracker_times = np.sort(rng.integers(0, seconds, points_per_tracker))
+        leaps = np.cumsum(rng.random(points_per_tracker) < 0.02) * 3.0
+        tracker_ids.append(np.full(points_per_tracker, tracker * 7 + 3, dtype=np.int64))
+        times.append(int(START_TIME.timestamp()) + tracker_times)
+        lats.append(48 + rng.normal(0, 1) + np.cumsum(rng.normal(0, 0.01, points_per_tracker)))
+        lons.append(6 + rng.normal(0, 1) + np.cumsum(rng.normal(0, 0.02, points_per_tracker)) + leaps)
+    tracker_ids, times = np.concatenate(tracker_ids), np.concatenate(times)
+    order = np.lexsort((tracker_ids, times))
+    return PointBatch(
+        tracker_ids[order], times[order].astype(np.int64),
+        np.concatenate(lats)[order], np.concatenate(lons)[order])
+
+
+@pytest.fixture
+def points() -> PointBatch:
+    return make_points()
+
+
+def make_track_bag(points: PointBatch, map_name: str = "square_map") -> TrackBag:
+    xs, ys = get_map(map_name).geo_to_canvas_batch(points.lats, points.lons)
+    bag = TrackBag()
+    bag.add_points(points.tracker_ids, points.times, xs, ys)
+    return bag
+
+
+def make_track_data(points: PointBatch, map_name: str = "square_map") -> str:
+    """
+    the text track data of the points as /track_data/ serves it
+    """
+    return TrackBagJsonSerializer.serialize(get_map(map_name), make_track_bag(points, map_name))
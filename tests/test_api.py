@@ -0,0 +1,94 @@
+import datetime
+import gzip
+
+import pytest
+
+from api import create_app
+from conftest import START_TIME, make_points
+from maps.map_descriptor import get_map
+from movie.page_data_source import PageDataSource
+from movie.repository.memory_track_repository import MemoryTrackRepository
+
+TRACK_DATA_URL = "/track_data/?start_date=2022-10-10&end_date=2022-10-11"
+END_TIME = START_TIME + datetime.timedelta(days=1)
+
+
+@pytest.fixture(scope="module")
+def app():
+    # the routes are registered once per process
+    return create_app()
+
+
+@pytest.fixture
+def client(app, page_cache, monkeypatch):
+    points = make_points(seconds=24 * 3600)
+    monkeypatch.setattr(PageDataSource, "repository_factory", lambda: MemoryTrackRepository(points))
+    return app.test_client()
+
+
+def test_track_data_is_streamed_as_serialized(client):
+    response = client.get(TRACK_DATA_URL)
+    assert response.status_code == 200
+    # not cached yet: the chunks are sent as they're serialized
+    assert "ETag" not in response.headers
+    data = response.get_data(as_text=True)
+
+    cached = client.get(TRACK_DATA_URL)
+    assert "ETag" in cached.headers
+    assert cached.get_data(as_text=True) == data
+    assert PageDataSource(get_map("square_map")).get_track(START_TIME, END_TIME) == data
+
+
+def test_cached_track_data_is_revalidated_with_the_etag(client):
+    client.get(TRACK_DATA_URL).get_data()
+    response = client.get(TRACK_DATA_URL)
+    etag = response.headers["ETag"]
+
+    not_modified = client.get(TRACK_DATA_URL, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.get_data() == b""
+    assert client.get(TRACK_DATA_URL, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_cached_track_data_is_sent_compressed(client):
+    data = client.get(TRACK_DATA_URL).get_data()
+    response = client.get(TRACK_DATA_URL, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.get_data()) == data
+    assert response.headers["ETag"] != client.get(TRACK_DATA_URL).headers["ETag"]
+
+
+@pytest.mark.parametrize("query", [
+    "bbox=1,2,3",
+    "bbox=a,b,c,d",
+    "bbox=1,2,3,4,5",
+    "bbox=nan,0,1,1",
+    "bbox=0,0,inf,1",
+    "bbox=5,0,1,1",
+    "bbox_geo=50,10,40,20",
+])
+def test_malformed_bbox_is_rejected(client, query):
+    assert client.get(f"{TRACK_DATA_URL}&{query}").status_code == 400
+
+
+def test_bbox_track_data_is_filtered(client):
+    data = client.get(TRACK_DATA_URL).get_data(as_text=True)
+    everything = client.get(f"{TRACK_DATA_URL}&bbox=0,0,100000,100000")
+    assert everything.status_code == 200
+    assert len(everything.get_data(as_text=True)) > 0
+
+    nothing = client.get(f"{TRACK_DATA_URL}&bbox=-20,-20,-10,-10")
+    assert nothing.status_code == 200
+    # the timings header only
+    assert "#" not in nothing.get_data(as_text=True)
+    assert "#" in data
+
+
+def test_metrics_endpoint_serves_the_process_metrics(client):
+    client.get(TRACK_DATA_URL).get_data()
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# TYPE cargo_page_coalesced_loads gauge" in text
+    assert "cargo_stage_seconds_count{stage=" in text
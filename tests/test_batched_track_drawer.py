@@ -0,0 +1,65 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from conftest import START_TIME, make_points
+from movie.entity.point_batch import PointBatch
+from maps.map_descriptor import get_map
+from movie.entity.visual_settings import DEFAULT_COLOR_MAP, DrawingSettings, RenderSettings, TrackColorMap
+from movie.movie_operator import MovieOperator, MovieTiming
+from movie.repository.memory_track_repository import MemoryTrackRepository
+
+SINGLE_COLOR_MAP = TrackColorMap([(20, 180, 20)])
+
+
+@pytest.fixture
+def points():
+    """
+    the trackers ending early, starting late and driving all the movie
+    """
+    points = make_points()
+    seconds = points.times - START_TIME.timestamp()
+    kept = ((points.tracker_ids % 3 == 0) & (seconds < 2 * 3600)) | \
+           ((points.tracker_ids % 3 == 1) & (seconds > 3 * 3600)) | \
+           (points.tracker_ids % 3 == 2)
+    return PointBatch(points.tracker_ids[kept], points.times[kept], points.lats[kept], points.lons[kept])
+
+
+def _render_frames(folder, points, batched, color_map, drawing_settings=None, fading_seconds=3600, cutting_seconds=7200):
+    timing = MovieTiming(
+        START_TIME, START_TIME + datetime.timedelta(hours=6), 900, fading_seconds, cutting_seconds)
+    operator = MovieOperator(
+        str(folder), get_map("default_map"), timing, color_map=color_map,
+        drawing_settings=drawing_settings, render_settings=RenderSettings(batched_drawing=batched))
+    operator._create_repository = lambda: MemoryTrackRepository(points)
+    operator._prepare_track_bag()
+    return [operator._render_frame(frame_time) for frame_time in operator._get_frame_times()]
+
+
+@pytest.mark.parametrize("drawing_settings, fading_seconds, cutting_seconds", [
+    (None, 3600, 7200),
+    (None, 7200, 3600),
+    (DrawingSettings(head_radius=4, head_thickness=-1, path_thickness=3), 3600, 7200),
+])
+def test_batched_frames_of_one_color_are_the_same(
+        tmp_path, points, drawing_settings, fading_seconds, cutting_seconds):
+    expected = _render_frames(
+        tmp_path, points, False, SINGLE_COLOR_MAP, drawing_settings, fading_seconds, cutting_seconds)
+    frames = _render_frames(
+        tmp_path, points, True, SINGLE_COLOR_MAP, drawing_settings, fading_seconds, cutting_seconds)
+    assert len(frames) == len(expected)
+    for image, expected_image in zip(frames, expected):
+        np.testing.assert_array_equal(image, expected_image)
+
+
+def test_batched_frames_differ_only_where_the_colors_overlap(tmp_path, points):
+    expected = _render_frames(tmp_path, points, False, DEFAULT_COLOR_MAP)
+    frames = _render_frames(tmp_path, points, True, DEFAULT_COLOR_MAP)
+    for image, expected_image in zip(frames, expected):
+        differing = np.any(image != expected_image, axis=2)
+        # see the tolerance in BatchedTrackDrawer
+        assert np.mean(differing) < 0.001
+        # the differing pixels are of the track colors, not of the map
+        pixels = image[differing][:, None, :]
+        assert np.all(np.any(np.all(pixels == np.array(DEFAULT_COLOR_MAP.colors), axis=2), axis=1))
@@ -0,0 +1,59 @@
+import datetime
+import os
+import subprocess
+import sys
+
+import pytz
+
+from conftest import make_points
+from maps.map_descriptor import get_map
+from movie import cache_warmer
+from movie.cache_warmer import CacheWarmer
+from movie.page_data_source import PageDataSource
+from movie.repository.memory_track_repository import MemoryTrackRepository
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def test_page_periods_are_two_weeks_from_monday_and_include_today():
+    now = datetime.datetime(2022, 10, 20, 15, tzinfo=pytz.utc)
+    periods = CacheWarmer.get_page_periods(now, 3)
+    assert periods[0][0] <= now < periods[0][1]
+    for start, end in periods:
+        assert start.weekday() == 0
+        assert end - start == datetime.timedelta(weeks=2)
+    assert [p[0] for p in periods[:-1]] == [p[1] for p in periods[1:]]
+
+
+def test_warm_up_caches_the_missing_periods(page_cache, monkeypatch):
+    points = make_points(seconds=30 * 24 * 3600)
+    monkeypatch.setattr(PageDataSource, "repository_factory", lambda: MemoryTrackRepository(points))
+    now = datetime.datetime(2022, 10, 20, 15, tzinfo=pytz.utc)
+    ranges = CacheWarmer.parse_ranges("2022-10-10/2022-10-12, 2030-01-01/2030-01-02")
+    warmer = CacheWarmer(get_map("square_map"), 2, ranges)
+
+    # the future range is skipped
+    assert warmer.warm_up(now) == 3
+    for start, end in warmer.get_periods(now):
+        assert page_cache.has_cached_data(start, end)
+    # the period that isn't over is re-cached
+    assert warmer.warm_up(now) == 1
+
+
+def _take_lock_in_other_process(folder: str) -> str:
+    code = "import sys; from movie.page_data_cache import PageDataCache; " \
+           "from movie.cache_warmer import _take_warm_up_lock; " \
+           "PageDataCache.use_folder(sys.argv[1]); print(_take_warm_up_lock())"
+    result = subprocess.run(
+        [sys.executable, "-c", code, folder], cwd=SRC_PATH, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def test_one_process_takes_the_warm_up_lock(page_cache, monkeypatch):
+    monkeypatch.setattr(cache_warmer, "_warm_up_lock_file", None)
+    assert cache_warmer._take_warm_up_lock()
+    assert cache_warmer._take_warm_up_lock()
+    assert _take_lock_in_other_process(page_cache.cache_folder) == "False"
+
+    cache_warmer._warm_up_lock_file.close()
+    assert _take_lock_in_other_process(page_cache.cache_folder) == "True"
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from maps import map_descriptor
+from maps.map_descriptor import get_map
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+@pytest.mark.parametrize("map_name", ["default_map", "square_map"])
+def test_geo_to_canvas_batch_matches_geo_to_canvas(map_name, points):
+    geo_map = get_map(map_name)
+    xs, ys = geo_map.geo_to_canvas_batch(points.lats, points.lons)
+    expected = np.array([geo_map.geo_to_canvas((lat, lon)) for lat, lon in zip(points.lats, points.lons)])
+    np.testing.assert_allclose(xs, expected[:, 0], rtol=0, atol=1e-6)
+    np.testing.assert_allclose(ys, expected[:, 1], rtol=0, atol=1e-6)
+
+
+def test_geo_to_canvas_batch_of_no_points():
+    xs, ys = get_map("default_map").geo_to_canvas_batch(np.empty(0), np.empty(0))
+    assert len(xs) == len(ys) == 0
+
+
+def _leap_indices_point_by_point(geo_map, points):
+    indices = []
+    for i in range(1, len(points)):
+        dx, dy = int(points[i][0]) - int(points[i - 1][0]), int(points[i][1]) - int(points[i - 1][1])
+        if dx * dx + dy * dy > geo_map.leap_dist_px_square:
+            indices.append(i)
+    return indices
+
+
+@pytest.mark.parametrize("map_name", ["default_map", "square_map"])
+def test_leap_indices_match_the_point_by_point_check(map_name):
+    geo_map = get_map(map_name)
+    rng = np.random.default_rng(3)
+    steps = rng.integers(-40, 41, size=(2000, 2))
+    steps[rng.random(2000) < 0.05] *= 10
+    points = np.cumsum(steps, axis=0).astype(np.int32)
+    indices = geo_map.leap_indices(points)
+    assert len(indices) > 0
+    assert indices.tolist() == _leap_indices_point_by_point(geo_map, points)
+    assert geo_map.leap_indices(points[:1]).tolist() == []
+
+
+def test_split_leaps_segments_are_the_points():
+    geo_map = get_map("default_map")
+    leap = int(np.sqrt(geo_map.leap_dist_px_square)) + 1
+    points = np.array([[0, 0], [1, 1], [1 + leap, 1], [2 + leap, 2], [2, 2]], dtype=np.int32)
+    segments = geo_map.split_leaps(points)
+    assert [s.reshape((-1, 2)).tolist() for s in segments] == [
+        [[0, 0], [1, 1]], [[1 + leap, 1], [2 + leap, 2]], [[2, 2]]]
+    assert all(s.shape[1:] == (1, 2) and s.dtype == np.int32 for s in segments)
+
+
+def test_maps_are_created_once_per_process():
+    assert get_map("default_map") is get_map("default_map")
+    assert map_descriptor.square_map is get_map("square_map")
+    with pytest.raises(AttributeError):
+        _ = map_descriptor.other_map
+
+
+def test_map_image_is_decoded_on_the_first_access():
+    geo_map = map_descriptor.make_square_map_descriptor()
+    assert geo_map._map_pic is None
+    map_pic = geo_map.map_pic
+    assert map_pic.shape == (geo_map.canvas_h, geo_map.canvas_w, 3)
+    assert geo_map.map_pic is map_pic
+    with pytest.raises(ValueError):
+        map_pic[0, 0] = 0
+
+
+def test_importing_the_maps_decodes_no_image():
+    code = "import maps.map_descriptor as m; print(len(m._maps), m.default_map._map_pic is None)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_PATH, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ["0", "True"]
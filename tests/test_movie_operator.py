@@ -0,0 +1,259 @@
+import datetime
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import START_TIME, make_points
+from maps.map_descriptor import get_map
+from movie.entity.track import TrackBag
+from movie.entity.visual_settings import RenderSettings, DrawingSettings
+from movie.movie_operator import MovieOperator, MovieTiming
+from movie.render.accumulating_renderer import AccumulatingRenderer
+from movie.render.frame_cache import FrameCache
+from movie.render.parallel_frames import split_frame_ranges
+from movie.repository.memory_track_repository import MemoryTrackRepository
+
+
+def make_operator(folder, points, fading_seconds=3600, cutting_seconds=7200, **render_settings) -> MovieOperator:
+    """
+    the operator of a 6 hours movie over the points (read from memory)
+    """
+    timing = MovieTiming(
+        START_TIME, START_TIME + datetime.timedelta(hours=6), 900, fading_seconds, cutting_seconds)
+    operator = MovieOperator(
+        str(folder), get_map("default_map"), timing, render_settings=RenderSettings(**render_settings))
+    operator._create_repository = lambda: MemoryTrackRepository(points, batch_size=500)
+    return operator
+
+
+def render_frames(operator):
+    if not operator.render_settings.streaming:
+        operator._prepare_track_bag()
+    return [image for _, image in operator._iter_frames(operator._get_frame_times())]
+
+
+@pytest.fixture
+def operator(tmp_path, points):
+    return make_operator(tmp_path, points)
+
+
+def _draw_track_point_by_point(operator, overlay, track, frame_time, tail_start, body_start):
+    """
+    the tracks drawn as before the time index: a pass over all the points,
+    the lines split at the leaps point by point
+    """
+    times = track.times
+    if tail_start.timestamp() > times[-1] or frame_time.timestamp() < times[0]:
+        return overlay
+    points_body, points_tail = [], []
+    for time, xy in zip(times.tolist(), track.integer_xy_coords.tolist()):
+        if time > frame_time.timestamp():
+            break
+        if time >= body_start.timestamp():
+            points_body.append(tuple(xy))
+            continue
+        if time >= tail_start.timestamp():
+            points_tail.append(tuple(xy))
+
+    sets = operator.drawing_settings
+    for points, thickness in [(points_tail, sets.path_tail_thickness), (points_body, sets.path_thickness)]:
+        if not points:
+            continue
+        segments = [[points[0]]]
+        for prev_point, point in zip(points, points[1:]):
+            dx, dy = point[0] - prev_point[0], point[1] - prev_point[1]
+            if dx * dx + dy * dy > operator.geo_map.leap_dist_px_square:
+                segments.append([point])
+            else:
+                segments[-1].append(point)
+        for segment in segments:
+            overlay = cv2.polylines(
+                overlay, [np.array(segment, np.int32).reshape((-1, 1, 2))], False,
+                track.color, thickness=thickness)
+    if len(points_body) > 1 and points_body[0] != points_body[-1]:
+        overlay = cv2.circle(overlay, points_body[-1], sets.head_radius, track.color, sets.head_thickness)
+    return overlay
+
+
+@pytest.mark.parametrize("fading_minutes, cutting_minutes", [(60, 120), (120, 60)])
+def test_draw_track_matches_drawing_point_by_point(operator, points, fading_minutes, cutting_minutes):
+    bag = TrackBag()
+    xs, ys = operator.geo_map.geo_to_canvas_batch(points.lats, points.lons)
+    bag.add_points(points.tracker_ids, points.times, xs, ys)
+    shape = (operator.geo_map.canvas_h, operator.geo_map.canvas_w, 3)
+
+    for minutes in range(-30, 7 * 60, 25):
+        frame_time = START_TIME + datetime.timedelta(minutes=minutes)
+        tail_start = frame_time - datetime.timedelta(minutes=cutting_minutes)
+        body_start = frame_time - datetime.timedelta(minutes=fading_minutes)
+        drawn, expected = np.zeros(shape, np.uint8), np.zeros(shape, np.uint8)
+        for track in bag.track_by_id.values():
+            drawn = operator._draw_track(drawn, track, frame_time, tail_start, body_start)
+            expected = _draw_track_point_by_point(operator, expected, track, frame_time, tail_start, body_start)
+        np.testing.assert_array_equal(drawn, expected)
+
+
+@pytest.mark.parametrize("fading_seconds, cutting_seconds", [(3600, 7200), (7200, 3600)])
+def test_incremental_frames_dont_depend_on_the_first_rendered_frame(
+        tmp_path, points, fading_seconds, cutting_seconds):
+    operator = make_operator(tmp_path, points, fading_seconds, cutting_seconds, incremental=True)
+    operator._prepare_track_bag()
+    frame_times = operator._get_frame_times()
+    in_order = AccumulatingRenderer(operator, frame_times)
+    frames = [in_order.render(i) for i in range(len(frame_times))]
+
+    for i in (5, 17, len(frame_times) - 1):
+        # the renderer replays the visible window before the frame
+        np.testing.assert_array_equal(AccumulatingRenderer(operator, frame_times).render(i), frames[i])
+
+
+def test_incremental_frames_are_close_to_the_redrawn_frames(tmp_path, points):
+    redrawn = render_frames(make_operator(tmp_path, points))
+    incremental = render_frames(make_operator(tmp_path, points, incremental=True))
+    for expected, image in zip(redrawn, incremental):
+        # see the tolerance in AccumulatingRenderer
+        assert np.mean(np.any(expected != image, axis=2)) < 0.001
+
+
+@pytest.mark.parametrize("render_settings", [
+    {}, {"frames_per_task": 5}, {"incremental": True, "frames_per_task": 7},
+    {"incremental": True, "frames_per_task": 7, "fading_seconds": 7200, "cutting_seconds": 3600}])
+def test_frames_rendered_by_workers_are_the_same(tmp_path, points, render_settings):
+    serial = render_frames(make_operator(tmp_path, points, **render_settings))
+    parallel = render_frames(make_operator(tmp_path, points, workers=3, **render_settings))
+    assert len(parallel) == len(serial)
+    for expected, image in zip(serial, parallel):
+        np.testing.assert_array_equal(image, expected)
+
+
+@pytest.mark.parametrize("render_settings", [
+    {}, {"incremental": True}, {"incremental": True, "workers": 2, "frames_per_task": 7},
+    {"fading_seconds": 7200, "cutting_seconds": 3600},
+    {"incremental": True, "fading_seconds": 7200, "cutting_seconds": 3600}])
+def test_streamed_frames_are_the_same(tmp_path, points, render_settings):
+    loaded = render_frames(make_operator(tmp_path, points, **render_settings))
+    streamed = render_frames(make_operator(
+        tmp_path, points, streaming=True, streaming_chunk_seconds=2500, **render_settings))
+    assert len(streamed) == len(loaded)
+    for expected, image in zip(loaded, streamed):
+        np.testing.assert_array_equal(image, expected)
+
+
+def test_streamed_tracks_arent_simplified(tmp_path, points):
+    operator = make_operator(tmp_path, points, streaming=True, simplify_tolerance_px=0.5)
+    with pytest.raises(ValueError):
+        operator.shot()
+
+
+def test_split_frame_ranges_cover_the_frames_once():
+    assert split_frame_ranges(10, 3) == [(0, 4), (4, 8), (8, 10)]
+    assert split_frame_ranges(10, 3, 6) == [(0, 6), (6, 10)]
+    assert split_frame_ranges(2, 4) == [(0, 1), (1, 2)]
+    assert split_frame_ranges(0, 4) == []
+
+
+def _read_video(file_path):
+    video = cv2.VideoCapture(file_path)
+    frames = []
+    while True:
+        ok, frame = video.read()
+        if not ok:
+            break
+        frames.append(frame)
+    video.release()
+    return frames
+
+
+def test_pipeline_video_has_the_rendered_frames(tmp_path, points):
+    operator = make_operator(tmp_path, points, workers=2, frames_per_task=3, write_frame_files=True)
+    operator.shot()
+
+    # the frames are compressed by the codec, only the count is compared
+    assert len(_read_video(os.path.join(operator.frames_folder, "video.avi"))) == len(operator._get_frame_times())
+    for i, expected in enumerate(render_frames(make_operator(tmp_path / "serial", points))):
+        np.testing.assert_array_equal(cv2.imread(operator._get_frame_path(i + 1)), expected)
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_worker_tasks_fit_the_encoder_queue(tmp_path, points, incremental):
+    operator = make_operator(tmp_path, points, incremental=incremental, workers=4, encoder_queue_size=8)
+    assert operator._get_frames_per_task() == 2
+
+
+@pytest.mark.parametrize("render_settings", [{}, {"incremental": True}])
+def test_frames_of_tasks_longer_than_the_queue_are_the_same(tmp_path, points, render_settings):
+    serial = render_frames(make_operator(tmp_path, points, **render_settings))
+    operator = make_operator(
+        tmp_path, points, workers=2, frames_per_task=10, encoder_queue_size=2, **render_settings)
+    operator._prepare_track_bag()
+    parallel = list(operator._iter_frames(operator._get_frame_times()))
+    assert [i for i, _ in parallel] == list(range(len(serial)))
+    for expected, (_, image) in zip(serial, parallel):
+        np.testing.assert_array_equal(image, expected)
+
+
+def test_worker_failure_is_raised(tmp_path, points):
+    operator = make_operator(tmp_path, points, workers=2, frames_per_task=3)
+    operator._prepare_track_bag()
+
+    def render_frame(frame_time):
+        raise ValueError("Broken frame")
+    operator._render_frame = render_frame
+    with pytest.raises(RuntimeError, match="Broken frame"):
+        list(operator._iter_frames(operator._get_frame_times()))
+
+
+def test_incremental_renderer_renders_on_to_a_frame_ahead(tmp_path, points):
+    operator = make_operator(tmp_path, points, 7200, 3600, incremental=True)
+    operator._prepare_track_bag()
+    frame_times = operator._get_frame_times()
+    in_order = AccumulatingRenderer(operator, frame_times)
+    frames = [in_order.render(i) for i in range(len(frame_times))]
+
+    renderer = AccumulatingRenderer(operator, frame_times)
+    for i in (0, 1, 2, 6, 7, 15, 3, 20):
+        np.testing.assert_array_equal(renderer.render(i), frames[i])
+
+
+def test_resumable_rerun_reads_the_frames_from_the_cache(tmp_path, points):
+    counters = []
+    for _ in range(2):
+        operator = make_operator(tmp_path, points, resumable=True)
+        operator.shot()
+        with open(os.path.join(tmp_path, "timing_summary.json")) as f:
+            counters.append(json.load(f)["counters"])
+    frames_count = len(operator._get_frame_times())
+    assert counters[0].get("movie.frames_rendered") == frames_count
+    assert counters[0].get("movie.frames_cached") is None
+    assert counters[1].get("movie.frames_cached") == frames_count
+    assert counters[1].get("movie.frames_rendered") is None
+
+
+def test_frame_cache_key_depends_on_the_frame_inputs(tmp_path, points):
+    operator = make_operator(tmp_path, points)
+    operator._prepare_track_bag()
+    frame_time = operator._get_frame_times()[10]
+    key = FrameCache(str(tmp_path / "frames"), operator).get_key(frame_time)
+    assert FrameCache(str(tmp_path / "frames"), operator).get_key(frame_time) == key
+    assert FrameCache(str(tmp_path / "frames"), operator).get_key(operator._get_frame_times()[11]) != key
+
+    operator.drawing_settings = DrawingSettings(path_thickness=3)
+    assert FrameCache(str(tmp_path / "frames"), operator).get_key(frame_time) != key
+
+    other_data = make_operator(tmp_path, make_points(seed=8))
+    other_data._prepare_track_bag()
+    assert FrameCache(str(tmp_path / "frames"), other_data).get_key(frame_time) != key
+
+
+def test_frame_cache_keeps_the_frame_pixels(tmp_path, points):
+    operator = make_operator(tmp_path, points)
+    operator._prepare_track_bag()
+    frame_time = operator._get_frame_times()[10]
+    cache = FrameCache(str(tmp_path / "frames"), operator)
+    image = operator._render_frame(frame_time)
+    cache.save(cache.get_key(frame_time), image)
+    np.testing.assert_array_equal(cache.load(cache.get_key(frame_time)), image)
+    assert cache.load(cache.get_key(operator._get_frame_times()[11])) is None
@@ -0,0 +1,164 @@
+import datetime
+import gzip
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from conftest import START_TIME, make_points, make_track_data
+from movie.page_data_cache import CachedVariant
+from movie.page_data_variants import PageDataVariantWriter
+from movie.serializer.track_data_binary_encoder import TrackDataBinaryEncoder
+from settings import settings
+
+END_TIME = START_TIME + datetime.timedelta(days=1)
+HEADER = "1665360000,1665446400,27756000,27757440,"
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def test_cached_data_is_served_from_memory(page_cache, points):
+    data = make_track_data(points)
+    page_cache.cache_data(START_TIME, END_TIME, data, HEADER)
+    os.remove(os.path.join(page_cache.cache_folder, page_cache._get_cache_key(START_TIME, END_TIME)))
+
+    assert page_cache.get_cached_data(START_TIME, END_TIME) == data
+    assert page_cache.get_stats()["hits"] == 1
+    assert page_cache.get_stats()["misses"] == 0
+
+
+def test_one_hit_or_miss_per_lookup(page_cache, points):
+    data = make_track_data(points)
+    page_cache.cache_data(START_TIME, END_TIME, data, HEADER)
+    # the in-memory state is lost, the entry is read from the file
+    page_cache.use_folder(page_cache.cache_folder)
+
+    assert page_cache.get_cached_data(START_TIME, END_TIME) == data
+    assert page_cache.get_cached_data(START_TIME, END_TIME) == data
+    assert page_cache.get_cached_data(START_TIME, START_TIME + datetime.timedelta(days=2)) is None
+    stats = page_cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_entries_over_the_memory_budget_are_evicted(page_cache, monkeypatch):
+    data = [make_track_data(make_points(seed=seed)) for seed in range(3)]
+    # room for about two entries
+    monkeypatch.setattr(settings, "PAGE_CACHE_MEMORY_MB", 2.5 * len(data[0]) / 1024 / 1024)
+    for day, day_data in enumerate(data):
+        start = START_TIME + datetime.timedelta(days=day)
+        page_cache.cache_data(start, start + datetime.timedelta(days=1), day_data, HEADER)
+
+    stats = page_cache.get_stats()
+    assert stats["evictions"] >= 1
+    assert stats["bytes"] <= settings.PAGE_CACHE_MEMORY_MB * 1024 * 1024
+    # the evicted entry is read back from its file
+    assert page_cache.get_cached_data(START_TIME, END_TIME) == data[0]
+
+
+def test_cached_intervals_include_the_files_of_other_processes(page_cache, monkeypatch, points):
+    page_cache.cache_data(START_TIME, END_TIME, make_track_data(points), HEADER)
+    assert page_cache.get_cached_intervals() == [("22-10-10", "22-10-11")]
+
+    with open(os.path.join(page_cache.cache_folder, "22_10_12-22_10_14.txt"), "w") as f:
+        f.write(make_track_data(points))
+    # the index is re-read when its TTL is over
+    assert len(page_cache.get_cached_intervals()) == 1
+    monkeypatch.setattr(settings, "PAGE_CACHE_INDEX_TTL_SECONDS", 0)
+    assert sorted(page_cache.get_cached_intervals()) == [("22-10-10", "22-10-11"), ("22-10-12", "22-10-14")]
+
+
+def _cache_data_in_other_process(folder: str, data: str):
+    code = "import sys, datetime, pytz; from movie.page_data_cache import PageDataCache; " \
+           "PageDataCache.use_folder(sys.argv[1]); " \
+           "start = datetime.datetime(2022, 10, 10, tzinfo=pytz.utc); " \
+           "PageDataCache.cache_data(start, start + datetime.timedelta(days=1), sys.stdin.read(), sys.argv[2])"
+    subprocess.run([sys.executable, "-c", code, folder, HEADER], input=data, cwd=SRC_PATH, text=True, check=True)
+
+
+def test_entries_recached_by_other_processes_are_reread(page_cache, monkeypatch, points):
+    data = make_track_data(points)
+    page_cache.cache_data(START_TIME, END_TIME, data, HEADER)
+    variant = page_cache.get_cached_variant(START_TIME, END_TIME, "txt", HEADER)
+    index = page_cache.get_grid_index(START_TIME, END_TIME)
+
+    new_data = make_track_data(make_points(seed=8))
+    _cache_data_in_other_process(page_cache.cache_folder, new_data)
+    # served from memory until the index is re-read
+    assert page_cache.get_cached_data(START_TIME, END_TIME) == data
+    monkeypatch.setattr(settings, "PAGE_CACHE_INDEX_TTL_SECONDS", 0)
+    assert page_cache.get_cached_data(START_TIME, END_TIME) == new_data
+    new_variant = page_cache.get_cached_variant(START_TIME, END_TIME, "txt", HEADER)
+    assert new_variant.data == (HEADER + new_data).encode()
+    assert new_variant.etag != variant.etag
+    assert page_cache.get_grid_index(START_TIME, END_TIME) is not index
+
+
+def test_entries_of_the_own_files_stay_in_memory(page_cache, monkeypatch, points):
+    monkeypatch.setattr(settings, "PAGE_CACHE_INDEX_TTL_SECONDS", 0)
+    page_cache.cache_data(START_TIME, END_TIME, make_track_data(points), HEADER)
+    data = page_cache.get_cached_data(START_TIME, END_TIME)
+    # the index is re-read, the file written by the process isn't stale
+    assert page_cache.get_cached_data(START_TIME, END_TIME) is data
+
+    os.remove(os.path.join(page_cache.cache_folder, page_cache._get_cache_key(START_TIME, END_TIME)))
+    assert page_cache.get_cached_data(START_TIME, END_TIME) is None
+
+
+@pytest.mark.parametrize("read_variant_first", [True, False])
+def test_text_variant_and_data_entries_dont_collide(page_cache, points, read_variant_first):
+    data = make_track_data(points)
+    page_cache.cache_data(START_TIME, END_TIME, data, HEADER)
+    page_cache.use_folder(page_cache.cache_folder)
+
+    for _ in range(2):
+        if read_variant_first:
+            variant = page_cache.get_cached_variant(START_TIME, END_TIME, "txt", HEADER)
+        assert page_cache.get_cached_data(START_TIME, END_TIME) == data
+        variant = page_cache.get_cached_variant(START_TIME, END_TIME, "txt", HEADER)
+        assert isinstance(variant, CachedVariant)
+        assert variant.data == (HEADER + data).encode()
+
+
+def test_variants_are_the_response_bodies(page_cache, points):
+    data = make_track_data(points)
+    page_cache.cache_data(START_TIME, END_TIME, data, HEADER)
+
+    gzipped = page_cache.get_cached_variant(START_TIME, END_TIME, "txt.gz", HEADER)
+    assert gzip.decompress(gzipped.data) == (HEADER + data).encode()
+    assert gzipped.etag == f'"{hashlib.sha1(gzipped.data).hexdigest()}"'
+    binary = page_cache.get_cached_variant(START_TIME, END_TIME, "bin", HEADER)
+    assert binary.data == TrackDataBinaryEncoder.encode(HEADER + data)
+    assert gzip.decompress(page_cache.get_cached_variant(START_TIME, END_TIME, "bin.gz", HEADER).data) == binary.data
+
+
+def test_missing_variants_are_built_from_the_entry(page_cache, points):
+    data = make_track_data(points)
+    page_cache.cache_data(START_TIME, END_TIME, data, HEADER)
+    shutil.rmtree(os.path.join(page_cache.cache_folder, "variants"))
+    page_cache.use_folder(page_cache.cache_folder)
+
+    variant = page_cache.get_cached_variant(START_TIME, END_TIME, "txt.gz", HEADER)
+    assert gzip.decompress(variant.data) == (HEADER + data).encode()
+    stats = page_cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 0)
+    assert page_cache.get_cached_variant(START_TIME, START_TIME + datetime.timedelta(days=3), "txt", HEADER) is None
+    assert page_cache.get_stats()["misses"] == 1
+
+
+def test_variant_writer_removes_its_files_when_it_fails_to_start(tmp_path, monkeypatch):
+    file_path_by_variant = {v: str(tmp_path / v) for v in ["txt", "txt.gz", "txt.br", "bin", "bin.gz", "bin.br"]}
+    make_compressor = PageDataVariantWriter._make_compressor.__func__
+    calls = []
+
+    def fail_on_third_compressor(cls, encoding):
+        calls.append(encoding)
+        if len(calls) == 3:
+            raise RuntimeError("no compressor")
+        return make_compressor(cls, encoding)
+
+    monkeypatch.setattr(PageDataVariantWriter, "_make_compressor", classmethod(fail_on_third_compressor))
+    with pytest.raises(RuntimeError):
+        PageDataVariantWriter(file_path_by_variant, HEADER)
+    assert os.listdir(tmp_path) == []
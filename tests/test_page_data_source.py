@@ -0,0 +1,54 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from conftest import START_TIME, make_points
+from maps.map_descriptor import get_map
+from movie.entity.point_batch import PointBatch
+from movie.page_data_source import PageDataSource
+from movie.repository.memory_track_repository import MemoryTrackRepository
+from movie.serializer.track_bag_json_serializer import TrackBagJsonSerializer
+
+
+def _make_points_over_days(days: int) -> PointBatch:
+    points = make_points(points_per_tracker=1500, seconds=days * 24 * 3600)
+    # the points of all the trackers in the same second at the midnights
+    # (but the first one: the trackers appear in random order on the first days)
+    midnights = int(START_TIME.timestamp()) + np.arange(2, days) * 24 * 3600
+    all_ids = np.unique(points.tracker_ids)
+    tracker_ids = np.repeat(all_ids, len(midnights))
+    return PointBatch.concatenate([points, PointBatch(
+        tracker_ids, np.tile(midnights, len(all_ids)),
+        np.full(len(tracker_ids), 50.0), np.full(len(tracker_ids), 10.0))])
+
+
+@pytest.fixture
+def data_source(page_cache, monkeypatch):
+    points = _make_points_over_days(4)
+    monkeypatch.setattr(PageDataSource, "repository_factory", lambda: MemoryTrackRepository(points))
+    return PageDataSource(get_map("square_map"))
+
+
+def _get_expected_track(data_source, start, end) -> str:
+    """
+    the data of the range loaded at once
+    """
+    bag = data_source._create_repository().load_tracks(data_source.geo_map, start, end)
+    return data_source._get_data_timings(start, end) + \
+        TrackBagJsonSerializer.serialize(data_source.geo_map, bag)
+
+
+def test_ranges_assembled_from_the_day_shards_equal_the_whole_load(data_source):
+    days = [START_TIME + datetime.timedelta(days=d) for d in range(5)]
+    # the days in the middle are cached (as shards) by the earlier requests,
+    # the trackers' order of a shard doesn't depend on the range it was loaded with
+    data_source.get_track(days[1], days[3])
+    assert data_source.get_track(days[2], days[4]) == _get_expected_track(data_source, days[2], days[4])
+    assert data_source.get_track(days[0], days[4]) == _get_expected_track(data_source, days[0], days[4])
+
+
+def test_ranges_within_a_day_are_loaded(data_source):
+    start = START_TIME + datetime.timedelta(hours=30)
+    end = START_TIME + datetime.timedelta(hours=53)
+    assert data_source.get_track(start, end) == _get_expected_track(data_source, start, end)
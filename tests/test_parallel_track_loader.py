@@ -0,0 +1,34 @@
+import datetime
+
+import numpy as np
+
+from conftest import START_TIME
+from maps.map_descriptor import get_map
+from movie.repository.memory_track_repository import MemoryTrackRepository
+from movie.repository.parallel_track_loader import ParallelTrackLoader
+
+
+def test_shards_cover_the_range_once():
+    loader = ParallelTrackLoader(None, 2, 2.5)
+    end = START_TIME + datetime.timedelta(hours=6)
+    shards = loader.split_shards(START_TIME, end)
+    assert [(s - START_TIME, e - START_TIME) for s, e in shards] == [
+        (datetime.timedelta(hours=0), datetime.timedelta(hours=2.5)),
+        (datetime.timedelta(hours=2.5), datetime.timedelta(hours=5)),
+        (datetime.timedelta(hours=5), datetime.timedelta(hours=6))]
+    assert loader.split_shards(end, end) == []
+
+
+def test_shards_are_merged_in_time_order(points):
+    repository = MemoryTrackRepository(points, batch_size=400)
+    reports = []
+    loader = ParallelTrackLoader(repository.iter_point_batches, 4, 0.5, reports.append)
+    end = START_TIME + datetime.timedelta(hours=6)
+    tracks = loader.load_tracks(get_map("square_map"), START_TIME, end)
+
+    expected = repository.stream_tracks(get_map("square_map"), START_TIME, end)
+    assert list(tracks.track_by_id) == list(expected.track_by_id)
+    for column in ("tracker_ids", "times", "xs", "ys"):
+        np.testing.assert_array_equal(getattr(tracks, column), getattr(expected, column))
+    assert sorted(r.completed for r in reports) == list(range(1, 13))
+    assert sum(r.rows for r in reports) == len(points)
@@ -0,0 +1,154 @@
+import datetime
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import START_TIME, make_points
+from movie.entity.point_batch import PointBatch
+from movie.repository.archive_track_repository import ArchiveTrackRepository, create_track_repository
+from movie.repository.memory_track_repository import MemoryTrackRepository
+from movie.repository.point_archive import PointArchive
+from movie.repository.track_repository import TrackRepository
+from settings import settings
+
+DAYS = 4
+END_TIME = START_TIME + datetime.timedelta(days=DAYS)
+
+
+def _select(points: PointBatch, start: datetime.datetime, end: datetime.datetime) -> PointBatch:
+    selected = (points.times >= start.timestamp()) & (points.times < end.timestamp())
+    order = np.lexsort((points.tracker_ids[selected], points.times[selected]))
+    return PointBatch(*[getattr(points, c)[selected][order] for c in ("tracker_ids", "times", "lats", "lons")])
+
+
+def _assert_same_points(points: PointBatch, expected: PointBatch):
+    for column in ("tracker_ids", "times", "lats", "lons"):
+        np.testing.assert_array_equal(getattr(points, column), getattr(expected, column))
+
+
+def _day_range(day_index: int):
+    day_start = START_TIME + datetime.timedelta(days=day_index)
+    return day_start.date(), day_start, day_start + datetime.timedelta(days=1)
+
+
+@pytest.fixture
+def points():
+    return make_points(trackers=5, points_per_tracker=400, seconds=DAYS * 24 * 3600)
+
+
+@pytest.fixture
+def archive(tmp_path, points):
+    """
+    the archive of the 1st and the 3rd day
+    """
+    archive = PointArchive(str(tmp_path))
+    for day_index in (0, 2):
+        day, day_start, day_end = _day_range(day_index)
+        archive.write_day(day, _select(points, day_start, day_end))
+    return archive
+
+
+def test_archived_range_equals_the_filtered_points(archive, points):
+    day, day_start, _ = _day_range(2)
+    start, end = day_start + datetime.timedelta(hours=3), day_start + datetime.timedelta(hours=17, seconds=1)
+    _assert_same_points(archive.read_range(day, start, end), _select(points, start, end))
+    assert archive.read_day(_day_range(1)[0]) is None
+    assert archive.read_range(_day_range(1)[0], start, end) is None
+
+
+def test_replaced_day_leaves_no_temp_folders(archive, points, tmp_path):
+    day, day_start, day_end = _day_range(0)
+    replacement = _select(points, day_start, day_start + datetime.timedelta(hours=5))
+    archive.write_day(day, replacement)
+    _assert_same_points(archive.read_day(day), replacement)
+    assert sorted(os.listdir(tmp_path / f"{day:%Y}")) == [f"{day:%Y_%m_%d}", f"{_day_range(2)[0]:%Y_%m_%d}"]
+
+
+def test_day_read_while_replaced_is_one_of_the_versions(archive, points):
+    day, day_start, day_end = _day_range(0)
+    versions = [_select(points, day_start, day_end),
+                _select(points, day_start, day_start + datetime.timedelta(hours=7))]
+    stop = threading.Event()
+
+    def replace():
+        i = 0
+        while not stop.is_set():
+            i += 1
+            archive.write_day(day, versions[i % 2])
+
+    writer = threading.Thread(target=replace)
+    writer.start()
+    try:
+        for _ in range(200):
+            read = archive.read_day(day)
+            if read is None:
+                continue
+            expected = next(v for v in versions if len(v) == len(read))
+            _assert_same_points(read, expected)
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_days_are_split_at_utc_midnight():
+    start = START_TIME + datetime.timedelta(hours=20)
+    end = START_TIME + datetime.timedelta(days=2, hours=1)
+    days = PointArchive.split_days(start, end)
+    assert [d for d, _, _ in days] == [_day_range(i)[0] for i in range(3)]
+    assert days[0][1] == start and days[-1][2] == end
+    assert all(a[2] == b[1] for a, b in zip(days, days[1:]))
+
+
+def _read_all(repository, start, end) -> PointBatch:
+    return PointBatch.concatenate(list(repository.iter_point_batches(start, end)))
+
+
+@pytest.mark.parametrize("hours", [(0, DAYS * 24), (5, 60), (30, 40), (49, 90)])
+def test_archive_repository_reads_the_same_points_as_the_db(archive, points, hours):
+    start = START_TIME + datetime.timedelta(hours=hours[0])
+    end = START_TIME + datetime.timedelta(hours=hours[1])
+    db = MemoryTrackRepository(points, batch_size=300)
+    repository = ArchiveTrackRepository(archive, db)
+
+    _assert_same_points(_read_all(repository, start, end), _read_all(db, start, end))
+    for first, expected in zip(repository.get_tracker_first_times(start, end), db.get_tracker_first_times(start, end)):
+        np.testing.assert_array_equal(first, expected)
+
+
+def test_written_through_days_are_read_from_the_archive(archive, points):
+    db = MemoryTrackRepository(points)
+    repository = ArchiveTrackRepository(archive, db, write_through=True)
+    start, end = START_TIME + datetime.timedelta(hours=12), END_TIME
+    expected = _read_all(db, start, end)
+
+    _assert_same_points(_read_all(repository, start, end), expected)
+    # the days not archived yet that are whole in the range
+    assert archive.has_day(_day_range(1)[0])
+    assert archive.has_day(_day_range(3)[0])
+    _assert_same_points(_read_all(repository, start, end), expected)
+
+
+def test_day_being_replaced_is_read_from_the_db(archive, points, monkeypatch):
+    db = MemoryTrackRepository(points)
+    repository = ArchiveTrackRepository(archive, db)
+    monkeypatch.setattr(archive, "read_range", lambda day, start, end: None)
+
+    _assert_same_points(_read_all(repository, START_TIME, END_TIME), _read_all(db, START_TIME, END_TIME))
+    for first, expected in zip(repository.get_tracker_first_times(START_TIME, END_TIME),
+                               db.get_tracker_first_times(START_TIME, END_TIME)):
+        np.testing.assert_array_equal(first, expected)
+
+
+@pytest.mark.parametrize("loading_mode, archived", [("stream", True), ("hourly", False)])
+def test_hourly_mode_warns_the_archive_is_unused(tmp_path, monkeypatch, caplog, loading_mode, archived):
+    monkeypatch.setattr(settings, "POINT_ARCHIVE", True)
+    monkeypatch.setattr(settings, "POINT_ARCHIVE_PATH", str(tmp_path))
+    monkeypatch.setattr(settings, "TRACK_LOADING_MODE", loading_mode)
+    with caplog.at_level("WARNING"):
+        repository = create_track_repository(None)
+    assert isinstance(repository, ArchiveTrackRepository) == archived
+    assert isinstance(repository, TrackRepository)
+    warned = [r for r in caplog.records if "point archive" in r.getMessage()]
+    assert len(warned) == (0 if archived else 1)
@@ -0,0 +1,99 @@
+from typing import List
+
+import numpy as np
+
+from conftest import make_track_bag, make_track_data
+from maps.map_descriptor import get_map
+from movie.serializer.time_conversion import time_to_minutes
+from movie.serializer.track_bag_json_serializer import TrackBagJsonSerializer
+from movie.serializer.track_data_binary_encoder import TrackDataBinaryEncoder, encode_varints
+
+HEADER = "1665360000,1665446400,27756000,27757440,"
+
+
+def _decode_varints(data: bytes) -> List[int]:
+    values, value, shift = [], 0, 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            values.append((value >> 1) ^ -(value & 1))
+            value, shift = 0, 0
+    assert shift == 0
+    return values
+
+
+def _decode_track_data(data: bytes) -> str:
+    """
+    the text track data back from the binary format (as binary_parser.js reads it)
+    """
+    values = _decode_varints(data)
+    text = "".join(f"{v}," for v in values[:TrackDataBinaryEncoder.HEADER_VALUES])
+    position = TrackDataBinaryEncoder.HEADER_VALUES
+    while position < len(values):
+        track_id, points_count = values[position:position + 2]
+        position += 2
+        x = y = 0
+        text += f"{track_id},"
+        for time_delta, dx, dy in np.reshape(values[position:position + 3 * points_count], (-1, 3)).tolist():
+            x, y = x + dx, y + dy
+            text += f"{time_delta},{x},{y},"
+        text += "#"
+        position += 3 * points_count
+    return text
+
+
+def test_varints_round_trip():
+    values = [0, 1, -1, 63, -64, 64, 127, 128, -129, 2 ** 31, -2 ** 40, 2 ** 62]
+    assert _decode_varints(encode_varints(np.array(values))) == values
+    assert len(encode_varints(np.array([63, -64]))) == 2
+    assert encode_varints(np.array([], dtype=np.int64)) == b""
+
+
+def test_binary_track_data_decodes_to_the_text_data(points):
+    text_data = HEADER + make_track_data(points)
+    assert _decode_track_data(TrackDataBinaryEncoder.encode(text_data)) == text_data
+
+
+def test_binary_chunks_concatenate_to_the_whole_encoding(points):
+    tracks = [track + "#" for track in make_track_data(points).split("#")[:-1]]
+    chunks = TrackDataBinaryEncoder.encode_header(HEADER) + \
+        b"".join(TrackDataBinaryEncoder.encode_tracks(track) for track in tracks)
+    assert chunks == TrackDataBinaryEncoder.encode(HEADER + "".join(tracks))
+    assert TrackDataBinaryEncoder.encode_tracks("") == b""
+
+
+def _serialize_point_by_point(geo_map, track_id, track) -> str:
+    """
+    the track serialized as before the vectorized serializer
+    """
+    data = f"{track_id},"
+    prev_minute, last_xy = 0, None
+    for point in track.points:
+        minute = time_to_minutes(point.track_time)
+        time_delta, prev_minute = minute - prev_minute, minute
+        xy = round(point.canvas_coords[0]), round(point.canvas_coords[1])
+        if last_xy:
+            dx, dy = xy[0] - last_xy[0], xy[1] - last_xy[1]
+            if dx * dx + dy * dy > geo_map.leap_dist_px_square:
+                data += f"{time_delta},0,0,"
+        last_xy = xy
+        data += f"{time_delta},{xy[0]},{xy[1]},"
+    return data + "#"
+
+
+def test_serializer_matches_serializing_point_by_point(points):
+    geo_map = get_map("square_map")
+    bag = make_track_bag(points)
+    expected = "".join(_serialize_point_by_point(geo_map, i, track) for i, track in bag.track_by_id.items())
+    assert ",0,0," in expected
+    assert TrackBagJsonSerializer.serialize(geo_map, bag) == expected
+
+
+def test_serializer_yields_a_chunk_per_track(points):
+    geo_map = get_map("square_map")
+    bag = make_track_bag(points)
+    chunks = list(TrackBagJsonSerializer.iter_serialize(geo_map, bag))
+    assert len(chunks) == len(bag.track_by_id)
+    assert all(chunk.endswith("#") for chunk in chunks)
+    assert "".join(chunks) == TrackBagJsonSerializer.serialize(geo_map, bag)
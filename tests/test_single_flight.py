@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from movie.single_flight import SingleFlight
+
+
+def _wait_for_waiters(single_flight: SingleFlight, count: int):
+    while single_flight.coalesced_calls < count:
+        threading.Event().wait(0.001)
+
+
+def test_concurrent_calls_for_the_same_key_run_once():
+    single_flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return object()
+
+    with ThreadPoolExecutor(8) as pool:
+        leader = pool.submit(single_flight.do, "day", load)
+        started.wait()
+        waiters = [pool.submit(single_flight.do, "day", load) for _ in range(7)]
+        _wait_for_waiters(single_flight, 7)
+        release.set()
+        results = [leader.result()] + [w.result() for w in waiters]
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert single_flight.coalesced_calls == 7
+
+
+def test_calls_after_the_call_is_over_run_again():
+    single_flight = SingleFlight()
+    assert single_flight.do("day", lambda: 1) == 1
+    assert single_flight.do("day", lambda: 2) == 2
+    assert single_flight.coalesced_calls == 0
+
+
+def test_different_keys_arent_coalesced():
+    single_flight, release = SingleFlight(), threading.Event()
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(single_flight.do, "a", lambda: release.wait() and "a")
+        assert single_flight.do("b", lambda: "b") == "b"
+        release.set()
+        assert first.result() == "a"
+    assert single_flight.coalesced_calls == 0
+
+
+def test_waiters_get_the_leaders_exception():
+    single_flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait()
+        raise ValueError("the DB is down")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(single_flight.do, "day", fail)
+        started.wait()
+        waiter = pool.submit(single_flight.do, "day", fail)
+        _wait_for_waiters(single_flight, 1)
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(ValueError):
+                future.result()
+    # the failed call isn't kept
+    assert single_flight.do("day", lambda: "loaded") == "loaded"
@@ -0,0 +1,77 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from conftest import START_TIME, make_points
+from maps.map_descriptor import get_map
+from movie.entity.point_batch import PointBatch
+from movie.entity.visual_settings import DEFAULT_COLOR_MAP
+from movie.repository.memory_track_repository import MemoryTrackRepository
+from movie.sliding_track_window import SlidingTrackWindow
+
+END_TIME = START_TIME + datetime.timedelta(hours=6)
+WINDOW_SECONDS = 3600
+
+
+@pytest.fixture
+def repository():
+    points = make_points(trackers=12, points_per_tracker=300)
+    # the trackers with a gap: their first points are dropped, so they
+    # appear later in the movie than by their ids
+    late = (points.tracker_ids % 4 == 0) & (points.times < START_TIME.timestamp() + 2 * 3600)
+    return MemoryTrackRepository(PointBatch(
+        points.tracker_ids[~late], points.times[~late], points.lats[~late], points.lons[~late]), batch_size=250)
+
+
+def _create_window(repository, tracker_order, chunk_seconds=1000) -> SlidingTrackWindow:
+    return SlidingTrackWindow(
+        repository, get_map("default_map"), DEFAULT_COLOR_MAP, START_TIME, END_TIME,
+        WINDOW_SECONDS, chunk_seconds, tracker_order)
+
+
+@pytest.mark.parametrize("chunk_seconds", [300, 1000, 5000])
+def test_window_has_the_points_of_the_whole_movie_bag(repository, chunk_seconds):
+    whole_bag = repository.stream_tracks(get_map("default_map"), START_TIME, END_TIME)
+    tracker_order, _ = repository.get_tracker_first_times(START_TIME, END_TIME)
+    assert list(tracker_order) == list(whole_bag.track_by_id)
+    window = _create_window(repository, tracker_order, chunk_seconds)
+
+    for minutes in range(0, 6 * 60, 25):
+        frame_time = START_TIME + datetime.timedelta(minutes=minutes)
+        window_start = frame_time.timestamp() - WINDOW_SECONDS
+        bag = window.advance_to(frame_time)
+        # the trackers in the movie's order
+        assert list(bag.track_by_id) == [i for i in whole_bag.track_by_id if i in bag.track_by_id]
+        for tracker_id, whole_track in whole_bag.track_by_id.items():
+            in_window = (whole_track.times >= window_start) & (whole_track.times <= frame_time.timestamp())
+            track = bag.track_by_id.get(tracker_id)
+            if track is None:
+                assert not in_window.any()
+                continue
+            assert track.times.min() >= window_start
+            drawn = track.times <= frame_time.timestamp()
+            np.testing.assert_array_equal(track.times[drawn], whole_track.times[in_window])
+            np.testing.assert_array_equal(track.xs[drawn], whole_track.xs[in_window])
+            np.testing.assert_array_equal(track.ys[drawn], whole_track.ys[in_window])
+
+
+def test_window_memory_is_bounded_by_the_window(repository):
+    tracker_order, _ = repository.get_tracker_first_times(START_TIME, END_TIME)
+    window = _create_window(repository, tracker_order)
+    max_points = 0
+    for minutes in range(0, 6 * 60, 15):
+        window.advance_to(START_TIME + datetime.timedelta(minutes=minutes))
+        max_points = max(max_points, window.points_count)
+    # the window is an hour and a chunk of the 6 hours
+    assert max_points < len(repository.points) / 2
+
+
+def test_trackers_missing_in_the_order_are_ranked_as_they_appear(repository):
+    tracker_order, _ = repository.get_tracker_first_times(START_TIME, END_TIME)
+    known = tracker_order[:5]
+    bag = _create_window(repository, known).advance_to(END_TIME)
+    unknown = [i for i in bag.track_by_id if i not in set(known.tolist())]
+    first_times = [bag.track_by_id[i].times[0] for i in unknown]
+    assert list(bag.track_by_id)[:5] == [i for i in known if i in bag.track_by_id]
+    assert first_times == sorted(first_times)
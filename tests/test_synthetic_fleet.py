@@ -0,0 +1,56 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from benchmark.synthetic_fleet import SyntheticFleet
+from conftest import START_TIME
+from maps.map_descriptor import get_map
+from movie.repository.memory_track_repository import MemoryTrackRepository
+from movie.repository.track_repository import LOADING_MODE_HOURLY
+
+
+def _make_fleet(seed=1) -> SyntheticFleet:
+    return SyntheticFleet(trackers=5, points_per_tracker=2000, start_time=START_TIME, seed=seed)
+
+
+def test_fleet_is_deterministic_for_the_seed():
+    points, same_points, other_points = _make_fleet().generate(), _make_fleet().generate(), _make_fleet(2).generate()
+    for column in ("tracker_ids", "times", "lats", "lons"):
+        np.testing.assert_array_equal(getattr(points, column), getattr(same_points, column))
+    assert not np.array_equal(points.lats, other_points.lats)
+
+
+def test_fleet_points_are_within_its_time_range():
+    fleet = _make_fleet()
+    points = fleet.generate()
+    assert len(points) == 5 * 2000
+    assert points.times.min() >= START_TIME.timestamp()
+    assert points.times.max() < fleet.end_time.timestamp()
+    for tracker_id in np.unique(points.tracker_ids):
+        times = points.times[points.tracker_ids == tracker_id]
+        assert np.all(np.diff(times) >= 0)
+
+
+@pytest.mark.parametrize("batch_size", [1, 700, 100_000])
+def test_memory_repository_loading_modes_give_the_same_tracks(batch_size):
+    fleet = _make_fleet()
+    repository = MemoryTrackRepository(fleet.generate(), batch_size=batch_size)
+    geo_map = get_map("default_map")
+    # a range cutting the fleet's points
+    start = START_TIME + datetime.timedelta(hours=3)
+    end = START_TIME + datetime.timedelta(hours=30)
+
+    streamed = repository.stream_tracks(geo_map, start, end)
+    loaded = repository.load_tracks_parallel(geo_map, start, end, workers=3, shard_hours=2.5)
+    assert len(streamed.tracker_ids) > 0
+    assert list(loaded.track_by_id) == list(streamed.track_by_id)
+    for column in ("tracker_ids", "times", "xs", "ys"):
+        np.testing.assert_array_equal(getattr(loaded, column), getattr(streamed, column))
+    assert streamed.times.min() >= start.timestamp()
+    assert streamed.times.max() < end.timestamp()
+
+
+def test_memory_repository_refuses_the_hourly_mode():
+    with pytest.raises(ValueError):
+        MemoryTrackRepository(_make_fleet().generate(), loading_mode=LOADING_MODE_HOURLY)
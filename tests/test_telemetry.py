@@ -0,0 +1,94 @@
+import logging
+import os
+import pstats
+import threading
+
+import pytest
+
+from movie.telemetry import KeyValueFormatter, Telemetry
+from settings import settings
+
+
+def test_record_collects_only_its_block():
+    telemetry = Telemetry()
+    telemetry.count("frames")
+    with telemetry.record() as outer:
+        telemetry.count("frames", 2)
+        with telemetry.record() as inner:
+            with telemetry.stage("render"):
+                telemetry.count("frames", 3)
+        # counted by another thread of the process
+        thread = threading.Thread(target=telemetry.count, args=("cache.hits",))
+        thread.start()
+        thread.join()
+    telemetry.count("frames", 4)
+
+    assert inner.get_summary()["counters"] == {"frames": 3}
+    assert inner.get_summary()["stages"]["render"]["count"] == 1
+    assert outer.get_summary()["counters"] == {"frames": 5, "cache.hits": 1}
+    assert outer.get_summary()["stages"]["render"]["count"] == 1
+    # the process-wide values only grow
+    assert telemetry.get_summary()["counters"] == {"frames": 10, "cache.hits": 1}
+
+
+def test_records_of_the_runs_start_from_zero():
+    telemetry = Telemetry()
+    for _ in range(2):
+        with telemetry.record() as record:
+            with telemetry.stage("render"):
+                telemetry.count("frames")
+        assert record.get_summary()["counters"] == {"frames": 1}
+        assert record.get_summary()["stages"]["render"]["count"] == 1
+    assert telemetry.get_summary()["stages"]["render"]["count"] == 2
+
+
+def test_metrics_are_rendered_as_prometheus_text():
+    telemetry = Telemetry()
+    telemetry.count("cache.hits", 3)
+    with telemetry.stage("movie.render_frame"):
+        pass
+    text = telemetry.render_prometheus({"cache.memory_bytes": 42})
+
+    assert "# TYPE cargo_cache_hits_total counter\ncargo_cache_hits_total 3\n" in text
+    assert 'cargo_stage_seconds_count{stage="movie.render_frame"} 1\n' in text
+    assert 'cargo_stage_seconds_max{stage="movie.render_frame"}' in text
+    assert "# TYPE cargo_cache_memory_bytes gauge\ncargo_cache_memory_bytes 42\n" in text
+
+
+@pytest.fixture
+def profiled_telemetry(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILE_STAGES", "render, load")
+    monkeypatch.setattr(settings, "PROFILE_PATH", str(tmp_path))
+    return Telemetry()
+
+
+def test_profiles_are_dumped_once(profiled_telemetry, tmp_path):
+    with profiled_telemetry.stage("render"):
+        sum(range(1000))
+    with profiled_telemetry.stage("other"):
+        pass
+    profiled_telemetry.dump_profiles()
+    assert sorted(os.listdir(tmp_path)) == ["render.prof"]
+    assert pstats.Stats(str(tmp_path / "render.prof")).total_calls > 0
+
+    os.remove(tmp_path / "render.prof")
+    profiled_telemetry.dump_profiles()
+    assert os.listdir(tmp_path) == []
+
+
+def test_stage_being_profiled_is_dumped_later(profiled_telemetry, tmp_path):
+    with profiled_telemetry.stage("load"):
+        profiled_telemetry.dump_profiles()
+        assert os.listdir(tmp_path) == []
+        # nested stages aren't profiled
+        with profiled_telemetry.stage("render"):
+            pass
+    profiled_telemetry.dump_profiles()
+    assert os.listdir(tmp_path) == ["load.prof"]
+
+
+def test_log_fields_are_appended_to_the_message():
+    record = logging.LogRecord("movie", logging.INFO, "", 0, "Filming frame", None, None)
+    record.frame = 12
+    record.frames_total = 96
+    assert KeyValueFormatter("%(message)s").format(record) == "Filming frame frame=12 frames_total=96"
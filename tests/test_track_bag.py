@@ -0,0 +1,97 @@
+import datetime
+
+import numpy as np
+import pytz
+
+from movie.entity.track import TrackBag, TrackPoint
+
+
+def _make_columns(points):
+    xs = (points.lons * 100).astype(np.float32)
+    ys = (points.lats * 100).astype(np.float32)
+    return points.tracker_ids, points.times, xs, ys
+
+
+def _assert_same_bags(bag, expected):
+    assert list(bag.track_by_id) == list(expected.track_by_id)
+    for column in ("tracker_ids", "times", "xs", "ys"):
+        np.testing.assert_array_equal(getattr(bag, column), getattr(expected, column))
+
+
+def test_tracks_keep_the_points_as_added_per_tracker(points):
+    tracker_ids, times, xs, ys = _make_columns(points)
+    bag = TrackBag()
+    for begin in range(0, len(times), 333):
+        bag.add_points(tracker_ids[begin:begin + 333], times[begin:begin + 333],
+                       xs[begin:begin + 333], ys[begin:begin + 333])
+
+    # the trackers in their first appearance order, a list of points per tracker
+    expected = {}
+    for tracker_id, time, x, y in zip(tracker_ids.tolist(), times.tolist(), xs.tolist(), ys.tolist()):
+        expected.setdefault(tracker_id, []).append((time, x, y))
+    assert list(bag.track_by_id) == list(expected)
+    for tracker_id, track in bag.track_by_id.items():
+        assert list(zip(track.times.tolist(), track.xs.tolist(), track.ys.tolist())) == expected[tracker_id]
+        begin, end = bag.offsets[tracker_id]
+        assert (bag.tracker_ids[begin:end] == tracker_id).all()
+
+
+def test_merging_into_a_read_bag_equals_adding_all_at_once(points):
+    tracker_ids, times, xs, ys = _make_columns(points)
+    rng = np.random.default_rng(1)
+    # chunks of random sizes, some of them out of the time order
+    bounds = np.sort(rng.choice(np.arange(1, len(times)), 20, replace=False))
+    chunks = [slice(b, e) for b, e in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(times)]]))]
+    chunks[3], chunks[7] = chunks[7], chunks[3]
+
+    incremental, whole = TrackBag(), TrackBag()
+    for chunk in chunks:
+        incremental.add_points(tracker_ids[chunk], times[chunk], xs[chunk], ys[chunk])
+        _ = incremental.points_count
+        whole.add_points(tracker_ids[chunk], times[chunk], xs[chunk], ys[chunk])
+    _assert_same_bags(incremental, whole)
+    assert incremental.content_hash() == whole.content_hash()
+
+
+def test_points_of_the_same_second_keep_the_order_they_were_added():
+    incremental, whole = TrackBag(), TrackBag()
+    for xs in ([1.0, 2.0], [3.0, 4.0], [5.0, 6.0]):
+        for bag in (incremental, whole):
+            bag.add_points(np.array([5, 9]), np.array([100, 100]), np.array(xs), np.array(xs))
+        _ = incremental.points_count
+    _assert_same_bags(incremental, whole)
+    assert incremental.track_by_id[5].xs.tolist() == [1.0, 3.0, 5.0]
+
+
+def test_add_point_is_merged_with_the_batches():
+    start = datetime.datetime(2022, 10, 10, tzinfo=pytz.utc)
+    bag = TrackBag()
+    bag.add_points(np.array([5, 9]), np.array([10, 20]) + int(start.timestamp()),
+                   np.array([1.0, 2.0]), np.array([3.0, 4.0]))
+    bag.add_point(TrackPoint((7.0, 8.0), start + datetime.timedelta(seconds=30)), 5)
+
+    track = bag.track_by_id[5]
+    assert [p.track_time for p in track.points] == [
+        start + datetime.timedelta(seconds=10), start + datetime.timedelta(seconds=30)]
+    assert [p.canvas_coords for p in track.points] == [(1.0, 3.0), (7.0, 8.0)]
+    assert list(bag.track_by_id) == [5, 9]
+
+
+def test_select_time_range_is_the_bag_of_the_range(points):
+    tracker_ids, times, xs, ys = _make_columns(points)
+    bag = TrackBag()
+    bag.add_points(tracker_ids, times, xs, ys)
+    start, end = int(times[100]), int(times[-100])
+
+    selected = (times >= start) & (times < end)
+    expected = TrackBag()
+    expected.add_points(tracker_ids[selected], times[selected], xs[selected], ys[selected])
+    _assert_same_bags(bag.select_time_range(start, end), expected)
+
+
+def test_save_and_load(points, tmp_path):
+    bag = TrackBag()
+    bag.add_points(*_make_columns(points))
+    file_path = str(tmp_path / "tracks.npz")
+    bag.save(file_path)
+    _assert_same_bags(TrackBag.load(file_path), bag)
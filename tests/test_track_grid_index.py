@@ -0,0 +1,90 @@
+from typing import List, Tuple
+
+import pytest
+
+from conftest import make_points, make_track_data
+from movie.track_grid_index import TrackGridIndex
+
+# the points are around x 430..1430, y 490..650
+BBOXES = [
+    (500, 550, 900, 600),
+    (0, 0, 10_000, 10_000),
+    (-50, -50, 470, 520),
+    (1000.5, 0, 1000.5, 1000),
+    (600, 560, 601, 561),
+    (5_000, 5_000, 6_000, 6_000),
+]
+
+
+def _parse_lines(tracks_data: str) -> List[Tuple[int, List[List[Tuple[int, int, int]]]]]:
+    """
+    (track id, the lines of (minute, x, y) separated by the leap markers) per track
+    """
+    tracks = []
+    for track_str in tracks_data.split("#")[:-1]:
+        values = [int(v) for v in track_str[:-1].split(",")]
+        lines, minute = [[]], 0
+        for time_delta, x, y in zip(values[1::3], values[2::3], values[3::3]):
+            minute += time_delta
+            if x == 0 and y == 0:
+                lines.append([])
+            else:
+                lines[-1].append((minute, x, y))
+        tracks.append((values[0], lines))
+    return tracks
+
+
+def _serialize_bbox_reference(tracks_data: str, bbox) -> str:
+    x_min, y_min, x_max, y_max = bbox
+    chunks = []
+    for track_id, lines in _parse_lines(tracks_data):
+        parts = []
+        for line in lines:
+            inside = [x_min <= x <= x_max and y_min <= y <= y_max for _, x, y in line]
+            selected = [any(inside[max(0, i - 1):i + 2]) for i in range(len(line))]
+            part = None
+            for point, is_selected in zip(line, selected):
+                if not is_selected:
+                    part = None
+                    continue
+                if part is None:
+                    part = []
+                    parts.append(part)
+                part.append(point)
+        if not parts:
+            continue
+        values, previous_minute = [track_id], 0
+        for part_index, part in enumerate(parts):
+            if part_index:
+                values += [0, 0, 0]
+            for minute, x, y in part:
+                values += [minute - previous_minute, x, y]
+                previous_minute = minute
+        chunks.append(",".join(str(v) for v in values) + ",#")
+    return "".join(chunks)
+
+
+@pytest.fixture(scope="module")
+def tracks_data():
+    data = make_track_data(make_points(trackers=8, points_per_tracker=400))
+    # the leap markers are in
+    assert any(line for _, lines in _parse_lines(data) if len(lines) > 1 for line in lines)
+    return data
+
+
+@pytest.mark.parametrize("cell_size_px", [1, 32, 500])
+@pytest.mark.parametrize("bbox", BBOXES)
+def test_bbox_query_equals_the_brute_force_filter(tracks_data, cell_size_px, bbox):
+    index = TrackGridIndex(tracks_data, cell_size_px)
+    assert "".join(index.iter_serialize_bbox(bbox)) == _serialize_bbox_reference(tracks_data, bbox)
+
+
+def test_bbox_over_the_whole_canvas_keeps_the_tracks(tracks_data):
+    index = TrackGridIndex(tracks_data, 32)
+    bbox = (0, 0, 10_000, 10_000)
+    # the markers carry no time delta, the points get the same times
+    assert _parse_lines("".join(index.iter_serialize_bbox(bbox))) == _parse_lines(tracks_data)
+
+
+def test_empty_data_has_no_tracks():
+    assert list(TrackGridIndex("", 32).iter_serialize_bbox((0, 0, 100, 100))) == []
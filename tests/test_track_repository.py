@@ -0,0 +1,79 @@
+import datetime
+
+import numpy as np
+from sqlalchemy.dialects import postgresql
+
+from conftest import START_TIME, make_points
+from maps.map_descriptor import get_map
+from movie.entity.point_batch import PointBatch
+from movie.entity.track import TrackBag
+from movie.repository.track_repository import TrackRepository
+
+END_TIME = START_TIME + datetime.timedelta(hours=6)
+
+
+def _compile(query) -> str:
+    return " ".join(str(query.compile(dialect=postgresql.dialect())).split())
+
+
+def test_points_query_extracts_the_coordinates_in_the_db():
+    sql = _compile(TrackRepository._get_points_query(START_TIME, END_TIME))
+    assert sql.startswith(
+        "SELECT tracking_trackedgeolocation.tracker_id, "
+        "CAST(floor(EXTRACT(epoch FROM tracking_trackedgeolocation.time)) AS BIGINT)")
+    assert "ST_Y(tracking_trackedgeolocation.coordinates)" in sql
+    assert "ST_X(tracking_trackedgeolocation.coordinates)" in sql
+    assert "WHERE tracking_trackedgeolocation.time >= %(time_1)s " \
+           "AND tracking_trackedgeolocation.time < %(time_2)s ORDER BY" in sql
+    # the index on the time column serves the order
+    assert sql.endswith(
+        "ORDER BY tracking_trackedgeolocation.time, "
+        "tracking_trackedgeolocation.tracker_id, tracking_trackedgeolocation.id")
+
+
+def test_first_times_query_groups_by_the_tracker():
+    sql = _compile(TrackRepository._get_first_times_query(START_TIME, END_TIME))
+    assert "CAST(min(floor(EXTRACT(epoch FROM tracking_trackedgeolocation.time))) AS BIGINT)" in sql
+    assert sql.endswith("GROUP BY tracking_trackedgeolocation.tracker_id")
+
+
+def test_first_times_are_ordered_as_the_points():
+    tracker_ids, first_times = TrackRepository.order_first_times(
+        np.array([7, 3, 5, 3, 9]), np.array([20, 30, 10, 10, 10]))
+    assert tracker_ids.tolist() == [3, 5, 9, 7]
+    assert first_times.tolist() == [10, 10, 10, 20]
+
+
+def _fetch(points: PointBatch, batch_size: int):
+    """
+    the points in batches as the query returns them: ordered by the exact time,
+    which orders the trackers of the same second arbitrarily
+    """
+    exact_times = points.times + np.random.default_rng(3).random(len(points))
+    order = np.argsort(exact_times)
+    return [PointBatch(points.tracker_ids[part], points.times[part], points.lats[part], points.lons[part])
+            for part in np.array_split(order, range(batch_size, len(order), batch_size))]
+
+
+def _stream(batches) -> TrackBag:
+    tracks = TrackBag()
+    for batch in batches:
+        TrackRepository.add_batch(tracks, get_map("square_map"), batch)
+    return tracks
+
+
+def test_trackers_of_the_same_second_are_ordered_by_the_id():
+    # a minute: the trackers share the seconds
+    points = make_points(trackers=12, points_per_tracker=50, seconds=60)
+    expected = _stream(TrackRepository._iter_whole_seconds(iter(_fetch(points, len(points)))))
+    tracker_order, _ = TrackRepository.order_first_times(points.tracker_ids, points.times)
+    assert list(expected.track_by_id) == tracker_order.tolist()
+
+    for batch_size in (1, 7, 50):
+        batches = list(TrackRepository._iter_whole_seconds(iter(_fetch(points, batch_size))))
+        # a second is never split between the batches
+        assert all(a.times[-1] < b.times[0] for a, b in zip(batches, batches[1:]))
+        tracks = _stream(batches)
+        assert list(tracks.track_by_id) == list(expected.track_by_id)
+        for column in ("tracker_ids", "times", "xs", "ys"):
+            np.testing.assert_array_equal(getattr(tracks, column), getattr(expected, column))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from conftest import make_points, make_track_bag
+from maps.map_descriptor import get_map
+from movie.entity.visual_settings import RenderSettings
+from movie.track_simplifier import TrackSimplifier
+
+
+@pytest.fixture
+def dense_bag():
+    # many points per pixel and a few leaps
+    return make_track_bag(make_points(trackers=6, points_per_tracker=3000), "default_map")
+
+
+def _get_distances_to_segments(xs, ys, begin_xs, begin_ys, end_xs, end_ys):
+    dx, dy = end_xs - begin_xs, end_ys - begin_ys
+    px, py = xs - begin_xs, ys - begin_ys
+    segment_square = dx * dx + dy * dy
+    t = np.clip(np.divide(px * dx + py * dy, segment_square, out=np.zeros_like(px), where=segment_square > 0), 0, 1)
+    return np.hypot(px - t * dx, py - t * dy)
+
+
+@pytest.mark.parametrize("tolerance_px", [0.5, 2.0])
+def test_removed_points_are_within_the_tolerance(dense_bag, tolerance_px):
+    geo_map = get_map("default_map")
+    simplifier = TrackSimplifier(geo_map, tolerance_px)
+    removed_count = 0
+    for track in dense_bag.track_by_id.values():
+        keep = simplifier.get_kept_points_mask(track)
+        assert keep[0] and keep[-1]
+        removed_count += len(keep) - np.count_nonzero(keep)
+
+        xs, ys = track.xs.astype(np.float64), track.ys.astype(np.float64)
+        kept = np.flatnonzero(keep)
+        removed = np.flatnonzero(~keep)
+        # the kept points around each removed point
+        after = kept[np.searchsorted(kept, removed)]
+        before = kept[np.searchsorted(kept, removed) - 1]
+        distances = _get_distances_to_segments(
+            xs[removed], ys[removed], xs[before], ys[before], xs[after], ys[after])
+        # the points removed by Douglas-Peucker are within the tolerance from
+        # the line, the inner points of the same pixel runs within a pixel more
+        in_pixel_run = ~simplifier._get_pixel_run_ends_mask(track.integer_xy_coords)[removed]
+        assert np.all(distances[~in_pixel_run] <= tolerance_px + 1e-6)
+        assert np.all(distances[in_pixel_run] <= tolerance_px + np.sqrt(2))
+    assert removed_count > 0
+
+
+def test_simplified_tracks_keep_the_leaps_and_the_times(dense_bag):
+    geo_map = get_map("default_map")
+    simplified, removed_by_track = TrackSimplifier(geo_map, 0.5).simplify(dense_bag)
+    assert list(simplified.track_by_id) == list(dense_bag.track_by_id)
+    assert simplified.points_count == dense_bag.points_count - sum(removed_by_track.values())
+    for track_id, track in dense_bag.track_by_id.items():
+        simplified_track = simplified.track_by_id[track_id]
+        assert np.isin(simplified_track.times, track.times).all()
+        assert simplified_track.times[0] == track.times[0] and simplified_track.times[-1] == track.times[-1]
+        assert len(geo_map.leap_indices(simplified_track.integer_xy_coords)) == \
+            len(geo_map.leap_indices(track.integer_xy_coords))
+
+
+def test_movies_arent_simplified_by_default():
+    assert RenderSettings().simplify_tolerance_px is None